@@ -1,72 +1,436 @@
-import torch
-from transformers import AutoTokenizer, AutoModelForSequenceClassification
+import os
+import numpy as np
 import logging
-from typing import Dict
-from utils.helpers import load_config
+from typing import Dict, Iterator, List, Tuple
+from utils.helpers import load_config, tokenize
+from utils.score_cache import ScoreCache, model_fingerprint, normalize_interests
+from utils.lazy import LazyResource
+from utils.model_registry import MicroBatcher, registry
+from utils.metrics import metrics
 
 logger = logging.getLogger(__name__)
 
 class AnalysisAgent:
     def __init__(self, model_path: str):
         self.config = load_config()
+        self.batch_size = self.config['agent'].get('analysis_batch_size', 16)
+        self.bulk_batch_size = self.config['agent'].get('bulk_analysis_batch_size', 64)
+        self.max_length = 256
         
+        # Cascade re-ranking: only the uncertain candidates go through the cross-encoder
+        self.cascade = self.config['agent'].get('cascade', False)
+        # At least one paper sets the cutoff for the uncertainty band
+        self.cascade_top_n = max(1, int(self.config['agent'].get('cascade_top_n', 10)))
+        self.cascade_band = self.config['agent'].get('cascade_band', 0.05)
+        self.cascade_max_pairs = self.config['agent'].get('cascade_max_pairs', 20)
+        self.cascade_dense_weight = self.config['agent'].get('cascade_dense_weight', 0.7)
+        
+        self.model_path = model_path
+        self.tokenizer = None
+        self.model = None
+        self.onnx_session = None
+        self.onnx_path = None
+        self.score_cache = None
+        self.batcher = None
+        
+        # One copy of the model per process, shared by every AnalysisAgent; torch/transformers
+        # are imported and the model loaded on first use (or by warm_up)
+        backend = self.config['models'].get('analysis_backend', 'pytorch')
+        self._models = registry.get(
+            f"relevance_model:{backend}:{model_path}",
+            lambda: LazyResource("relevance_model", self._load_models)
+        )
+        self._ready = LazyResource("relevance_scorer", self._attach_models)
+    
+    def warm_up(self):
+        """Load the relevance model now instead of on the first analysis"""
+        self._ready.load()
+    
+    def is_ready(self) -> bool:
+        """True once the scorer is set up, on the fine-tuned model or the search-score fallback"""
+        return self._ready.ok
+    
+    def _load_models(self) -> Dict:
+        """Load the tokenizer and the model (ONNX or PyTorch)"""
+        models = {"tokenizer": None, "model": None, "onnx_session": None, "onnx_path": None}
         try:
-            self.tokenizer = AutoTokenizer.from_pretrained(model_path)
-            self.model = AutoModelForSequenceClassification.from_pretrained(
-                model_path,
-                num_labels=1,  # Ensure single output for regression
-                problem_type="regression"
-            )
-            self.model.eval()
-            logger.info("Loaded fine-tuned relevance model")
+            from transformers import AutoTokenizer, AutoModelForSequenceClassification
+            
+            models["tokenizer"] = AutoTokenizer.from_pretrained(self.model_path)
+            
+            if self.config['models'].get('analysis_backend', 'pytorch') == 'onnx':
+                models["onnx_session"], models["onnx_path"] = self._load_onnx_session()
+            
+            if models["onnx_session"] is None:
+                model = AutoModelForSequenceClassification.from_pretrained(
+                    self.model_path,
+                    num_labels=1,  # Ensure single output for regression
+                    problem_type="regression"
+                )
+                model.eval()
+                models["model"] = model
+                logger.info("Loaded fine-tuned relevance model")
         except Exception as e:
             logger.warning(f"Could not load fine-tuned model: {e}. Using fallback scoring.")
-            self.model = None
+            models["model"] = None
+        return models
+    
+    def _attach_models(self) -> bool:
+        """Point this agent at the shared model, its inference batcher and the score cache"""
+        models = self._models.load()
+        self.tokenizer = models["tokenizer"]
+        self.model = models["model"]
+        self.onnx_session = models["onnx_session"]
+        self.onnx_path = models["onnx_path"]
+        if self.model is None and self.onnx_session is None:
+            return False
+        
+        if self.config['agent'].get('micro_batching', True):
+            # Pairs from concurrent requests are scored together on one inference thread,
+            # in forward passes as large as the merged batch
+            micro_batch_size = self.config['agent'].get('analysis_micro_batch_size', 64)
+            self.batcher = registry.get(
+                f"relevance_batcher:{self.onnx_path or self.model_path}",
+                lambda: MicroBatcher(
+                    "relevance",
+                    lambda texts: self._score_texts(texts, batch_size=micro_batch_size),
+                    max_batch_size=micro_batch_size,
+                    max_wait_ms=self.config['agent'].get('micro_batch_wait_ms', 5)
+                )
+            )
+        
+        if self.config['agent'].get('score_cache', True):
+            self.score_cache = self._create_score_cache(self.model_path)
+        return True
+    
+    def _create_score_cache(self, model_path: str):
+        """Open the persistent score cache, keyed to the currently loaded model"""
+        try:
+            artifacts = [model_path]
+            if self.onnx_session is not None:
+                artifacts.append(self.onnx_path)
+            
+            return ScoreCache(
+                self.config['paths'].get('score_cache', "data/cache/relevance_scores.db"),
+                model_fingerprint(*artifacts),
+                memory_size=self.config['agent'].get('score_cache_memory_size', 10000),
+                disk_size=self.config['agent'].get('score_cache_disk_size', 200000)
+            )
+        except Exception as e:
+            logger.warning(f"Could not open score cache: {e}. Scoring without cache.")
+            return None
+    
+    def _load_onnx_session(self):
+        """Open the quantized ONNX graph; returns (session, path), or (None, None) to fall back to PyTorch"""
+        models_dir = self.config['paths']['models_dir']
+        onnx_path = self.config['paths'].get('onnx_model', os.path.join(models_dir, "relevance_model.int8.onnx"))
+        if not os.path.exists(onnx_path):
+            logger.warning(f"ONNX model not found at {onnx_path}. Falling back to PyTorch backend.")
+            return None, None
+        
+        try:
+            import onnxruntime as ort
+            
+            session = ort.InferenceSession(onnx_path, providers=["CPUExecutionProvider"])
+            logger.info(f"Loaded quantized ONNX relevance model from {onnx_path}")
+            return session, onnx_path
+        except Exception as e:
+            logger.warning(f"Could not load ONNX model: {e}. Falling back to PyTorch backend.")
+            return None, None
     
     def analyze_relevance(self, user_interests: str, paper: Dict) -> Dict:
         """Analyze relevance of paper to user interests"""
-        if self.model is None:
-            # Fallback: use search score
-            return {
-                "paper": paper,
-                "relevance_score": paper.get('search_score', 0.5),
-                "justification": "Using search similarity score (fine-tuned model not available)"
-            }
+        return self.analyze_batch(user_interests, [paper])[0]
+    
+    def analyze_batch(self, user_interests: str, papers: List[Dict]) -> List[Dict]:
+        """Analyze relevance of many papers, scoring them in length-bucketed micro-batches"""
+        results = [None] * len(papers)
+        for indices, analyses in self._iter_analyses(user_interests, papers):
+            for i, analysis in zip(indices, analyses):
+                results[i] = analysis
+        return results
+    
+    def analyze_stream(self, user_interests: str, papers: List[Dict]) -> Iterator[List[Dict]]:
+        """Like analyze_batch, but yield each micro-batch of analyses as soon as it is scored"""
+        for _, analyses in self._iter_analyses(user_interests, papers):
+            yield analyses
+    
+    def analyze_many(self, requests: List[Tuple[str, List[Dict]]], batch_size: int = None) -> List[List[Dict]]:
+        """
+        Analyze several (interests, papers) requests at once. Pairs from every
+        request share one cache lookup and are cross-encoded together in large
+        length-sorted batches, so short and long inputs from different users
+        pack without padding waste.
+        """
+        self.warm_up()
+        if self.model is None and self.onnx_session is None:
+            return [[
+                self._fallback_analysis(paper, "Using search similarity score (fine-tuned model not available)")
+                for paper in papers
+            ] for _, papers in requests]
         
+        results = [[None] * len(papers) for _, papers in requests]
         try:
-            # Prepare input text
-            text = f"Interests: {user_interests} Paper: {paper['title']} {paper['abstract'][:400]}"
+            # Papers each request sends to the cross-encoder (all of them unless the cascade is on)
+            selections = []
+            for user_interests, papers in requests:
+                if self.cascade and papers:
+                    selections.append(self._cascade_select(user_interests, papers))
+                else:
+                    selections.append((list(range(len(papers))), None))
             
-            # Tokenize
-            inputs = self.tokenizer(
-                text,
-                padding=True,
-                truncation=True,
-                max_length=256,
-                return_tensors="pt"
-            )
+            # Identical (interests, paper) pairs across requests are scored once
+            pairs = {}
+            for (user_interests, papers), (selected, _) in zip(requests, selections):
+                for i in selected:
+                    pairs.setdefault((normalize_interests(user_interests), papers[i]['id']), (user_interests, papers[i]))
             
-            # Predict
-            with torch.no_grad():
-                outputs = self.model(**inputs)
-                relevance_score = torch.sigmoid(outputs.logits).item()
+            scores = {}
+            keys = {pair: self.score_cache.make_key(*pair) for pair in pairs} if self.score_cache is not None else {}
+            if keys:
+                cached = self.score_cache.get_many(list(keys.values()))
+                scores = {pair: cached[key] for pair, key in keys.items() if key in cached}
             
-            # Generate simple justification
-            justification = self._generate_justification(user_interests, paper, relevance_score)
+            misses = [pair for pair in pairs if pair not in scores]
+            logger.info(f"Bulk analysis: {len(pairs)} unique pairs from {len(requests)} requests, "
+                        f"{len(pairs) - len(misses)} cached")
+            metrics.count("score_cache", "hits", len(pairs) - len(misses))
+            metrics.count("score_cache", "misses", len(misses))
+            if misses:
+                texts = [self._build_input(*pairs[pair]) for pair in misses]
+                bulk_batch_size = batch_size or self.bulk_batch_size
+                if self.batcher is not None:
+                    # One length-sorted pass, run on the inference thread so it never overlaps the batcher's work
+                    bulk_scores = self.batcher.run(lambda: self._score_texts(texts, bulk_batch_size))
+                else:
+                    bulk_scores = self._score_texts(texts, bulk_batch_size)
+                scores.update(zip(misses, bulk_scores))
+                if keys:
+                    self.score_cache.put_many({keys[pair]: scores[pair] for pair in misses})
             
-            return {
-                "paper": paper,
-                "relevance_score": relevance_score,
-                "justification": justification
-            }
+            for r, ((user_interests, papers), (selected, cheap_scores)) in enumerate(zip(requests, selections)):
+                normalized = normalize_interests(user_interests)
+                cross_scores = {i: scores[(normalized, papers[i]['id'])] for i in selected}
+                for i, score in cross_scores.items():
+                    results[r][i] = self._build_analysis(user_interests, papers[i], score)
+                
+                # Cascade: papers left out of cross-encoding keep calibrated cheap scores
+                if len(cross_scores) < len(papers):
+                    calibrate = self._fit_calibration(cheap_scores, cross_scores)
+                    for i in range(len(papers)):
+                        if i not in cross_scores:
+                            results[r][i] = self._build_analysis(user_interests, papers[i], calibrate(cheap_scores[i]))
+                            results[r][i]["cascade_stage"] = "cheap"
+        
+        except Exception as e:
+            logger.error(f"Error in bulk analysis: {e}")
+            for (_, papers), analyses in zip(requests, results):
+                for i, analysis in enumerate(analyses):
+                    if analysis is None:
+                        analyses[i] = self._fallback_analysis(papers[i], "Error in analysis, using fallback score")
+        return results
+    
+    def _iter_analyses(self, user_interests: str, papers: List[Dict]) -> Iterator[Tuple[List[int], List[Dict]]]:
+        """Yield (paper indices, analyses) per micro-batch, cache hits first"""
+        if not papers:
+            return
+        
+        self.warm_up()
+        if self.model is None and self.onnx_session is None:
+            # Fallback: use search score
+            yield list(range(len(papers))), [
+                self._fallback_analysis(paper, "Using search similarity score (fine-tuned model not available)")
+                for paper in papers
+            ]
+            return
+        
+        pending = set(range(len(papers)))
+        try:
+            if self.cascade:
+                selected, cheap_scores = self._cascade_select(user_interests, papers)
+            else:
+                selected, cheap_scores = list(range(len(papers))), None
+            
+            cross_scores = {}
+            selected_papers = [papers[i] for i in selected]
+            for batch, scores in self._iter_cached_scores(user_interests, selected_papers):
+                indices = [selected[j] for j in batch]
+                pending.difference_update(indices)
+                cross_scores.update(zip(indices, scores))
+                yield indices, [
+                    self._build_analysis(user_interests, papers[i], score)
+                    for i, score in zip(indices, scores)
+                ]
+            
+            # Cascade: papers left out of cross-encoding keep calibrated cheap scores
+            remaining = sorted(pending)
+            if remaining:
+                calibrate = self._fit_calibration(cheap_scores, cross_scores)
+                analyses = []
+                for i in remaining:
+                    analysis = self._build_analysis(user_interests, papers[i], calibrate(cheap_scores[i]))
+                    analysis["cascade_stage"] = "cheap"
+                    analyses.append(analysis)
+                pending.clear()
+                yield remaining, analyses
             
         except Exception as e:
             logger.error(f"Error in analysis: {e}")
-            return {
-                "paper": paper,
-                "relevance_score": paper.get('search_score', 0.5),
-                "justification": "Error in analysis, using fallback score"
-            }
+            remaining = sorted(pending)
+            yield remaining, [
+                self._fallback_analysis(papers[i], "Error in analysis, using fallback score") for i in remaining
+            ]
+    
+    def _build_analysis(self, user_interests: str, paper: Dict, score: float) -> Dict:
+        return {
+            "paper": paper,
+            "relevance_score": score,
+            "justification": self._generate_justification(user_interests, paper, score)
+        }
+    
+    def _cheap_scores(self, user_interests: str, papers: List[Dict]) -> List[float]:
+        """Cheap first-stage scores: bi-encoder similarity blended with lexical overlap"""
+        query_terms = set(tokenize(user_interests))
+        scores = []
+        for paper in papers:
+            # search_score is 1 - squared L2 between unit vectors, in [-3, 1]; (s + 1) / 2 is the
+            # cosine, in [-1, 1], mapped to [0, 1] to blend with the overlap fraction
+            cosine = (paper.get('search_score', 0.0) + 1) / 2
+            dense = (cosine + 1) / 2
+            paper_terms = set(tokenize(f"{paper['title']} {paper['abstract']}"))
+            overlap = len(query_terms & paper_terms) / len(query_terms) if query_terms else 0.0
+            scores.append(self.cascade_dense_weight * dense + (1 - self.cascade_dense_weight) * overlap)
+        return scores
+    
+    def _cascade_select(self, user_interests: str, papers: List[Dict]) -> Tuple[List[int], List[float]]:
+        """Pick the papers worth a cross-encoder pass: the cheap top-N plus those near its cutoff"""
+        cheap = self._cheap_scores(user_interests, papers)
+        order = sorted(range(len(papers)), key=lambda i: cheap[i], reverse=True)
+        
+        top = order[:self.cascade_top_n]
+        selected = list(top)
+        if len(order) > len(top):
+            # Uncertainty band: just below the top-N cutoff, where the cheap ranking may be wrong
+            cutoff = cheap[top[-1]]
+            selected += [i for i in order[len(top):] if cutoff - cheap[i] <= self.cascade_band]
+        
+        selected = selected[:self.cascade_max_pairs]
+        logger.info(f"Cascade: cross-encoding {len(selected)} of {len(papers)} candidates")
+        return selected, cheap
+    
+    def _fit_calibration(self, cheap: List[float], cross: Dict[int, float]):
+        """Fit a linear map from cheap to cross-encoder scores on the papers that got both"""
+        slope, intercept = 1.0, 0.0
+        if len(cross) >= 3:
+            x = np.array([cheap[i] for i in cross])
+            y = np.array(list(cross.values()))
+            if x.var() > 1e-9:
+                slope, intercept = np.polyfit(x, y, 1)
+        # Cheap-only papers ranked below every cross-encoded one never overtake them
+        ceiling = min(cross.values()) if cross else 1.0
+        return lambda score: float(min(max(slope * score + intercept, 0.0), ceiling))
+    
+    def _build_input(self, user_interests: str, paper: Dict) -> str:
+        """Build the cross-encoder input text (same format as fine-tuning)"""
+        return f"Interests: {user_interests} Paper: {paper['title']} {paper['abstract'][:400]}"
+    
+    def _iter_cached_scores(self, user_interests: str, papers: List[Dict]) -> Iterator[Tuple[List[int], List[float]]]:
+        """Yield cached scores first, then run the model only for pairs missing from the cache"""
+        if self.score_cache is None:
+            yield from self._iter_scores(user_interests, papers)
+            return
+        
+        keys = [self.score_cache.make_key(user_interests, paper['id']) for paper in papers]
+        cached = self.score_cache.get_many(keys)
+        
+        hits = [i for i, key in enumerate(keys) if key in cached]
+        misses = [i for i, key in enumerate(keys) if key not in cached]
+        logger.info(f"Score cache: {len(hits)} hits, {len(misses)} misses")
+        metrics.count("score_cache", "hits", len(hits))
+        metrics.count("score_cache", "misses", len(misses))
+        
+        if hits:
+            yield hits, [cached[keys[i]] for i in hits]
+        
+        if misses:
+            for batch, scores in self._iter_scores(user_interests, [papers[i] for i in misses]):
+                indices = [misses[j] for j in batch]
+                self.score_cache.put_many({keys[i]: score for i, score in zip(indices, scores)})
+                yield indices, scores
+    
+    def _score_pairs(self, user_interests: str, papers: List[Dict]) -> List[float]:
+        """Score (interests, paper) pairs with the relevance model"""
+        scores = [0.0] * len(papers)
+        for indices, batch_scores in self._iter_scores(user_interests, papers):
+            for i, score in zip(indices, batch_scores):
+                scores[i] = score
+        return scores
+    
+    def _iter_scores(self, user_interests: str, papers: List[Dict]) -> Iterator[Tuple[List[int], List[float]]]:
+        """Yield (paper indices, scores) for each micro-batch"""
+        texts = [self._build_input(user_interests, paper) for paper in papers]
+        
+        if self.batcher is not None:
+            # Queue every chunk up front so other requests' pairs can join the same model batches
+            chunks = [list(range(start, min(start + self.batch_size, len(texts))))
+                      for start in range(0, len(texts), self.batch_size)]
+            futures = [self.batcher.submit([texts[i] for i in chunk]) for chunk in chunks]
+            for chunk, future in zip(chunks, futures):
+                yield chunk, list(future.result())
+            return
+        
+        yield from self._iter_text_scores(texts)
+    
+    def _score_texts(self, texts: List[str], batch_size: int = None) -> List[float]:
+        """Score model input texts, returning scores in input order"""
+        scores = [0.0] * len(texts)
+        for indices, batch_scores in self._iter_text_scores(texts, batch_size):
+            for i, score in zip(indices, batch_scores):
+                scores[i] = score
+        return scores
+    
+    def _iter_text_scores(self, texts: List[str], batch_size: int = None) -> Iterator[Tuple[List[int], List[float]]]:
+        """Yield (text indices, scores) for each length-bucketed micro-batch"""
+        # Tokenize everything once without padding, then pad each micro-batch
+        # only up to its own longest sequence
+        encodings = self.tokenizer(texts, truncation=True, max_length=self.max_length)
+        lengths = [len(ids) for ids in encodings['input_ids']]
+        
+        # Sort by length so each micro-batch holds similarly sized pairs
+        order = sorted(range(len(texts)), key=lambda i: lengths[i])
+        
+        batch_size = batch_size or self.batch_size
+        for start in range(0, len(order), batch_size):
+            bucket = order[start:start + batch_size]
+            features = [{key: encodings[key][i] for key in encodings.keys()} for i in bucket]
+            
+            with metrics.span("cross_encoder", batch_size=len(bucket), tokens=sum(lengths[i] for i in bucket)):
+                if self.onnx_session is not None:
+                    batch_scores = self._run_onnx(features)
+                else:
+                    import torch
+                    
+                    with torch.inference_mode():
+                        inputs = self.tokenizer.pad(features, padding=True, return_tensors="pt")
+                        outputs = self.model(**inputs)
+                        batch_scores = torch.sigmoid(outputs.logits).view(-1).tolist()
+            
+            yield bucket, batch_scores
+    
+    def _run_onnx(self, features: List[Dict]) -> List[float]:
+        """Score one padded micro-batch with ONNX Runtime"""
+        inputs = self.tokenizer.pad(features, padding=True, return_tensors="np")
+        feed = {i.name: inputs[i.name].astype(np.int64) for i in self.onnx_session.get_inputs()}
+        logits = self.onnx_session.run(None, feed)[0]
+        return (1 / (1 + np.exp(-logits))).reshape(-1).tolist()
+    
+    def _fallback_analysis(self, paper: Dict, justification: str) -> Dict:
+        """Analysis result that reuses the search similarity score"""
+        return {
+            "paper": paper,
+            "relevance_score": paper.get('search_score', 0.5),
+            "justification": justification
+        }
     
     def _generate_justification(self, interests: str, paper: Dict, score: float) -> str:
         """Generate a simple justification for the relevance score"""
@@ -75,4 +439,4 @@ class AnalysisAgent:
         elif score > 0.5:
             return f"Moderately relevant. Paper touches on aspects of {interests.split()[0]}"
         else:
-            return "Limited relevance to your specific interests"
\ No newline at end of file
+            return "Limited relevance to your specific interests"
@@ -1,7 +1,11 @@
+import re
+import json
+import time
 import logging
-from typing import List, Dict
+from typing import Iterator, List, Dict
 from utils.helpers import load_config
-from utils.hf_client import HuggingFaceClient
+from utils.hf_client import AsyncHuggingFaceClient
+from utils.metrics import metrics
 
 logger = logging.getLogger(__name__)
 
@@ -9,22 +13,28 @@ class JustificationAgent:
     def __init__(self, model_name: str = None):
         self.config = load_config()
         self.model_name = model_name or self.config['models']['justification']
-        self.client = HuggingFaceClient()
+        self.justification_count = self.config['agent'].get('justification_count', 3)
+        self.justification_deadline = self.config['agent'].get('justification_timeout', 30)
+        self.client = AsyncHuggingFaceClient(
+            max_concurrency=self.config['agent'].get('justification_concurrency', 4),
+            timeout=self.justification_deadline
+        )
+        
+        # "batched" justifies the top papers with one structured-output call instead of one call each
+        self.mode = self.config['agent'].get('justification_mode', 'per_paper')
+        self.batched_count = self.config['agent'].get('batched_justification_count', 10)
+        self.abstract_token_budget = self.config['agent'].get('justification_abstract_tokens', 1500)
+        self.tokens_per_justification = self.config['agent'].get('justification_tokens_per_paper', 90)
+        self.justification_retries = self.config['agent'].get('justification_retries', 1)
     
     def format_recommendations(self, user_query: str, analyzed_papers: List[Dict]) -> str:
         """Format recommendations with detailed justifications"""
         try:
-            # Sort by relevance score
-            sorted_papers = sorted(analyzed_papers, key=lambda x: x["relevance_score"], reverse=True)
-            
-            # Take top papers
-            top_papers = sorted_papers[:10]
+            top_papers = self.select_top_papers(analyzed_papers)
             
-            # Generate detailed justifications for top papers
-            for i, paper in enumerate(top_papers[:3]):  # Limit to 3 to save API calls
-                if paper["relevance_score"] > 0.5:
-                    detailed_justification = self._generate_detailed_justification(user_query, paper)
-                    paper["detailed_justification"] = detailed_justification
+            # Generate detailed justifications for top papers concurrently
+            for _ in self.iter_detailed_justifications(user_query, top_papers):
+                pass
             
             return self._create_output_format(user_query, top_papers)
             
@@ -32,8 +42,119 @@ class JustificationAgent:
             logger.error(f"Error in justification: {e}")
             return self._create_fallback_output(analyzed_papers)
     
+    def select_top_papers(self, analyzed_papers: List[Dict]) -> List[Dict]:
+        """Sort by relevance score and take the top papers"""
+        sorted_papers = sorted(analyzed_papers, key=lambda x: x["relevance_score"], reverse=True)
+        return sorted_papers[:10]
+    
+    def iter_detailed_justifications(self, user_query: str, top_papers: List[Dict]) -> Iterator[Dict]:
+        """Fill in detailed justifications concurrently, yielding each paper as its call finishes"""
+        if self.mode == 'batched':
+            yield from self._iter_batched_justifications(user_query, top_papers)
+            return
+        
+        selected = [p for p in top_papers[:self.justification_count] if p["relevance_score"] > 0.5]
+        requests = [self._build_request(user_query, paper) for paper in selected]
+        
+        for i, response in self.client.chat_completion_iter(requests):
+            paper = selected[i]
+            paper["detailed_justification"] = response.strip() if response else paper["justification"]
+            yield paper
+    
+    def _iter_batched_justifications(self, user_query: str, top_papers: List[Dict]) -> Iterator[Dict]:
+        """
+        Justify the top papers with one JSON-output call, re-asking only for
+        the papers whose entries were missing or unparseable. Papers still
+        missing at the end keep their short justification.
+        """
+        selected = {p["paper"]["id"]: p for p in top_papers[:self.batched_count] if p["relevance_score"] > 0.5}
+        deadline_at = time.monotonic() + self.justification_deadline
+        missing = list(selected)
+        
+        with metrics.span("batched_justification", papers=len(missing)) as span:
+            for attempt in range(1 + self.justification_retries):
+                remaining = deadline_at - time.monotonic()
+                if not missing or remaining <= 0:
+                    break
+                if attempt:
+                    span.add(retried=len(missing))
+                    logger.info(f"Retrying justifications for {len(missing)} papers")
+                
+                messages, max_tokens = self._build_batched_request(user_query, [selected[i] for i in missing])
+                response = self.client.llm.complete(
+                    messages,
+                    max_tokens=max_tokens,
+                    chain=self.client.chain,
+                    models={"hf_router": self.model_name},
+                    deadline=remaining
+                )
+                if response is None:
+                    continue
+                span.add(calls=1, prompt_tokens=response["usage"].get("prompt_tokens", 0),
+                         completion_tokens=response["usage"].get("completion_tokens", 0))
+                
+                justifications = parse_justifications(response["text"], missing)
+                for paper_id, text in justifications.items():
+                    paper = selected[paper_id]
+                    paper["detailed_justification"] = text
+                    yield paper
+                missing = [i for i in missing if i not in justifications]
+            span.set(failed=len(missing))
+            logger.info(f"Batched justification: {span.attributes.get('calls', 0)} calls, "
+                        f"{span.attributes.get('prompt_tokens', 0)} prompt / "
+                        f"{span.attributes.get('completion_tokens', 0)} completion tokens")
+        
+        if missing:
+            logger.warning(f"No detailed justification for {len(missing)} papers; using short justifications")
+        for paper_id in missing:
+            paper = selected[paper_id]
+            paper["detailed_justification"] = paper["justification"]
+            yield paper
+    
+    def _build_batched_request(self, user_query: str, papers: List[Dict]):
+        """One prompt covering every paper, abstracts sharing the token budget; returns (messages, max_tokens)"""
+        per_paper = max(32, self.abstract_token_budget // max(1, len(papers)))
+        entries = []
+        for analysis in papers:
+            paper = analysis['paper']
+            entries.append(f"[{paper['id']}] {paper['title']}\nAbstract: {trim_to_tokens(paper['abstract'], per_paper)}")
+        papers_text = "\n\n".join(entries)
+        
+        prompt = f"""
+        User research interests: "{user_query}"
+        
+        Papers (each starts with its [paper id]):
+        
+        {papers_text}
+        
+        For every paper, explain specifically why it is relevant to the user's research interests.
+        Focus on technical connections and practical relevance, in 2-3 sentences per paper.
+        
+        Return ONLY a JSON object keyed by paper id, e.g. {{"{papers[0]['paper']['id']}": "justification", ...}}.
+        """
+        
+        max_tokens = self.tokens_per_justification * len(papers) + 32
+        return [{"role": "user", "content": prompt}], max_tokens
+    
+    def format_output(self, user_query: str, top_papers: List[Dict]) -> str:
+        """Format already justified top papers"""
+        try:
+            return self._create_output_format(user_query, top_papers)
+        except Exception as e:
+            logger.error(f"Error in justification: {e}")
+            return self._create_fallback_output(top_papers)
+    
     def _generate_detailed_justification(self, user_query: str, paper: Dict) -> str:
         """Generate detailed justification using HF API"""
+        try:
+            response = self.client.chat_completion_many([self._build_request(user_query, paper)])[0]
+            return response.strip() if response else paper["justification"]
+        except Exception as e:
+            logger.error(f"Error generating detailed justification: {e}")
+            return paper["justification"]
+    
+    def _build_request(self, user_query: str, paper: Dict) -> Dict:
+        """Build the chat completion call for one paper's justification"""
         prompt = f"""
         User research interests: "{user_query}"
         
@@ -47,12 +168,12 @@ class JustificationAgent:
         Justification:
         """
         
-        try:
-            response = self.client.generate_text(self.model_name, prompt, max_tokens=150)
-            return response.strip() if response else paper["justification"]
-        except Exception as e:
-            logger.error(f"Error generating detailed justification: {e}")
-            return paper["justification"]
+        return {
+            "model": self.model_name,
+            "messages": [{"role": "user", "content": prompt}],
+            "max_tokens": 150,
+            "deadline": self.justification_deadline
+        }
     
     def _create_output_format(self, user_query: str, papers: List[Dict]) -> str:
         """Create formatted output string"""
@@ -90,4 +211,81 @@ class JustificationAgent:
             output.append(f"   {paper_data['justification']}")
             output.append("")
         
-        return "\n".join(output)
\ No newline at end of file
+        return "\n".join(output)
+
+def trim_to_tokens(text: str, max_tokens: int) -> str:
+    """Cut text to roughly max_tokens model tokens (about 0.75 words per token)"""
+    words = text.split()
+    max_words = max(1, int(max_tokens * 0.75))
+    if len(words) <= max_words:
+        return text
+    return " ".join(words[:max_words]) + "..."
+
+def parse_justifications(text: str, paper_ids: List[str]) -> Dict[str, str]:
+    """
+    Pull {paper id: justification} out of a model response. Tolerates code
+    fences, text around the JSON, ids wrapped in brackets or prefixed with
+    "arXiv:", nested {"justification": ...} values, a single wrapper key such
+    as {"justifications": {...}}, a list of {"id", "justification"} objects
+    and truncated output (complete entries before the cut are kept).
+    """
+    wanted = {_normalize_id(paper_id): paper_id for paper_id in paper_ids}
+    entries = _unwrap_entries(_load_json(text), wanted)
+    
+    if not any(_normalize_id(key) in wanted for key in entries):
+        # Broken JSON (or only a fragment parsed, e.g. the first object of a cut-off list): salvage
+        # each complete "id": "text", "id": {"justification": "text"} and {"id", "justification"} entry
+        entries = {}
+        for key, value in re.findall(
+            r'"([^"]+)"\s*:\s*(?:\{\s*"(?:justification|text)"\s*:\s*)?"((?:[^"\\]|\\.)*)"', text
+        ) + re.findall(
+            r'"(?:paper_)?id"\s*:\s*"([^"]+)"\s*,\s*"(?:justification|text)"\s*:\s*"((?:[^"\\]|\\.)*)"', text
+        ):
+            try:
+                entries[key] = json.loads(f'"{value}"')
+            except json.JSONDecodeError:
+                entries[key] = value
+    
+    justifications = {}
+    for key, value in entries.items():
+        paper_id = wanted.get(_normalize_id(key))
+        if isinstance(value, dict):
+            value = value.get("justification") or value.get("text")
+        if paper_id is not None and isinstance(value, str) and value.strip():
+            justifications[paper_id] = value.strip()
+    return justifications
+
+def _load_json(text: str):
+    """Parse the outermost JSON object (or failing that, array) in text, or None"""
+    for opening, closing in (('{', '}'), ('[', ']')):
+        start, end = text.find(opening), text.rfind(closing)
+        if start >= 0 and end > start:
+            try:
+                return json.loads(text[start:end + 1])
+            except json.JSONDecodeError:
+                continue
+    return None
+
+def _unwrap_entries(parsed, wanted: Dict[str, str]) -> Dict:
+    """Turn wrapper objects and lists of {"id", "justification"} objects into {id: value}"""
+    while isinstance(parsed, dict) and len(parsed) == 1:
+        (key, value), = parsed.items()
+        if _normalize_id(key) in wanted or not isinstance(value, (dict, list)):
+            break
+        parsed = value
+    if isinstance(parsed, list):
+        entries = {}
+        for item in parsed:
+            if not isinstance(item, dict):
+                continue
+            key = item.get("id", item.get("paper_id"))
+            if key is not None:
+                entries[str(key)] = item
+            else:
+                entries.update(item)
+        return entries
+    return parsed if isinstance(parsed, dict) else {}
+
+def _normalize_id(paper_id: str) -> str:
+    paper_id = str(paper_id).strip().strip("[]").strip().lower()
+    return paper_id[len("arxiv:"):] if paper_id.startswith("arxiv:") else paper_id
@@ -0,0 +1,188 @@
+import os
+import json
+import math
+import logging
+import numpy as np
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+from utils.helpers import tokenize
+
+logger = logging.getLogger(__name__)
+
+STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "based", "be", "by", "for", "from", "how", "i", "in",
+    "interested", "into", "is", "it", "its", "looking", "me", "my", "of", "on", "or", "paper",
+    "papers", "research", "show", "some", "that", "the", "their", "this", "to", "using", "via",
+    "want", "what", "with", "work", "about", "approaches", "methods", "recent", "latest", "new"
+}
+
+RECENT_WORDS = {"recent", "latest", "new", "current", "emerging", "state-of-the-art", "sota"}
+
+def vocab_path(index_path: str) -> str:
+    return os.path.splitext(index_path)[0] + "_vocab.json"
+
+def invalidate_index(index_path: str):
+    """Delete a persisted planner index so the next LocalPlanner rebuilds it from the current corpus"""
+    for path in (index_path, vocab_path(index_path)):
+        if os.path.exists(path):
+            os.remove(path)
+
+class LocalPlanner:
+    """
+    Plans simple queries without the LLM.
+
+    Domains come from the nearest per-category centroid embeddings of the
+    indexed corpus, key concepts from TF-IDF over the corpus vocabulary.
+    """
+
+    def __init__(self, embedder, collection, index_path: str, top_domains: int = 3,
+                 max_concepts: int = 5, temperature: float = 0.05):
+        self.embedder = embedder
+        self.collection = collection
+        self.index_path = index_path
+        self.top_domains = top_domains
+        self.max_concepts = max_concepts
+        self.temperature = temperature
+
+        self.categories = []
+        self.centroids = None
+        self.doc_freq = {}
+        self.num_docs = 0
+
+        if not self._load_index():
+            self.build_index()
+
+    def _load_index(self) -> bool:
+        if not (os.path.exists(self.index_path) and os.path.exists(vocab_path(self.index_path))):
+            return False
+        try:
+            data = np.load(self.index_path, allow_pickle=False)
+            # Built from a different corpus (papers were added since): centroids and doc_freq are stale
+            corpus_size = int(data["corpus_size"]) if "corpus_size" in data else -1
+            current_size = self.collection.count()
+            if corpus_size != current_size:
+                logger.info(f"Local planner index covers {corpus_size} papers, corpus has {current_size}. Rebuilding.")
+                return False
+            self.categories = [str(c) for c in data["categories"]]
+            self.centroids = data["centroids"]
+            with open(vocab_path(self.index_path), "r") as f:
+                vocab = json.load(f)
+            self.doc_freq = vocab["doc_freq"]
+            self.num_docs = vocab["num_docs"]
+            logger.info(f"Loaded local planner index with {len(self.categories)} categories")
+            return True
+        except Exception as e:
+            logger.warning(f"Could not load local planner index: {e}. Rebuilding.")
+            return False
+
+    def build_index(self, page_size: int = 5000):
+        """Build category centroids and document frequencies from the vector DB"""
+        sums = {}
+        counts = Counter()
+        doc_freq = Counter()
+        num_docs = 0
+
+        offset = 0
+        while True:
+            page = self.collection.get(
+                include=["embeddings", "metadatas", "documents"],
+                limit=page_size,
+                offset=offset
+            )
+            if not page["ids"]:
+                break
+
+            for embedding, metadata, document in zip(page["embeddings"], page["metadatas"], page["documents"]):
+                vector = np.asarray(embedding, dtype=np.float32)
+                vector = vector / (np.linalg.norm(vector) or 1.0)
+                for category in self._split_categories(metadata.get("categories", "")):
+                    sums[category] = sums.get(category, 0) + vector
+                    counts[category] += 1
+
+                tokens = tokenize(document)
+                terms = set(tokens) | {f"{a} {b}" for a, b in zip(tokens, tokens[1:])}
+                doc_freq.update(terms)
+                num_docs += 1
+
+            offset += len(page["ids"])
+
+        self.categories = sorted(sums)
+        centroids = np.vstack([sums[c] / counts[c] for c in self.categories]) if sums else np.zeros((0, 0))
+        norms = np.linalg.norm(centroids, axis=1, keepdims=True) if len(centroids) else 1.0
+        self.centroids = (centroids / np.where(norms == 0, 1.0, norms)).astype(np.float32)
+
+        # Drop rare terms to keep the vocabulary compact
+        self.doc_freq = {term: df for term, df in doc_freq.items() if df >= 2}
+        self.num_docs = num_docs
+
+        os.makedirs(os.path.dirname(self.index_path) or ".", exist_ok=True)
+        np.savez(self.index_path, categories=np.array(self.categories), centroids=self.centroids,
+                 corpus_size=np.array(num_docs))
+        with open(vocab_path(self.index_path), "w") as f:
+            json.dump({"doc_freq": self.doc_freq, "num_docs": self.num_docs}, f)
+
+        logger.info(f"Built local planner index: {len(self.categories)} categories, "
+                    f"{len(self.doc_freq)} terms from {num_docs} papers")
+
+    @staticmethod
+    def _split_categories(value) -> List[str]:
+        if isinstance(value, list):
+            return value
+        return [c.strip() for c in str(value).split(",") if c.strip()]
+
+    def plan(self, user_query: str, embedding: Optional[np.ndarray] = None) -> Tuple[Dict, float]:
+        """Return a plan and a confidence in [0, 1] that it is as good as the LLM's"""
+        if self.centroids is None or len(self.categories) == 0:
+            return {}, 0.0
+
+        if embedding is None:
+            embedding = self.embedder.encode(user_query)
+        query = np.asarray(embedding, dtype=np.float32).reshape(-1)
+        query = query / (np.linalg.norm(query) or 1.0)
+
+        # Softmax over centroid similarities; confident queries put most mass on a few domains
+        similarities = self.centroids @ query
+        weights = np.exp((similarities - similarities.max()) / self.temperature)
+        probabilities = weights / weights.sum()
+        top = np.argsort(-probabilities)[:self.top_domains]
+        domains = [self.categories[i] for i in top if probabilities[i] >= 0.05] or [self.categories[top[0]]]
+        domain_confidence = float(probabilities[top].sum())
+
+        key_concepts, coverage = self._extract_concepts(user_query)
+
+        tokens = set(tokenize(user_query))
+        plan = {
+            "domains": domains,
+            "key_concepts": key_concepts,
+            "recency_preference": "last 2 years" if tokens & RECENT_WORDS else "last 3 years",
+            "depth": "comprehensive",
+            "specific_requirements": []
+        }
+        return plan, domain_confidence * coverage
+
+    def _extract_concepts(self, user_query: str) -> Tuple[List[str], float]:
+        """Rank query unigrams and bigrams by TF-IDF against the corpus vocabulary"""
+        tokens = tokenize(user_query)
+        content = [t for t in tokens if t not in STOPWORDS]
+        if not content:
+            return [], 0.0
+
+        bigrams = [f"{a} {b}" for a, b in zip(tokens, tokens[1:])
+                   if a not in STOPWORDS and b not in STOPWORDS]
+        candidates = Counter(content) + Counter(b for b in bigrams if b in self.doc_freq)
+
+        scored = []
+        for term, tf in candidates.items():
+            df = self.doc_freq.get(term, 0)
+            idf = math.log((1 + self.num_docs) / (1 + df)) + 1
+            # Prefer phrases over their parts
+            scored.append((tf * idf * (1.5 if " " in term else 1.0), term))
+        scored.sort(reverse=True)
+
+        # Drop words already covered by a selected phrase
+        phrase_words = {word for _, term in scored if " " in term for word in term.split()}
+        concepts = [term for _, term in scored if " " in term or term not in phrase_words][:self.max_concepts]
+
+        # Queries full of words the corpus has never seen are ambiguous
+        coverage = sum(1 for t in content if t in self.doc_freq) / len(content)
+        return concepts, coverage
@@ -1,23 +1,111 @@
 import json
 import logging
-from typing import Dict
+from typing import Dict, Optional
 from utils.helpers import load_config
-from groq import Groq
+from utils.plan_cache import PlanCache
+from utils.score_cache import normalize_interests
+from utils.lazy import LazyResource
+from utils.metrics import metrics
+from utils.llm_client import get_llm_client
 import dotenv
-import os
 dotenv.load_dotenv()
 
 logger = logging.getLogger(__name__)
 
 class PlannerAgent:
-    def __init__(self, model_name):
+    def __init__(self, model_name, embedder=None, local_planner=None):
         self.config = load_config()
         self.model_name = str(model_name) or self.config['models']['planner']
-        self.client = Groq(api_key=os.environ.get("GROQ_API_KEY"),)
-
+        # Groq first, then the HF router, then the local keyword plan (see llm.chains.planner)
+        self.client = LazyResource("llm_client", get_llm_client)
+        
+        # Sentence-transformer used for the semantic plan cache tier (optional)
+        self.embedder = embedder
+        self.plan_cache = None
+        if self.config['agent'].get('plan_cache', True):
+            try:
+                self.plan_cache = PlanCache(
+                    self.config['paths'].get('plan_cache', "data/cache/plans.db"),
+                    ttl=self.config['agent'].get('plan_cache_ttl', 86400),
+                    max_size=self.config['agent'].get('plan_cache_size', 5000),
+                    max_distance=self.config['agent'].get('plan_cache_max_distance', 0.08),
+                    embedder=self.config['models']['embedding']
+                )
+            except Exception as e:
+                logger.warning(f"Could not open plan cache: {e}. Planning without cache.")
+        
+        # Corpus-based planner that answers confident queries without the LLM (optional)
+        self.local_planner = local_planner
+        self.local_planner_threshold = self.config['agent'].get('local_planner_threshold', 0.6)
+    
+    def warm_up(self):
+        """Create the LLM client and load the local planner index ahead of the first query"""
+        self.client.load()
+        if isinstance(self.local_planner, LazyResource):
+            try:
+                self.local_planner.load()
+            except Exception as e:
+                logger.warning(f"Could not build local planner: {e}")
+    
+    def is_ready(self) -> bool:
+        """True once the LLM client exists; the local planner is optional"""
+        return self.client.ok
     
     def plan(self, user_query: str) -> Dict:
-        """Create a search plan based on user interests"""
+        """Create a search plan based on user interests, reusing cached plans when possible"""
+        embedding = None
+        if self.embedder is not None and (self.plan_cache is not None or self.local_planner is not None):
+            try:
+                embedding = self.embedder.encode(normalize_interests(user_query))
+            except Exception as e:
+                logger.error(f"Error embedding query for planning: {e}")
+        
+        if self.plan_cache is not None:
+            try:
+                cached = self.plan_cache.get(user_query, embedding)
+                metrics.count("plan_cache", "hits" if cached is not None else "misses")
+                if cached is not None:
+                    return cached
+            except Exception as e:
+                logger.error(f"Error reading plan cache: {e}")
+        
+        local_plan = self._local_plan(user_query, embedding)
+        if local_plan is not None:
+            metrics.count("local_planner", "plans")
+            return local_plan
+        
+        plan = self._request_plan(user_query)
+        if plan is None:
+            # Never cache the fallback plan
+            return self._create_fallback_plan(user_query)
+        
+        if self.plan_cache is not None:
+            try:
+                self.plan_cache.put(user_query, plan, embedding)
+            except Exception as e:
+                logger.error(f"Error writing plan cache: {e}")
+        return plan
+    
+    def _local_plan(self, user_query: str, embedding=None) -> Optional[Dict]:
+        """Plan locally when the corpus-based planner is confident enough, else None"""
+        if self.local_planner is None:
+            return None
+        
+        try:
+            plan, confidence = self.local_planner.plan(user_query, embedding)
+        except Exception as e:
+            logger.error(f"Error in local planner: {e}")
+            return None
+        
+        if confidence >= self.local_planner_threshold and plan.get("key_concepts"):
+            logger.info(f"Local plan (confidence {confidence:.2f}): {plan}")
+            return plan
+        
+        logger.info(f"Local planner not confident ({confidence:.2f}), asking the LLM")
+        return None
+    
+    def _request_plan(self, user_query: str) -> Optional[Dict]:
+        """Ask the LLM planner for a search plan; None when it fails"""
         messages = [
             {
                 "role": "user",
@@ -41,17 +129,23 @@ class PlannerAgent:
         ]
         
         try:
-            response = self.client.chat.completions.create(
-                model=self.model_name,
-                messages=messages,
-                max_tokens=256
-            )
+            with metrics.span("planner_llm", model=self.model_name) as span:
+                response = self.client.complete(
+                    messages,
+                    max_tokens=256,
+                    chain="planner",
+                    models={"groq": self.model_name}
+                )
+                if response is not None:
+                    usage = response["usage"]
+                    span.set(prompt_tokens=usage.get("prompt_tokens", 0),
+                             completion_tokens=usage.get("completion_tokens", 0))
             
-            if not response or not response.choices:
+            if not response or not response["text"]:
                 logger.warning("Empty response from API, using fallback")
-                return self._create_fallback_plan(user_query)
+                return None
                 
-            response_text = response.choices[0].message.content
+            response_text = response["text"]
             
             # Extract JSON from response
             json_start = response_text.find('{')
@@ -64,14 +158,14 @@ class PlannerAgent:
                 return plan
             else:
                 logger.warning(f"No JSON found in response. Response was: {response}")
-                return self._create_fallback_plan(user_query)
+                return None
             
         except json.JSONDecodeError as e:
             logger.error(f"JSON decode error: {e}. Response was: {response}")
-            return self._create_fallback_plan(user_query)
+            return None
         except Exception as e:
             logger.error(f"Error in planner: {e}")
-            return self._create_fallback_plan(user_query)
+            return None
     
     def _create_fallback_plan(self, user_query: str) -> Dict:
         """Create fallback plan when API fails"""
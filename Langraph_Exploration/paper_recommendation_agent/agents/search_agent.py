@@ -1,54 +1,348 @@
-import chromadb
-from sentence_transformers import SentenceTransformer
+import os
+import re
+import json
+import time
+import numpy as np
 import logging
-from typing import List, Dict
-from utils.helpers import load_config
+import threading
+from collections import OrderedDict
+from typing import List, Dict, Optional, Tuple
+from utils.helpers import load_config, category_key
+from utils.bm25_index import BM25Index
+from utils.vector_store import open_vector_store
+from utils.lazy import LazyResource
+from utils.model_registry import SharedEmbedder, load_embedder, registry
+from utils.metrics import metrics
 
 logger = logging.getLogger(__name__)
 
+# archive or archive.SUBJ, e.g. cs.LG, physics.comp-ph, quant-ph, hep-th
+ARXIV_CATEGORY = re.compile(r"^[a-z-]+(\.[A-Za-z-]+)?$")
+RECENCY_UNIT_DAYS = {"year": 365, "month": 30, "week": 7, "day": 1}
+
 class SearchAgent:
     def __init__(self):
         config = load_config()
-        self.embedder = SentenceTransformer(config['models']['embedding'])
+        # One embedder per process, loaded on first use (or by warm_up) to keep startup fast
+        model_name = config['models']['embedding']
+        embedder = registry.get(
+            f"embedder:{model_name}", lambda: LazyResource("embedder", lambda: load_embedder(model_name))
+        )
+        if config['agent'].get('micro_batching', True):
+            # encode() calls from concurrent requests share batches on one inference thread
+            embedder = registry.get(f"shared_embedder:{model_name}", lambda: SharedEmbedder(
+                embedder,
+                max_batch_size=config['agent'].get('embedding_micro_batch_size', 128),
+                max_wait_ms=config['agent'].get('micro_batch_wait_ms', 5)
+            ))
+        self.embedder = embedder
         
-        # Initialize ChromaDB client
-        self.client = chromadb.PersistentClient(path=config['paths']['vector_db'])
-        self.collection = self.client.get_collection("arxiv_papers")
+        # Vector store (Chroma by default, or the in-process NumPy store)
+        self.collection = LazyResource("vector_store", lambda: open_vector_store(config))
         
         self.search_top_k = config['agent']['search_top_k']
+        self.search_mode = config['agent'].get('search_mode', 'single')
+        self.rrf_k = config['agent'].get('rrf_k', 60)
+        
+        # Metadata pre-filtering on the plan's domains and recency
+        self.filter_domains = config['agent'].get('filter_domains', True)
+        self.filter_recency = config['agent'].get('filter_recency', True)
+        self.min_filtered_results = config['agent'].get('min_filtered_results', max(1, self.search_top_k // 2))
+        
+        # Lexical BM25 index for hybrid retrieval, built by init_vector_db
+        self.bm25 = None
+        self.hybrid_alpha = config['agent'].get('hybrid_alpha', 0.5)
+        bm25_path = config['paths'].get('bm25_index', "data/vector_db/bm25")
+        if config['agent'].get('hybrid_search', True) and os.path.exists(os.path.join(bm25_path, "manifest.json")):
+            try:
+                self.bm25 = BM25Index(bm25_path)
+                logger.info(f"Loaded BM25 index with {self.bm25.num_docs} papers")
+            except Exception as e:
+                logger.warning(f"Could not load BM25 index: {e}. Using dense search only.")
+        
+        # LRU cache of query text -> embedding
+        self.embedding_cache = OrderedDict()
+        self.embedding_cache_size = config['agent'].get('embedding_cache_size', 1024)
+        self._cache_lock = threading.Lock()
     
-    def search(self, plan: Dict) -> List[Dict]:
+    def warm_up(self):
+        """Load the embedder and open the vector store now instead of on the first search"""
+        self.embedder.load()
+        self.collection.load()
+    
+    def is_ready(self) -> bool:
+        """True once the embedder and the vector store have loaded (never triggers a load)"""
+        embedder = self.embedder.model if isinstance(self.embedder, SharedEmbedder) else self.embedder
+        return embedder.ok and self.collection.ok
+    
+    def search(self, plan: Dict, user_query: str = None) -> List[Dict]:
         """Search for papers based on the plan"""
+        if self.search_mode == 'multi_query':
+            return self.multi_query_search(plan, user_query)
+        
         try:
             # Create search query from key concepts
             search_query = " ".join(plan["key_concepts"])
             
             # Generate embedding for the query
-            query_embedding = self.embedder.encode(search_query).tolist()
+            query_embedding = self.encode_queries([search_query])[0]
             
             # Search in vector database
-            results = self.collection.query(
-                query_embeddings=[query_embedding],
-                n_results=self.search_top_k,
-                include=["metadatas", "documents", "distances"]
-            )
-            
-            papers = []
-            for i in range(len(results['ids'][0])):
-                paper = {
-                    'id': results['ids'][0][i],
-                    'title': results['metadatas'][0][i]['title'],
-                    'abstract': results['documents'][0][i],
-                    'categories': results['metadatas'][0][i]['categories'],
-                    'published': results['metadatas'][0][i]['published'],
-                    'pdf_url': results['metadatas'][0][i].get('pdf_url', ''),
-                    'search_score': 1 - results['distances'][0][i]  # Convert distance to similarity
-                }
-                papers.append(paper)
+            results, where = self._filtered_query([query_embedding], plan)
+            
+            papers = [self._build_paper(results, 0, i) for i in range(len(results['ids'][0]))]
+            papers = self._hybrid_fuse(papers, search_query, [query_embedding], where, 'search_score')
             
             logger.info(f"Found {len(papers)} candidate papers")
             return papers
             
         except Exception as e:
             logger.error(f"Error in search: {e}")
-            return []
\ No newline at end of file
+            return []
+    
+    def search_many(self, plans: List[Dict], user_queries: List[str] = None) -> List[List[Dict]]:
+        """Search for several plans at once: one encoding pass and one vector query per distinct filter"""
+        user_queries = user_queries or [None] * len(plans)
+        if self.search_mode == 'multi_query':
+            # Encode every query up front; each plan's search then hits the embedding cache
+            queries = []
+            for plan, user_query in zip(plans, user_queries):
+                queries += [concept.strip() for concept in plan.get("key_concepts", []) if concept.strip()]
+                if user_query and user_query.strip():
+                    queries.append(user_query.strip())
+            if queries:
+                self.encode_queries(list(dict.fromkeys(queries)))
+            return [self.multi_query_search(plan, user_query) for plan, user_query in zip(plans, user_queries)]
+        
+        results = [[] for _ in plans]
+        try:
+            search_queries = [" ".join(plan["key_concepts"]) for plan in plans]
+            embeddings = self.encode_queries(search_queries)
+            
+            # Plans sharing the same strictest filter go to the vector DB in one query
+            groups = {}
+            for p, plan in enumerate(plans):
+                where = self._build_filters(plan)[0]
+                groups.setdefault(json.dumps(where, sort_keys=True), (where, []))[1].append(p)
+            
+            for where, members in groups.values():
+                with metrics.span("vector_query", queries=len(members)) as span:
+                    batch = self.collection.query(
+                        query_embeddings=[embeddings[p] for p in members],
+                        n_results=self.search_top_k,
+                        where=where,
+                        include=["metadatas", "documents", "distances"]
+                    )
+                    span.set(candidates=sum(len(ids) for ids in batch['ids']), filtered=int(where is not None))
+                for q, p in enumerate(members):
+                    if len(batch['ids'][q]) >= self.min_filtered_results:
+                        papers = [self._build_paper(batch, q, i) for i in range(len(batch['ids'][q]))]
+                        plan_where = where
+                    else:
+                        # Too few matches: widen this plan's filter on its own
+                        single, plan_where = self._filtered_query([embeddings[p]], plans[p])
+                        papers = [self._build_paper(single, 0, i) for i in range(len(single['ids'][0]))]
+                    results[p] = self._hybrid_fuse(papers, search_queries[p], [embeddings[p]], plan_where, 'search_score')
+            
+            logger.info(f"Searched {len(plans)} plans with {len(groups)} vector queries")
+        except Exception as e:
+            logger.error(f"Error in batch search: {e}")
+        return results
+    
+    def multi_query_search(self, plan: Dict, user_query: str = None) -> List[Dict]:
+        """Query once per key concept (plus the raw query) and fuse the rankings"""
+        try:
+            queries = [concept.strip() for concept in plan["key_concepts"] if concept.strip()]
+            if user_query and user_query.strip():
+                queries.append(user_query.strip())
+            queries = list(dict.fromkeys(queries))  # Dedupe, keep order
+            
+            if not queries:
+                logger.warning("No key concepts to search for")
+                return []
+            
+            query_embeddings = self.encode_queries(queries)
+            
+            # One round-trip for all queries
+            results, where = self._filtered_query(query_embeddings, plan)
+            
+            papers = self._reciprocal_rank_fusion(results)[:self.search_top_k]
+            papers = self._hybrid_fuse(papers, " ".join(queries), query_embeddings, where, 'fusion_score')
+            
+            logger.info(f"Found {len(papers)} candidate papers from {len(queries)} queries")
+            return papers
+            
+        except Exception as e:
+            logger.error(f"Error in multi-query search: {e}")
+            return []
+    
+    def _filtered_query(self, query_embeddings: List[List[float]], plan: Dict) -> Tuple[Dict, Optional[Dict]]:
+        """Query with the plan's metadata filter, widening it when too few papers match"""
+        results = None
+        where = None
+        for where in self._build_filters(plan):
+            with metrics.span("vector_query", queries=len(query_embeddings)) as span:
+                results = self.collection.query(
+                    query_embeddings=query_embeddings,
+                    n_results=self.search_top_k,
+                    where=where,
+                    include=["metadatas", "documents", "distances"]
+                )
+                hits = len({paper_id for ids in results['ids'] for paper_id in ids})
+                span.set(candidates=hits, filtered=int(where is not None))
+            if hits >= self.min_filtered_results:
+                break
+            logger.info(f"Filter {where} matched only {hits} papers, widening")
+        return results, where
+    
+    def _hybrid_fuse(self, papers: List[Dict], lexical_query: str, query_embeddings: List[List[float]],
+                     where: Optional[Dict], dense_key: str) -> List[Dict]:
+        """Blend dense scores with BM25 scores, pulling in lexical-only hits from the vector DB"""
+        if self.bm25 is None:
+            return papers
+        
+        with metrics.span("bm25") as span:
+            hits = self.bm25.search(lexical_query, self.search_top_k)
+            span.set(candidates=len(hits))
+        if not hits:
+            return papers
+        
+        by_id = {paper['id']: paper for paper in papers}
+        missing = [paper_id for paper_id, _ in hits if paper_id not in by_id]
+        if missing:
+            # Same metadata filter as the dense query, so lexical hits respect the plan too
+            fetched = self.collection.get(ids=missing, where=where, include=["metadatas", "documents", "embeddings"])
+            queries = np.asarray(query_embeddings, dtype=np.float32)
+            for paper_id, metadata, document, embedding in zip(
+                fetched['ids'], fetched['metadatas'], fetched['documents'], fetched['embeddings']
+            ):
+                # Squared L2, like the collection's own distances
+                distance = float(np.min(((queries - np.asarray(embedding, dtype=np.float32)) ** 2).sum(axis=1)))
+                by_id[paper_id] = self._paper_from_record(paper_id, metadata, document, distance)
+        
+        bm25_scores = dict(hits)
+        candidates = list(by_id.values())
+        dense = self._min_max([paper.get(dense_key, 0.0) for paper in candidates])
+        lexical = self._min_max([bm25_scores.get(paper['id'], 0.0) for paper in candidates])
+        
+        for paper, dense_score, lexical_score in zip(candidates, dense, lexical):
+            paper['bm25_score'] = bm25_scores.get(paper['id'], 0.0)
+            paper['hybrid_score'] = self.hybrid_alpha * dense_score + (1 - self.hybrid_alpha) * lexical_score
+        
+        candidates.sort(key=lambda paper: paper['hybrid_score'], reverse=True)
+        return candidates[:self.search_top_k]
+    
+    @staticmethod
+    def _min_max(values: List[float]) -> List[float]:
+        low, high = min(values), max(values)
+        if high == low:
+            return [1.0 if high > 0 else 0.0 for _ in values]
+        return [(v - low) / (high - low) for v in values]
+    
+    def _build_filters(self, plan: Dict) -> List[Optional[Dict]]:
+        """Chroma where clauses from strictest (domains + recency) to none"""
+        clauses = []
+        
+        if self.filter_domains:
+            domains = [d for d in plan.get("domains", []) if ARXIV_CATEGORY.match(str(d))]
+            if domains:
+                flags = [{category_key(d): True} for d in domains]
+                clauses.append(flags[0] if len(flags) == 1 else {"$or": flags})
+        
+        cutoff = self._recency_cutoff(plan.get("recency_preference", "")) if self.filter_recency else None
+        if cutoff is not None:
+            clauses.append({"published_ts": {"$gte": cutoff}})
+        
+        # Drop recency first, then domains
+        filters = []
+        while clauses:
+            filters.append(clauses[0] if len(clauses) == 1 else {"$and": list(clauses)})
+            clauses.pop()
+        filters.append(None)
+        return filters
+    
+    def _recency_cutoff(self, preference: str) -> Optional[int]:
+        """Turn a recency preference like 'last 2 years' into a minimum publish timestamp"""
+        preference = str(preference).lower()
+        if not preference or re.search(r"\b(all|any)\b", preference):
+            return None
+        
+        amount = re.search(r"(\d+(?:\.\d+)?)\s*(year|month|week|day)", preference)
+        unit = re.search(r"\b(year|month|week)\b", preference)
+        if amount:
+            days = float(amount.group(1)) * RECENCY_UNIT_DAYS[amount.group(2)]
+        elif unit:
+            # "past year", "last month"
+            days = RECENCY_UNIT_DAYS[unit.group(1)]
+        elif "recent" in preference or "latest" in preference:
+            days = 2 * 365
+        else:
+            return None
+        
+        return int(time.time() - days * 86400)
+    
+    def encode_queries(self, queries: List[str]) -> List[List[float]]:
+        """Encode query strings in one batch, reusing cached embeddings"""
+        with self._cache_lock:
+            known = {query: self.embedding_cache[query] for query in queries if query in self.embedding_cache}
+        missing = [query for query in dict.fromkeys(queries) if query not in known]
+        
+        cache_hits = len(set(queries)) - len(missing)
+        if missing:
+            with metrics.span("embed", batch_size=len(missing), cache_hits=cache_hits, cache_misses=len(missing)):
+                embeddings = self.embedder.encode(missing)
+                for query, embedding in zip(missing, embeddings):
+                    known[query] = embedding.tolist()
+        else:
+            # No model call to time; a zero-length sample would skew the embed latency
+            metrics.count("embed", "cache_hits", cache_hits)
+        
+        with self._cache_lock:
+            for query in dict.fromkeys(queries):
+                self.embedding_cache[query] = known[query]
+                self.embedding_cache.move_to_end(query)
+            
+            while len(self.embedding_cache) > self.embedding_cache_size:
+                self.embedding_cache.popitem(last=False)
+        
+        return [known[query] for query in queries]
+    
+    def _reciprocal_rank_fusion(self, results: Dict) -> List[Dict]:
+        """Merge per-query result lists with reciprocal-rank fusion"""
+        fused = {}
+        
+        for q in range(len(results['ids'])):
+            for rank, paper_id in enumerate(results['ids'][q]):
+                paper = self._build_paper(results, q, rank)
+                
+                if paper_id not in fused:
+                    fused[paper_id] = paper
+                    paper['fusion_score'] = 0.0
+                else:
+                    # Keep the best similarity seen across queries
+                    fused[paper_id]['search_score'] = max(fused[paper_id]['search_score'], paper['search_score'])
+                
+                fused[paper_id]['fusion_score'] += 1.0 / (self.rrf_k + rank + 1)
+        
+        return sorted(fused.values(), key=lambda p: p['fusion_score'], reverse=True)
+    
+    def _build_paper(self, results: Dict, q: int, i: int) -> Dict:
+        """Build a paper dict from the i-th hit of the q-th query"""
+        return self._paper_from_record(
+            results['ids'][q][i],
+            results['metadatas'][q][i],
+            results['documents'][q][i],
+            results['distances'][q][i]
+        )
+    
+    def _paper_from_record(self, paper_id: str, metadata: Dict, document: str, distance: float) -> Dict:
+        """Build a paper dict from a stored record and its distance to the query"""
+        return {
+            'id': paper_id,
+            'title': metadata['title'],
+            'abstract': document,
+            'categories': [c.strip() for c in metadata['categories'].split(',') if c.strip()],
+            'published': metadata['published'],
+            'pdf_url': metadata.get('pdf_url', ''),
+            'search_score': 1 - distance  # Convert distance to similarity
+        }
@@ -1,18 +1,45 @@
 import requests
 import xml.etree.ElementTree as ET
 from typing import List, Dict
+import argparse
+import json
+import os
 import time
 # from utils.helpers import load_config
 
+ARXIV_API_URL = "http://export.arxiv.org/api/query"
+ATOM_NS = {'atom': 'http://www.w3.org/2005/Atom'}
+ENTRY_TAG = '{http://www.w3.org/2005/Atom}entry'
+
+def parse_entry(entry: ET.Element) -> Dict:
+    """Convert one Atom <entry> element into a paper dict"""
+    ns = ATOM_NS
+    paper = {
+        'id': entry.find('atom:id', ns).text.split('/')[-1],
+        'title': entry.find('atom:title', ns).text.strip(),
+        'abstract': entry.find('atom:summary', ns).text.strip(),
+        'categories': [cat.get('term') for cat in entry.findall('atom:category', ns)],
+        'published': entry.find('atom:published', ns).text,
+        'updated': entry.find('atom:updated', ns).text,
+        'authors': [author.find('atom:name', ns).text for author in entry.findall('atom:author', ns)],
+        'pdf_url': None
+    }
+
+    # Find PDF link
+    for link in entry.findall('atom:link', ns):
+        if link.get('title') == 'pdf':
+            paper['pdf_url'] = link.get('href')
+
+    return paper
+
 def fetch_arxiv_papers(categories: List[str] = None, max_results: int = 1000) -> List[Dict]:
     """Fetch papers from Arxiv API"""
     if categories is None:
         categories = ["cs.AI", "cs.LG", "cs.CL"]
-    
+
     papers = []
     for category in categories:
         query = f"cat:{category}"
-        url = "http://export.arxiv.org/api/query"
         params = {
             "search_query": query,
             "start": 0,
@@ -20,46 +47,177 @@ def fetch_arxiv_papers(categories: List[str] = None, max_results: int = 1000) ->
             "sortBy": "submittedDate",
             "sortOrder": "descending"
         }
-        
+
         try:
-            response = requests.get(url, params=params)
+            response = requests.get(ARXIV_API_URL, params=params)
             response.raise_for_status()
-            
+
             root = ET.fromstring(response.content)
-            ns = {'atom': 'http://www.w3.org/2005/Atom'}
-            
-            for entry in root.findall('atom:entry', ns):
-                paper = {
-                    'id': entry.find('atom:id', ns).text.split('/')[-1],
-                    'title': entry.find('atom:title', ns).text.strip(),
-                    'abstract': entry.find('atom:summary', ns).text.strip(),
-                    'categories': [cat.get('term') for cat in entry.findall('atom:category', ns)],
-                    'published': entry.find('atom:published', ns).text,
-                    'authors': [author.find('atom:name', ns).text for author in entry.findall('atom:author', ns)],
-                    'pdf_url': None
-                }
-                
-                # Find PDF link
-                for link in entry.findall('atom:link', ns):
-                    if link.get('title') == 'pdf':
-                        paper['pdf_url'] = link.get('href')
-                
-                papers.append(paper)
-            
+
+            for entry in root.findall('atom:entry', ATOM_NS):
+                papers.append(parse_entry(entry))
+
             time.sleep(1)  # Be nice to Arxiv API
-            
+
         except Exception as e:
             print(f"Error fetching category {category}: {e}")
-    
+
     return papers
 
+class ArxivHarvester:
+    """
+    Incremental, resumable arXiv harvester.
+
+    Pages through each category newest-first (by last update), streams every
+    page through iterparse and appends papers to a JSONL file. Each category
+    stops at the newest `updated` timestamp seen by the previous run, and
+    progress is checkpointed after every page so an interrupted run resumes
+    at the page it stopped on.
+    """
+
+    def __init__(self, output_file: str = "data/arxiv_papers.jsonl",
+                 state_file: str = "data/harvest_state.json",
+                 page_size: int = 200, delay: float = 3.0, retries: int = 3):
+        self.output_file = output_file
+        self.state_file = state_file
+        self.page_size = page_size
+        self.delay = delay
+        self.retries = retries
+        self.state = self._load_state()
+
+    def _load_state(self) -> Dict:
+        if os.path.exists(self.state_file):
+            with open(self.state_file, 'r') as f:
+                return json.load(f)
+        return {}
+
+    def _save_state(self):
+        # Write-then-rename so a crash never leaves a truncated checkpoint
+        tmp_file = self.state_file + ".tmp"
+        with open(tmp_file, 'w') as f:
+            json.dump(self.state, f, indent=2)
+        os.replace(tmp_file, self.state_file)
+
+    def _fetch_page(self, category: str, start: int, count: int) -> List[Dict]:
+        """Stream-parse one result page, clearing each entry so the tree never builds up"""
+        params = {
+            "search_query": f"cat:{category}",
+            "start": start,
+            "max_results": count,
+            "sortBy": "lastUpdatedDate",
+            "sortOrder": "descending"
+        }
+
+        for attempt in range(self.retries):
+            try:
+                response = requests.get(ARXIV_API_URL, params=params, stream=True, timeout=60)
+                response.raise_for_status()
+                response.raw.decode_content = True
+
+                papers = []
+                for _, element in ET.iterparse(response.raw, events=("end",)):
+                    if element.tag == ENTRY_TAG:
+                        papers.append(parse_entry(element))
+                        element.clear()
+                return papers
+            except Exception as e:
+                print(f"Error fetching {category} at offset {start} (attempt {attempt + 1}): {e}")
+                time.sleep(self.delay * (attempt + 1))
+
+        raise RuntimeError(f"Giving up on {category} at offset {start}")
+
+    def harvest_category(self, category: str, max_results: int = 1000) -> int:
+        """Fetch papers updated since the category's high-water mark; returns how many were new"""
+        category_state = self.state.setdefault(category, {"high_water": None})
+        progress = category_state.get("in_progress") or {
+            "start": 0,
+            "newest_seen": None,
+            "stop_at": category_state["high_water"]
+        }
+        category_state["in_progress"] = progress
+
+        if progress["start"]:
+            print(f"Resuming {category} at offset {progress['start']}")
+
+        # max_results caps this run; a capped incremental run leaves its checkpoint for the next one
+        run_start = progress["start"]
+        harvested = 0
+        done = False
+        exhausted = False
+        with open(self.output_file, 'a') as out:
+            while not done and progress["start"] - run_start < max_results:
+                count = min(self.page_size, max_results - (progress["start"] - run_start))
+                page = self._fetch_page(category, progress["start"], count)
+
+                if not page:
+                    exhausted = True
+                    break
+
+                for paper in page:
+                    if progress["stop_at"] and paper['updated'] <= progress["stop_at"]:
+                        done = True
+                        break
+
+                    out.write(json.dumps(paper) + "\n")
+                    harvested += 1
+                    if not progress["newest_seen"] or paper['updated'] > progress["newest_seen"]:
+                        progress["newest_seen"] = paper['updated']
+
+                out.flush()
+                progress["start"] += len(page)
+                self._save_state()
+
+                if len(page) < count:
+                    exhausted = True
+                    break
+
+                time.sleep(self.delay)  # Be nice to Arxiv API
+
+        # A first harvest has no older mark to page down to: the cap just bounds the backfill
+        if done or exhausted or progress["stop_at"] is None:
+            # Caught up with the old mark (or the feed ran out): advance it and clear the checkpoint
+            if progress["newest_seen"]:
+                category_state["high_water"] = progress["newest_seen"]
+            category_state["in_progress"] = None
+        else:
+            # Stopped by the cap: keep paging down to stop_at on the next run
+            print(f"{category}: reached max_results before the previous high-water mark; will resume")
+        self._save_state()
+
+        return harvested
+
+    def harvest(self, categories: List[str] = None, max_results: int = 1000) -> int:
+        """Harvest every category; returns the total number of new papers"""
+        if categories is None:
+            categories = ["cs.AI", "cs.LG", "cs.CL"]
+
+        total = 0
+        for category in categories:
+            new_papers = self.harvest_category(category, max_results)
+            print(f"{category}: {new_papers} new papers")
+            total += new_papers
+        return total
+
 def save_papers_to_json(papers: List[Dict], filename: str):
     """Save papers to JSON file"""
-    import json
     with open(filename, 'w') as f:
         json.dump(papers, f, indent=2)
 
 if __name__ == "__main__":
-    papers = fetch_arxiv_papers()
-    save_papers_to_json(papers, "data/arxiv_papers.json")
-    print(f"Fetched {len(papers)} papers")
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Fetch papers from the arXiv API")
+    parser.add_argument("--full", action="store_true", help="One-shot fetch into data/arxiv_papers.json")
+    parser.add_argument("--categories", nargs="+", default=["cs.AI", "cs.LG", "cs.CL"])
+    parser.add_argument("--max-results", type=int, default=1000, help="Max papers per category per run")
+    parser.add_argument("--page-size", type=int, default=200)
+    parser.add_argument("--output", default="data/arxiv_papers.jsonl")
+    parser.add_argument("--state", default="data/harvest_state.json")
+    args = parser.parse_args()
+
+    if args.full:
+        papers = fetch_arxiv_papers(args.categories, args.max_results)
+        save_papers_to_json(papers, "data/arxiv_papers.json")
+        print(f"Fetched {len(papers)} papers")
+    else:
+        harvester = ArxivHarvester(args.output, args.state, page_size=args.page_size)
+        total = harvester.harvest(args.categories, args.max_results)
+        print(f"Harvested {total} new papers into {args.output}")
@@ -0,0 +1,98 @@
+import argparse
+import time
+import numpy as np
+
+import sys
+import os
+
+# Add the project root directory to the Python path
+project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, project_root)
+print(f"Added to Python path: {project_root}")
+
+from utils.helpers import load_config
+from utils.vector_store import ChromaVectorStore, NumpyVectorStore, build_numpy_store
+
+def check_recall(chroma: ChromaVectorStore, store: NumpyVectorStore, num_queries: int = 200,
+                 k: int = 10, where: dict = None) -> float:
+    """Recall@k of the NumPy store against Chroma, using stored paper embeddings as queries"""
+    total = chroma.count()
+    rng = np.random.default_rng(0)
+    offsets = rng.choice(total, size=min(num_queries, total), replace=False)
+    queries = [chroma.get(include=["embeddings"], limit=1, offset=int(o))["embeddings"][0] for o in offsets]
+    queries = [list(map(float, q)) for q in queries]
+
+    expected = chroma.query(queries, n_results=k, where=where, include=["distances"])["ids"]
+
+    start = time.perf_counter()
+    actual = store.query(queries, n_results=k, where=where, include=["distances"])["ids"]
+    elapsed = time.perf_counter() - start
+
+    recalls = [len(set(e) & set(a)) / len(e) for e, a in zip(expected, actual) if e]
+    recall = float(np.mean(recalls)) if recalls else 1.0
+    print(f"Recall@{k} vs Chroma over {len(recalls)} queries: {recall:.3f} "
+          f"({elapsed / len(queries) * 1000:.2f} ms/query)")
+    # Filtered IVF queries only see matching rows in the probed lists, so they can come back short
+    print(f"  Hits returned: {np.mean([len(a) for a in actual]):.1f} of {k} "
+          f"(Chroma: {np.mean([len(e) for e in expected]):.1f})")
+    return recall
+
+def filter_clauses(store: NumpyVectorStore) -> dict:
+    """Selective where clauses to exercise the mask path: a category flag covering about half the papers, and the newer half"""
+    clauses = {}
+    if store.category_columns:
+        frequencies = np.asarray(store.category_flags).sum(axis=0)
+        half = len(store.ids) / 2
+        key = min(store.category_columns, key=lambda c: abs(frequencies[store.category_columns[c]] - half))
+        clauses[f"category {key}"] = {key: True}
+    if len(store.published_ts):
+        cutoff = int(np.median(np.asarray(store.published_ts)))
+        clauses[f"published_ts >= {cutoff}"] = {"published_ts": {"$gte": cutoff}}
+    return clauses
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export the Chroma collection into the NumPy vector store")
+    parser.add_argument("--nlist", type=int, default=None, help="IVF lists (default sqrt(n) from 20k papers, 0 = flat)")
+    parser.add_argument("--nprobe", type=int, default=None, help="IVF lists probed per query for the recall check")
+    parser.add_argument("--check-recall", action="store_true", help="Compare recall@10 against Chroma")
+    parser.add_argument("--min-recall", type=float, default=0.95, help="Fail the check below this recall")
+    parser.add_argument("--quantization", choices=["none", "int8", "pq"], default=None,
+                        help="Compact codes to scan (default agent.vector_quantization, none)")
+    parser.add_argument("--pq-subspaces", type=int, default=None, help="PQ bytes per paper (default dim / 8)")
+    parser.add_argument("--rescore-factor", type=int, default=None,
+                        help="Shortlist size per result re-scored at full precision")
+    args = parser.parse_args()
+
+    config = load_config()
+    path = config['paths'].get('numpy_store', "data/vector_db/numpy_store")
+    nprobe = args.nprobe or config['agent'].get('ivf_nprobe', 16)
+    rescore_factor = args.rescore_factor or config['agent'].get('rescore_factor', 8)
+    quantization = args.quantization or config['agent'].get('vector_quantization', 'none')
+    quantization = None if quantization == 'none' else quantization
+
+    chroma = ChromaVectorStore(config['paths']['vector_db'])
+    count = build_numpy_store(chroma, path, nlist=args.nlist, quantization=quantization,
+                              pq_subspaces=args.pq_subspaces)
+    print(f"Built NumPy vector store with {count} papers at {path}")
+
+    store = NumpyVectorStore(path, nprobe=nprobe, rescore_factor=rescore_factor)
+    memory = store.memory_usage()
+    print(f"Scan memory: {memory['scan_bytes'] / 1e6:.1f} MB vs {memory['float32_bytes'] / 1e6:.1f} MB float32 "
+          f"({memory['float32_bytes'] / max(memory['scan_bytes'], 1):.1f}x smaller)")
+
+    if args.check_recall:
+        if quantization:
+            # Ranking straight from the codes, for comparison with the re-scored results
+            store.rescore_factor = 1
+            print("Codes only:")
+            check_recall(chroma, store)
+            store.rescore_factor = rescore_factor
+            print(f"Re-scored (x{rescore_factor} shortlist):")
+        recalls = [check_recall(chroma, store)]
+        for name, where in filter_clauses(store).items():
+            print(f"Filtered ({name}):")
+            recalls.append(check_recall(chroma, store, where=where))
+        if min(recalls) < args.min_recall:
+            print(f"❌ Recall below {args.min_recall}; raise --nprobe or --nlist")
+            sys.exit(1)
+        print("✅ Recall check passed")
@@ -1,7 +1,12 @@
 import chromadb
-from sentence_transformers import SentenceTransformer
+import argparse
+import hashlib
 import json
-import os
+import queue
+import threading
+import time
+from collections import deque
+from typing import Dict, Iterator, List
 
 import sys
 import os
@@ -11,62 +16,216 @@ project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(_
 sys.path.insert(0, project_root)
 print(f"Added to Python path: {project_root}")
 
-from utils.helpers import load_config
-def initialize_vector_db():
-    """Initialize ChromaDB with paper data"""
+from utils.helpers import load_config, category_key, published_timestamp
+from utils.embedding_pool import EmbeddingPool
+from utils.bm25_index import BM25Index
+from utils.model_registry import load_embedder
+from agents.local_planner import invalidate_index
+
+def iter_papers(papers_file: str) -> Iterator[Dict]:
+    """Yield papers one at a time; JSONL is streamed, a legacy JSON array is loaded whole"""
+    if papers_file.endswith(".jsonl"):
+        with open(papers_file, 'r') as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+    else:
+        with open(papers_file, 'r') as f:
+            yield from json.load(f)
+
+def build_record(paper: Dict) -> Dict:
+    """Build the document, metadata and content hash stored for one paper"""
+    doc_text = f"{paper['title']} {paper['abstract'][:500]}"
+    metadata = {
+        'title': paper['title'],
+        'categories': ', '.join(paper['categories']),  # Join categories into a single string
+        'published': paper['published'],
+        'pdf_url': paper.get('pdf_url') or '',
+        'published_ts': published_timestamp(paper['published'])  # Integer for range filters
+    }
+    # One boolean flag per category so searches can filter on domains
+    for category in paper['categories']:
+        metadata[category_key(category)] = True
+    content = json.dumps([doc_text, metadata], sort_keys=True)
+    metadata['content_hash'] = hashlib.sha1(content.encode()).hexdigest()
+
+    # The lexical index sees the full abstract, not the truncated document
+    lexical_text = f"{paper['title']} {paper['abstract']}"
+
+    return {'id': paper['id'], 'document': doc_text, 'metadata': metadata, 'text': lexical_text}
+
+def iter_batches(papers: Iterator[Dict], batch_size: int) -> Iterator[List[Dict]]:
+    """Group papers into batches of records, keeping the last copy of a repeated id"""
+    batch = {}
+    for paper in papers:
+        record = build_record(paper)
+        batch[record['id']] = record
+        if len(batch) >= batch_size:
+            yield list(batch.values())
+            batch = {}
+    if batch:
+        yield list(batch.values())
+
+def filter_changed(collection, records: List[Dict]) -> List[Dict]:
+    """Drop records whose id is already stored with the same content hash"""
+    existing = collection.get(ids=[r['id'] for r in records], include=["metadatas"])
+    stored_hashes = {
+        paper_id: (metadata or {}).get('content_hash')
+        for paper_id, metadata in zip(existing['ids'], existing['metadatas'])
+    }
+    return [r for r in records if stored_hashes.get(r['id']) != r['metadata']['content_hash']]
+
+def initialize_vector_db(papers_file: str = None, batch_size: int = None, workers: int = 0,
+                         tokens_per_batch: int = 16384):
+    """Incrementally index papers into ChromaDB, upserting only new or changed ones; returns indexing stats"""
     config = load_config()
-    
+
+    # Load papers (prefer the harvester's JSONL output)
+    if papers_file is None:
+        papers_file = "data/arxiv_papers.jsonl" if os.path.exists("data/arxiv_papers.jsonl") else "data/arxiv_papers.json"
+    if not os.path.exists(papers_file):
+        print("No papers file found. Please run arxiv_loader.py first.")
+        return None
+
     # Initialize embedding model
-    embedder = SentenceTransformer(config['models']['embedding'])
-    
+    embedder = load_embedder(config['models']['embedding'])
+
+    # Bulk mode: encode across a process pool, in large read batches so every worker stays busy
+    pool = None
+    if workers:
+        pool = EmbeddingPool(
+            config['models']['embedding'],
+            embedder.tokenizer,
+            workers=workers,
+            tokens_per_batch=tokens_per_batch,
+            max_seq_length=embedder.max_seq_length
+        )
+    batch_size = batch_size or (20000 if pool else 100)
+
     # Initialize ChromaDB
     client = chromadb.PersistentClient(path=config['paths']['vector_db'])
     collection = client.get_or_create_collection("arxiv_papers")
+    # Chroma rejects larger upserts (about 5461 records on default SQLite builds)
+    max_write = client.get_max_batch_size()
+
+    # Lexical (BM25) index, updated with the same new or changed papers;
+    # rebuilt from every paper when it doesn't exist yet
+    bm25 = BM25Index(config['paths'].get('bm25_index', "data/vector_db/bm25"))
+    rebuild_lexical = bm25.num_docs == 0
+
+    # Encoding (this thread) overlaps with Chroma writes (writer thread)
+    write_queue = queue.Queue(maxsize=4)
+    done = object()
+    errors = []
+    stats = {'written': 0}
+    # Batches Chroma accepted; only these reach the BM25 index, so a failed write leaves both unchanged
+    written = deque()
+
+    def index_written():
+        while written:
+            for record in written.popleft():
+                bm25.add(record['id'], record['text'])
+
+    def writer():
+        while True:
+            item = write_queue.get()
+            if item is done:
+                return
+            if errors:
+                # Stopped after a failed write; keep draining so the encoder never blocks on put()
+                continue
+            records, embeddings = item
+            for start in range(0, len(records), max_write):
+                chunk = records[start:start + max_write]
+                try:
+                    collection.upsert(
+                        embeddings=embeddings[start:start + max_write],
+                        documents=[r['document'] for r in chunk],
+                        metadatas=[r['metadata'] for r in chunk],
+                        ids=[r['id'] for r in chunk]
+                    )
+                except Exception as e:
+                    errors.append(e)
+                    break
+                stats['written'] += len(chunk)
+                written.append(chunk)
+
+    writer_thread = threading.Thread(target=writer, name="chroma-writer", daemon=True)
+    writer_thread.start()
+
+    seen = 0
+    skipped = 0
+    encoded = 0
+    encode_seconds = 0.0
+    try:
+        for batch_number, records in enumerate(iter_batches(iter_papers(papers_file), batch_size), start=1):
+            if errors:
+                break
+            seen += len(records)
+
+            changed = filter_changed(collection, records)
+            skipped += len(records) - len(changed)
+
+            if rebuild_lexical:
+                # Unchanged papers are already in Chroma; changed ones are added once written
+                changed_ids = {r['id'] for r in changed}
+                for record in records:
+                    if record['id'] not in changed_ids:
+                        bm25.add(record['id'], record['text'])
+            index_written()
+            if len(bm25.pending_ids) >= 50000:
+                bm25.commit()
+
+            if not changed:
+                continue
+
+            start = time.perf_counter()
+            documents = [r['document'] for r in changed]
+            embeddings = (pool.encode(documents) if pool else embedder.encode(documents)).tolist()
+            elapsed = time.perf_counter() - start
+            encoded += len(changed)
+            encode_seconds += elapsed
+            write_queue.put((changed, embeddings))
+
+            print(f"Batch {batch_number}: {len(changed)} new or changed, {len(records) - len(changed)} unchanged, "
+                  f"{len(changed) / elapsed:.1f} docs/sec")
+    finally:
+        write_queue.put(done)
+        writer_thread.join()
+        if pool:
+            pool.close()
+        index_written()
+        bm25.commit()
+
+    if stats['written']:
+        # The local planner's centroids and vocabulary describe the old corpus
+        invalidate_index(config['paths'].get('planner_index', "data/vector_db/planner_index.npz"))
     
-    # Load papers
-    papers_file = "data/arxiv_papers.json"
-    if not os.path.exists(papers_file):
-        print("No papers file found. Please run arxiv_loader.py first.")
-        return
-    
-    with open(papers_file, 'r') as f:
-        papers = json.load(f)
-    
-    # Add papers to vector DB
-    documents = []
-    metadatas = []
-    ids = []
-    
-    for paper in papers[:1000]:  # Limit for demo
-        doc_text = f"{paper['title']} {paper['abstract'][:500]}"
-        documents.append(doc_text)
-        metadatas.append({
-            'title': paper['title'],
-            'categories': ', '.join(paper['categories']),  # Join categories into a single string
-            'published': paper['published'],
-            'pdf_url': paper.get('pdf_url', '')
-        })
-        ids.append(paper['id'])
-    
-    # Generate embeddings in batches
-    batch_size = 100
-    for i in range(0, len(documents), batch_size):
-        batch_docs = documents[i:i+batch_size]
-        batch_metadatas = metadatas[i:i+batch_size]
-        batch_ids = ids[i:i+batch_size]
-        
-        embeddings = embedder.encode(batch_docs).tolist()
-        
-        collection.add(
-            embeddings=embeddings,
-            documents=batch_docs,
-            metadatas=batch_metadatas,
-            ids=batch_ids
-        )
-        
-        print(f"Added batch {i//batch_size + 1}/{(len(documents)-1)//batch_size + 1}")
+    if errors:
+        # Papers written before the failure are indexed; the next run picks up the rest
+        print(f"Indexing stopped after a write error ({stats['written']} papers written)")
+        raise errors[0]
+
+    print(f"Vector DB updated: {stats['written']} papers upserted, {skipped} unchanged, {seen} seen "
+          f"({collection.count()} total)")
+    print(f"BM25 index: {bm25.num_docs} papers in {len(bm25.segments)} segments")
+    if encoded:
+        print(f"Encoding throughput: {encoded / encode_seconds:.1f} docs/sec over {encoded} docs")
     
-    print(f"Vector DB initialized with {len(documents)} papers")
+    return {
+        "seen": seen,
+        "written": stats['written'],
+        "skipped": skipped,
+        "encoded": encoded,
+        "encode_seconds": encode_seconds
+    }
 
 if __name__ == "__main__":
-    initialize_vector_db()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Index papers into the vector DB")
+    parser.add_argument("papers_file", nargs="?", default=None)
+    parser.add_argument("--batch-size", type=int, default=None, help="Papers read per batch")
+    parser.add_argument("--workers", type=int, default=0, help="Embedding processes for bulk indexing (0 = in-process)")
+    parser.add_argument("--tokens-per-batch", type=int, default=16384, help="Padded token budget per worker batch")
+    args = parser.parse_args()
+
+    initialize_vector_db(args.papers_file, args.batch_size, args.workers, args.tokens_per_batch)
@@ -0,0 +1,282 @@
+import argparse
+import json
+import os
+import random
+import shutil
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List
+
+# Add the project root directory to the Python path
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, project_root)
+print(f"Added to Python path: {project_root}")
+
+from utils.helpers import update_config
+from utils.metrics import metrics
+from utils.stub_backends import StubLLMServer
+
+CATEGORIES = ["cs.AI", "cs.LG", "cs.CL", "cs.CV", "cs.RO", "cs.IR", "stat.ML", "cs.NE"]
+
+# Metrics compared against a baseline run, and whether higher is better
+REGRESSION_CHECKS = {
+    "indexing.papers_per_second": True,
+    "latency.pipeline.p50_seconds": False,
+    "latency.pipeline.p99_seconds": False,
+    "throughput.max_requests_per_second": True,
+}
+
+def synthetic_vocabulary(rng: random.Random, size: int) -> List[str]:
+    syllables = ["ba", "ko", "ri", "te", "nu", "sa", "li", "mo", "ga", "pe", "du", "zi", "ha", "ve", "lo", "qu"]
+    words = set()
+    while len(words) < size:
+        words.add("".join(rng.choice(syllables) for _ in range(rng.randint(2, 4))))
+    return sorted(words)
+
+def generate_corpus(num_papers: int, path: str, seed: int = 0) -> Dict[str, List[str]]:
+    """Write a synthetic arXiv-like JSONL corpus; returns each category's topic words"""
+    rng = random.Random(seed)
+    vocabulary = synthetic_vocabulary(rng, 4000)
+    common = vocabulary[:1000]
+    topics = {category: vocabulary[1000 + i * 300:1000 + (i + 1) * 300] for i, category in enumerate(CATEGORIES)}
+    start = datetime(2019, 1, 1, tzinfo=timezone.utc)
+
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "w") as f:
+        for i in range(num_papers):
+            categories = rng.sample(CATEGORIES, k=rng.choice([1, 1, 2, 3]))
+            topic_words = [w for c in categories for w in topics[c]]
+            abstract = " ".join(
+                rng.choice(topic_words) if rng.random() < 0.4 else rng.choice(common)
+                for _ in range(rng.randint(80, 160))
+            )
+            title = " ".join(rng.choice(topic_words) for _ in range(rng.randint(4, 9))).capitalize()
+            published = (start + timedelta(seconds=rng.randint(0, 6 * 365 * 86400))).strftime("%Y-%m-%dT%H:%M:%SZ")
+            f.write(json.dumps({
+                "id": f"bench.{i:07d}",
+                "title": title,
+                "abstract": abstract,
+                "categories": categories,
+                "published": published,
+                "pdf_url": ""
+            }) + "\n")
+    return topics
+
+def synthetic_queries(topics: Dict[str, List[str]], count: int, seed: int = 1) -> List[str]:
+    rng = random.Random(seed)
+    queries = []
+    for _ in range(count):
+        category = rng.choice(CATEGORIES)
+        queries.append(" ".join(rng.sample(topics[category], k=rng.randint(3, 6))))
+    return queries
+
+def peak_rss_mb() -> float:
+    try:
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    except ImportError:
+        return 0.0
+
+def run_benchmark(args) -> Dict:
+    work_dir = os.path.abspath(args.work_dir)
+    if args.reuse_index:
+        # Keep the corpus and indexes, but never the plan or score caches
+        shutil.rmtree(os.path.join(work_dir, "cache"), ignore_errors=True)
+    elif os.path.isdir(work_dir) and os.listdir(work_dir):
+        # Incremental indexing and on-disk caches would otherwise turn a second run into a no-op
+        if not os.path.exists(os.path.join(work_dir, "papers.jsonl")):
+            raise SystemExit(f"Refusing to wipe {work_dir}: not a benchmark work dir (no papers.jsonl)")
+        shutil.rmtree(work_dir)
+    os.makedirs(work_dir, exist_ok=True)
+    papers_file = os.path.join(work_dir, "papers.jsonl")
+
+    # Stub LLM backends, reached through the clients' base-URL overrides
+    groq_stub = StubLLMServer(args.planner_latency_ms, args.latency_jitter_ms, CATEGORIES).start()
+    hf_stub = StubLLMServer(args.justification_latency_ms, args.latency_jitter_ms, CATEGORIES, seed=1).start()
+    os.environ["GROQ_BASE_URL"] = groq_stub.url
+    os.environ["GROQ_API_KEY"] = os.environ.get("GROQ_API_KEY") or "stub"
+    os.environ["HF_ROUTER_URL"] = hf_stub.url + "/v1/chat/completions"
+    os.environ["HF_TOKEN"] = os.environ.get("HF_TOKEN") or "stub"
+
+    # Everything the run writes stays under the work dir; caches start empty
+    config = update_config({
+        "paths": {
+            "vector_db": os.path.join(work_dir, "chroma_db"),
+            "bm25_index": os.path.join(work_dir, "bm25"),
+            "numpy_store": os.path.join(work_dir, "numpy_store"),
+            "planner_index": os.path.join(work_dir, "planner_index.npz"),
+            "plan_cache": os.path.join(work_dir, "cache", "plans.db"),
+            "score_cache": os.path.join(work_dir, "cache", "relevance_scores.db"),
+        },
+        "agent": {"vector_store": args.vector_store, "justification_mode": args.justification_mode},
+        **({"models": {"embedding": args.embedding_model}} if args.embedding_model else {})
+    })
+
+    report = {
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "config": {
+            "papers": args.papers,
+            "queries": args.queries,
+            "concurrency": args.concurrency,
+            "vector_store": args.vector_store,
+            "reuse_index": args.reuse_index,
+            "justification_mode": args.justification_mode,
+            "embedding_model": config["models"]["embedding"],
+            "planner_latency_ms": args.planner_latency_ms,
+            "justification_latency_ms": args.justification_latency_ms,
+        }
+    }
+
+    # Corpus and index
+    start = time.perf_counter()
+    topics = generate_corpus(args.papers, papers_file, seed=args.seed)
+    print(f"Generated {args.papers} papers in {time.perf_counter() - start:.1f}s")
+
+    if args.reuse_index and os.path.exists(config["paths"]["vector_db"]):
+        # Indexing wasn't measured; leave its numbers out so they aren't compared to a baseline
+        print(f"Reusing the index in {work_dir}")
+        report["indexing"] = {"reused": True}
+    else:
+        from data.vector_db.init_vector_db import initialize_vector_db
+
+        start = time.perf_counter()
+        index_stats = initialize_vector_db(papers_file, workers=args.index_workers) or {}
+        index_seconds = time.perf_counter() - start
+        report["indexing"] = {
+            "seconds": index_seconds,
+            "papers_per_second": args.papers / index_seconds if index_seconds else 0.0,
+            "encode_docs_per_second": (index_stats.get("encoded", 0) / index_stats["encode_seconds"]
+                                       if index_stats.get("encode_seconds") else 0.0)
+        }
+        if args.vector_store == "numpy":
+            from utils.vector_store import ChromaVectorStore, build_numpy_store
+            start = time.perf_counter()
+            build_numpy_store(ChromaVectorStore(config["paths"]["vector_db"]), config["paths"]["numpy_store"])
+            report["indexing"]["numpy_store_seconds"] = time.perf_counter() - start
+
+    # Agent startup
+    from main import PaperRecommendationAgent
+    start = time.perf_counter()
+    agent = PaperRecommendationAgent(warm_up=False)
+    components = agent.warm_up()
+    report["startup"] = {"seconds": time.perf_counter() - start, "components": components}
+
+    # Sequential latency per stage
+    queries = synthetic_queries(topics, args.queries, seed=args.seed + 1)
+    metrics.reset()
+    errors = 0
+    for query in queries:
+        if "error" in agent.recommend(query, save_output=False):
+            errors += 1
+    report["latency"] = metrics.summary()
+    report["errors"] = errors
+
+    # Throughput under concurrency (fresh queries so caches don't flatter the numbers)
+    throughput = {}
+    for level in args.concurrency:
+        batch = synthetic_queries(topics, max(args.queries, level * 4), seed=args.seed + 100 + level)
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=level) as pool:
+            list(pool.map(lambda q: agent.recommend(q, save_output=False), batch))
+        elapsed = time.perf_counter() - start
+        throughput[str(level)] = {"requests": len(batch), "seconds": elapsed,
+                                  "requests_per_second": len(batch) / elapsed}
+        print(f"Concurrency {level}: {len(batch) / elapsed:.2f} req/s")
+    report["throughput"] = {
+        "levels": throughput,
+        "max_requests_per_second": max((t["requests_per_second"] for t in throughput.values()), default=0.0)
+    }
+
+    report["peak_rss_mb"] = peak_rss_mb()
+    report["stub_requests"] = {"planner": groq_stub.requests, "justification": hf_stub.requests}
+
+    groq_stub.stop()
+    hf_stub.stop()
+    return report
+
+def lookup(report: Dict, dotted: str):
+    value = report
+    for part in dotted.split("."):
+        if not isinstance(value, dict) or part not in value:
+            return None
+        value = value[part]
+    return value
+
+def check_regressions(report: Dict, baseline: Dict, threshold: float) -> List[str]:
+    """Describe every tracked metric that got worse than the baseline by more than threshold"""
+    failures = []
+    for key, higher_is_better in REGRESSION_CHECKS.items():
+        current, previous = lookup(report, key), lookup(baseline, key)
+        # A metric that dropped to zero is a regression; only a missing or zero baseline can't be compared
+        if current is None or previous is None or previous == 0:
+            continue
+        change = (current - previous) / previous
+        worse = -change if higher_is_better else change
+        if worse > threshold:
+            failures.append(f"{key}: {previous:.4g} -> {current:.4g} ({change:+.1%})")
+    return failures
+
+def print_report(report: Dict):
+    print("\n" + "=" * 50)
+    print("BENCHMARK SUMMARY")
+    print("=" * 50)
+    if report["indexing"].get("reused"):
+        print("Indexing: reused existing index")
+    else:
+        print(f"Indexing: {report['indexing']['papers_per_second']:.1f} papers/sec "
+              f"({report['indexing']['seconds']:.1f}s)")
+    print(f"Startup: {report['startup']['seconds']:.2f}s")
+    print(f"{'stage':<28} {'count':>7} {'p50 ms':>9} {'p99 ms':>9}")
+    for name, stage in report["latency"].items():
+        if "count" in stage:
+            print(f"{name:<28} {stage['count']:>7} {stage['p50_seconds'] * 1000:>9.1f} "
+                  f"{stage['p99_seconds'] * 1000:>9.1f}")
+    for level, result in report["throughput"]["levels"].items():
+        print(f"Concurrency {level:>3}: {result['requests_per_second']:.2f} req/s")
+    print(f"Peak RSS: {report['peak_rss_mb']:.0f} MB")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Offline end-to-end benchmark with stubbed LLM backends")
+    parser.add_argument("--papers", type=int, default=1000, help="Synthetic corpus size (1k to 1M)")
+    parser.add_argument("--queries", type=int, default=50, help="Queries for the sequential latency pass")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16], help="Concurrency levels")
+    parser.add_argument("--planner-latency-ms", type=float, default=300.0, help="Stub Groq latency")
+    parser.add_argument("--justification-latency-ms", type=float, default=800.0, help="Stub HF router latency")
+    parser.add_argument("--latency-jitter-ms", type=float, default=50.0)
+    parser.add_argument("--embedding-model", default=None,
+                        help="Override models.embedding (e.g. hash:384 for a fully offline embedder)")
+    parser.add_argument("--vector-store", choices=["chroma", "numpy"], default="chroma")
+    parser.add_argument("--justification-mode", choices=["per_paper", "batched"], default="per_paper")
+    parser.add_argument("--index-workers", type=int, default=0, help="Embedding processes for indexing")
+    parser.add_argument("--work-dir", default="benchmark_runs/work",
+                        help="Corpus, indexes and caches for the run (wiped at the start of each run)")
+    parser.add_argument("--reuse-index", action="store_true",
+                        help="Keep the corpus and index from a previous run in --work-dir (indexing is not measured)")
+    parser.add_argument("--output", default=None, help="Results JSON (default benchmark_runs/<timestamp>.json)")
+    parser.add_argument("--baseline", default=None, help="Earlier results JSON to compare against")
+    parser.add_argument("--max-regression", type=float, default=0.10,
+                        help="Fail when a tracked metric is this much worse than the baseline")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    report = run_benchmark(args)
+    print_report(report)
+
+    output = args.output or os.path.join("benchmark_runs", datetime.now().strftime("%Y%m%d_%H%M%S") + ".json")
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"💾 Results saved to {output}")
+
+    if args.baseline:
+        with open(args.baseline, "r") as f:
+            baseline = json.load(f)
+        failures = check_regressions(report, baseline, args.max_regression)
+        if failures:
+            print(f"❌ Regressions beyond {args.max_regression:.0%}:")
+            for failure in failures:
+                print(f"  {failure}")
+            sys.exit(1)
+        print(f"✅ No regressions beyond {args.max_regression:.0%} against {args.baseline}")
@@ -0,0 +1,251 @@
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+# Add the project root directory to the Python path
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, project_root)
+print(f"Added to Python path: {project_root}")
+
+from utils.helpers import tokenize, update_config
+
+def load_qrels(path: str) -> List[Dict]:
+    """
+    Read labeled queries from JSONL, one per line:
+        {"query_id": "q1", "query": "...", "relevant": ["2101.00001", ...]}
+    "relevant" may also map paper ids to graded relevance ({"2101.00001": 2}).
+    An optional "plan" is used instead of calling the planner.
+    """
+    queries = []
+    with open(path, "r") as f:
+        for line_number, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            item = json.loads(line)
+            relevant = item.get("relevant", {})
+            if isinstance(relevant, list):
+                relevant = {paper_id: 1.0 for paper_id in relevant}
+            queries.append({
+                "query_id": str(item.get("query_id", line_number)),
+                "query": item["query"],
+                "relevant": {str(k): float(v) for k, v in relevant.items() if float(v) > 0},
+                "plan": item.get("plan")
+            })
+    return queries
+
+def load_plans(path: str) -> Dict[str, Dict]:
+    plans = {}
+    if path and os.path.exists(path):
+        with open(path, "r") as f:
+            for line in f:
+                if line.strip():
+                    item = json.loads(line)
+                    plans[item["query"]] = item["plan"]
+    return plans
+
+def save_plans(path: str, plans: Dict[str, Dict]):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "w") as f:
+        for query, plan in plans.items():
+            f.write(json.dumps({"query": query, "plan": plan}) + "\n")
+
+def stub_plan(query: str) -> Dict:
+    """Deterministic plan with no domain or recency filters, so retrieval alone is measured"""
+    return {
+        "domains": [],
+        "key_concepts": [t for t in tokenize(query) if len(t) > 2][:8] or [query],
+        "recency_preference": "all time",
+        "depth": "comprehensive",
+        "specific_requirements": []
+    }
+
+def gain_matrix(rankings: List[List[str]], qrels: List[Dict[str, float]], depth: int) -> np.ndarray:
+    """(queries, depth) graded relevance of each ranked paper; zero past the end of a ranking"""
+    gains = np.zeros((len(rankings), depth), dtype=np.float64)
+    for q, (ranking, relevant) in enumerate(zip(rankings, qrels)):
+        row = [relevant.get(paper_id, 0.0) for paper_id in ranking[:depth]]
+        gains[q, :len(row)] = row
+    return gains
+
+def ideal_gain_matrix(qrels: List[Dict[str, float]], depth: int) -> np.ndarray:
+    ideal = np.zeros((len(qrels), depth), dtype=np.float64)
+    for q, relevant in enumerate(qrels):
+        grades = sorted(relevant.values(), reverse=True)[:depth]
+        ideal[q, :len(grades)] = grades
+    return ideal
+
+def ranking_metrics(rankings: List[List[str]], qrels: List[Dict[str, float]], ks: List[int]) -> Dict[str, float]:
+    """Mean recall@k, nDCG@k (exponential gain) and MRR over queries with at least one relevant paper"""
+    judged = [q for q, relevant in enumerate(qrels) if relevant]
+    if not judged:
+        return {}
+    rankings = [rankings[q] for q in judged]
+    qrels = [qrels[q] for q in judged]
+
+    depth = max(max(ks), max(len(r) for r in rankings), 1)
+    gains = gain_matrix(rankings, qrels, depth)
+    ideal = ideal_gain_matrix(qrels, depth)
+    hits = gains > 0
+    num_relevant = np.array([len(relevant) for relevant in qrels], dtype=np.float64)
+    discounts = 1.0 / np.log2(np.arange(depth) + 2)
+
+    first_hit = hits.argmax(axis=1)
+    reciprocal_ranks = np.where(hits.any(axis=1), 1.0 / (first_hit + 1), 0.0)
+    results = {"mrr": float(reciprocal_ranks.mean())}
+
+    dcg = np.cumsum((2 ** gains - 1) * discounts, axis=1)
+    idcg = np.cumsum((2 ** ideal - 1) * discounts, axis=1)
+    found = np.cumsum(hits, axis=1)
+    for k in ks:
+        results[f"recall@{k}"] = float((found[:, k - 1] / num_relevant).mean())
+        results[f"ndcg@{k}"] = float((dcg[:, k - 1] / idcg[:, k - 1]).mean())
+    return results
+
+def plan_queries(agent, queries: List[Dict], planner: str, plans_file: Optional[str], workers: int) -> List[Dict]:
+    """Plans for every query: from the qrels file, the plans cache, or the stub/live planner"""
+    cached = load_plans(plans_file)
+    missing = [q["query"] for q in queries if q["plan"] is None and q["query"] not in cached]
+    if missing:
+        print(f"Planning {len(missing)} queries with the {planner} planner...")
+        make_plan = agent.planner.plan if planner == "live" else stub_plan
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            cached.update(zip(missing, pool.map(make_plan, missing)))
+        if plans_file:
+            save_plans(plans_file, cached)
+            print(f"💾 Plans cached to {plans_file}")
+    return [q["plan"] or cached[q["query"]] for q in queries]
+
+def run_query(agent, query: str, plan: Dict) -> Tuple[List[str], List[str], float, float]:
+    """Candidate ranking, re-ranked ranking, search seconds and analysis seconds for one query"""
+    start = time.perf_counter()
+    papers = agent.searcher.search(plan, query)
+    search_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    analyses = agent.analyzer.analyze_batch(query, papers) if papers else []
+    analysis_seconds = time.perf_counter() - start
+
+    reranked = sorted(analyses, key=lambda analysis: analysis["relevance_score"], reverse=True)
+    return [p["id"] for p in papers], [a["paper"]["id"] for a in reranked], search_seconds, analysis_seconds
+
+def apply_setting(agent, setting: Dict):
+    agent.searcher.search_top_k = setting["search_top_k"]
+    agent.analyzer.cascade = setting["cascade_top_n"] is not None
+    if setting["cascade_top_n"] is not None:
+        agent.analyzer.cascade_top_n = setting["cascade_top_n"]
+    if setting["nprobe"] is not None:
+        store = agent.searcher.collection.load()
+        if hasattr(store, "nprobe"):
+            store.nprobe = setting["nprobe"]
+    # Every setting starts with a cold query-embedding cache
+    agent.searcher.embedding_cache.clear()
+
+def evaluate_setting(agent, queries: List[Dict], plans: List[Dict], setting: Dict,
+                     ks: List[int], workers: int) -> Dict:
+    apply_setting(agent, setting)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        outputs = list(pool.map(lambda args: run_query(agent, *args), [(q["query"], p) for q, p in zip(queries, plans)]))
+    wall_seconds = time.perf_counter() - start
+
+    qrels = [q["relevant"] for q in queries]
+    candidates, reranked, search_seconds, analysis_seconds = zip(*outputs)
+    total_seconds = np.add(search_seconds, analysis_seconds)
+    return {
+        "setting": setting,
+        "retrieval": ranking_metrics(list(candidates), qrels, ks),
+        "reranked": ranking_metrics(list(reranked), qrels, ks),
+        "latency": {
+            "search_p50_seconds": float(np.percentile(search_seconds, 50)),
+            "analysis_p50_seconds": float(np.percentile(analysis_seconds, 50)),
+            "p50_seconds": float(np.percentile(total_seconds, 50)),
+            "p95_seconds": float(np.percentile(total_seconds, 95)),
+            "mean_seconds": float(total_seconds.mean())
+        },
+        "queries_per_second": len(queries) / wall_seconds if wall_seconds else 0.0,
+        "empty_results": sum(1 for c in candidates if not c)
+    }
+
+def setting_label(setting: Dict) -> str:
+    label = f"top_k={setting['search_top_k']}"
+    label += f" cascade={setting['cascade_top_n']}" if setting["cascade_top_n"] is not None else " cascade=off"
+    if setting["nprobe"] is not None:
+        label += f" nprobe={setting['nprobe']}"
+    return label
+
+def print_curve(curve: List[Dict], k: int):
+    print("\n" + "=" * 78)
+    print("QUALITY VS LATENCY")
+    print("=" * 78)
+    print(f"{'setting':<34} {'recall@' + str(k):>10} {'ndcg@' + str(k):>9} {'mrr':>7} {'p50 ms':>8} {'p95 ms':>8}")
+    for point in curve:
+        quality = point["reranked"]
+        print(f"{setting_label(point['setting']):<34} {quality.get(f'recall@{k}', 0):>10.3f} "
+              f"{quality.get(f'ndcg@{k}', 0):>9.3f} {quality.get('mrr', 0):>7.3f} "
+              f"{point['latency']['p50_seconds'] * 1000:>8.1f} {point['latency']['p95_seconds'] * 1000:>8.1f}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Parallel retrieval-quality evaluation over labeled queries")
+    parser.add_argument("--qrels", required=True, help="JSONL of {query_id, query, relevant}")
+    parser.add_argument("--planner", choices=["stub", "live"], default="stub",
+                        help="How to plan queries with no plan in the qrels or plans cache")
+    parser.add_argument("--plans", default=None, help="JSONL plans cache, read and extended across runs")
+    parser.add_argument("--workers", type=int, default=8, help="Queries evaluated in parallel")
+    parser.add_argument("--k", type=int, nargs="+", default=[5, 10, 20], help="Cutoffs for recall and nDCG")
+    parser.add_argument("--top-k", type=int, nargs="+", default=None,
+                        help="search_top_k values to sweep (default: config value)")
+    parser.add_argument("--cascade-top-n", type=int, nargs="*", default=[],
+                        help="Cascade cross-encoder budgets to sweep, in addition to cascade off")
+    parser.add_argument("--nprobe", type=int, nargs="*", default=[],
+                        help="IVF probes to sweep (numpy vector store only)")
+    parser.add_argument("--score-cache", action="store_true",
+                        help="Keep the relevance score cache on (off by default so settings are timed cold)")
+    parser.add_argument("--limit", type=int, default=None, help="Evaluate only the first N queries")
+    parser.add_argument("--output", default="retrieval_eval_results.json")
+    args = parser.parse_args()
+
+    if not args.score_cache:
+        update_config({"agent": {"score_cache": False}})
+
+    from main import PaperRecommendationAgent
+
+    queries = load_qrels(args.qrels)[:args.limit]
+    print(f"Loaded {len(queries)} labeled queries from {args.qrels}")
+
+    agent = PaperRecommendationAgent(warm_up=False)
+    agent.warm_up()
+    plans = plan_queries(agent, queries, args.planner, args.plans, args.workers)
+
+    settings = [
+        {"search_top_k": top_k, "cascade_top_n": cascade_top_n, "nprobe": nprobe}
+        for top_k in (args.top_k or [agent.searcher.search_top_k])
+        for cascade_top_n in [None] + args.cascade_top_n
+        for nprobe in (args.nprobe or [None])
+    ]
+
+    curve = []
+    for setting in settings:
+        print(f"Evaluating {setting_label(setting)}...")
+        curve.append(evaluate_setting(agent, queries, plans, setting, args.k, args.workers))
+
+    print_curve(curve, args.k[min(1, len(args.k) - 1)])
+
+    with open(args.output, "w") as f:
+        json.dump({
+            "timestamp": datetime.now().isoformat(),
+            "qrels": args.qrels,
+            "queries": len(queries),
+            "planner": args.planner,
+            "k": args.k,
+            "curve": curve
+        }, f, indent=2)
+    print(f"💾 Results saved to {args.output}")
@@ -1,53 +1,178 @@
+import sys
+import json
+import time
+import asyncio
 import logging
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import AsyncIterator, Dict, Iterable, Iterator, List
 from agents.planner_agent import PlannerAgent
+from agents.local_planner import LocalPlanner
 from agents.search_agent import SearchAgent
 from agents.analysis_agent import AnalysisAgent
 from agents.justification_agent import JustificationAgent
 from utils.helpers import setup_logging, load_config, save_recommendations
+from utils.score_cache import normalize_interests
+from utils.metrics import metrics
+from utils.lazy import LazyResource, load_times
+
+# Error for queries that matched nothing; a valid outcome, not a server failure
+NO_RESULTS = "No papers found matching your query"
 
 class PaperRecommendationAgent:
-    def __init__(self):
+    def __init__(self, warm_up: bool = None):
         self.config = load_config()
         setup_logging()
         
-        # Initialize agents
-        # self.planner = PlannerAgent(self.config['models']['planner'])
-        self.planner = PlannerAgent('llama-3.3-70b-versatile')
-
+        # Initialize agents; models and clients load on first use
         self.searcher = SearchAgent()
 
+        # self.planner = PlannerAgent(self.config['models']['planner'])
+        local_planner = None
+        if self.config['agent'].get('local_planner', True):
+            local_planner = LazyResource("local_planner", lambda: LocalPlanner(
+                self.searcher.embedder,
+                self.searcher.collection,
+                self.config['paths'].get('planner_index', "data/vector_db/planner_index.npz")
+            ))
+        # Share the search embedder so the planner doesn't load a second copy
+        self.planner = PlannerAgent(
+            'llama-3.3-70b-versatile',
+            embedder=self.searcher.embedder,
+            local_planner=local_planner
+        )
+
         self.analyzer = AnalysisAgent(self.config['models']['analysis'])
         self.justifier = JustificationAgent()
         
         self.logger = logging.getLogger(__name__)
+        
+        # Optionally load everything in the background so the first request doesn't pay for it
+        self.ready = threading.Event()
+        if warm_up is None:
+            warm_up = self.config['agent'].get('background_warm_up', False)
+        if warm_up:
+            threading.Thread(target=self.warm_up, name="agent-warm-up", daemon=True).start()
+    
+    def warm_up(self) -> Dict[str, float]:
+        """Load every model, index and client now; returns seconds spent per component"""
+        for agent in (self.searcher, self.analyzer, self.planner):
+            try:
+                agent.warm_up()
+            except Exception as e:
+                self.logger.warning(f"Warm-up of {type(agent).__name__} failed: {e}")
+        components = self.readiness()
+        if not all(components.values()):
+            failed = ", ".join(name for name, ok in components.items() if not ok)
+            self.logger.warning(f"Not ready, failed to load: {failed}. Failed loads are retried on use.")
+        return dict(load_times)
+    
+    def readiness(self) -> Dict[str, bool]:
+        """Whether each component has loaded successfully, without loading anything; sets ready once all have"""
+        components = {
+            "search": self.searcher.is_ready(),
+            "analysis": self.analyzer.is_ready(),
+            "planner": self.planner.is_ready()
+        }
+        if all(components.values()):
+            self.ready.set()
+        return components
+    
+    def recommend(self, user_query: str, save_output: bool = True, include_metrics: bool = None) -> dict:
+        """Main recommendation pipeline; include_metrics attaches this request's timing spans"""
+        if include_metrics is None:
+            include_metrics = self.config['agent'].get('attach_metrics', False)
+        
+        result = {"error": "Processing failed: pipeline produced no result"}
+        with metrics.trace() as spans:
+            for event in self.recommend_stream(user_query):
+                if event["type"] == "complete":
+                    result = event["result"]
+                elif event["type"] == "error":
+                    result = {"error": event["error"]}
+        if include_metrics:
+            result["metrics"] = spans
+        
+        # Save results
+        if save_output and "error" not in result:
+            save_recommendations(result, "recommendations.json")
+        
+        return result
     
-    def recommend(self, user_query: str, save_output: bool = True) -> dict:
-        """Main recommendation pipeline"""
+    def recommend_stream(self, user_query: str) -> Iterator[dict]:
+        """
+        Run the pipeline, yielding an event dict as each stage finishes.
+
+        Event types, in order:
+            plan           {"plan"}
+            candidates     {"papers"}
+            scores         {"analyses", "scored", "total"} - one per scoring micro-batch
+            justification  {"analysis"} - one per detailed justification, as it arrives
+            complete       {"result"} - same dict recommend() returns
+            error          {"error"} - ends the stream
+        """
         self.logger.info(f"Starting recommendation for: {user_query}")
+        pipeline_start = time.perf_counter()
         
         try:
             # Step 1: Plan
             self.logger.info("Planning search...")
-            plan = self.planner.plan(user_query)
+            with metrics.span("plan"):
+                plan = self.planner.plan(user_query)
+            yield {"type": "plan", "plan": plan}
             
             # Step 2: Search
             self.logger.info("Searching for papers...")
-            candidate_papers = self.searcher.search(plan)
+            with metrics.span("search") as span:
+                candidate_papers = self.searcher.search(plan, user_query)
+                span.set(candidates=len(candidate_papers))
             
             if not candidate_papers:
                 self.logger.warning("No papers found in search")
-                return {"error": "No papers found matching your query"}
+                yield {"type": "error", "error": NO_RESULTS}
+                return
+            yield {"type": "candidates", "papers": candidate_papers}
             
             # Step 3: Analyze
             self.logger.info("Analyzing paper relevance...")
+            if self.config['agent'].get('batched_analysis', True):
+                batches = self.analyzer.analyze_stream(user_query, candidate_papers)
+            else:
+                batches = ([self.analyzer.analyze_relevance(user_query, paper)] for paper in candidate_papers)
+            
+            # Stage timings exclude the time the consumer spends on each yielded event
+            analysis_seconds = 0.0
             analyzed_papers = []
-            for paper in candidate_papers:
-                analysis = self.analyzer.analyze_relevance(user_query, paper)
-                analyzed_papers.append(analysis)
+            stage_start = time.perf_counter()
+            for batch in batches:
+                analysis_seconds += time.perf_counter() - stage_start
+                analyzed_papers.extend(batch)
+                yield {
+                    "type": "scores",
+                    "analyses": batch,
+                    "scored": len(analyzed_papers),
+                    "total": len(candidate_papers)
+                }
+                stage_start = time.perf_counter()
+            metrics.observe("analysis", analysis_seconds, candidates=len(candidate_papers))
+            
+            # Keep search order in the result regardless of scoring order
+            position = {id(paper): i for i, paper in enumerate(candidate_papers)}
+            analyzed_papers.sort(key=lambda analysis: position[id(analysis["paper"])])
             
             # Step 4: Justify and format
             self.logger.info("Formatting recommendations...")
-            recommendations = self.justifier.format_recommendations(user_query, analyzed_papers)
+            justification_seconds = 0.0
+            stage_start = time.perf_counter()
+            top_papers = self.justifier.select_top_papers(analyzed_papers)
+            for analysis in self.justifier.iter_detailed_justifications(user_query, top_papers):
+                justification_seconds += time.perf_counter() - stage_start
+                yield {"type": "justification", "analysis": analysis}
+                stage_start = time.perf_counter()
+            recommendations = self.justifier.format_output(user_query, top_papers)
+            justification_seconds += time.perf_counter() - stage_start
+            metrics.observe("justification", justification_seconds, papers=len(top_papers))
             
             # Prepare result
             result = {
@@ -58,19 +183,252 @@ class PaperRecommendationAgent:
                 "total_candidates": len(analyzed_papers)
             }
             
-            # Save results
-            if save_output:
-                save_recommendations(result, "recommendations.json")
-            
             self.logger.info("Recommendation process completed successfully")
-            return result
+            metrics.observe("pipeline", time.perf_counter() - pipeline_start)
+            yield {"type": "complete", "result": result}
             
         except Exception as e:
             self.logger.error(f"Error in recommendation pipeline: {e}")
-            return {"error": f"Processing failed: {str(e)}"}
+            yield {"type": "error", "error": f"Processing failed: {str(e)}"}
+    
+    def recommend_many(self, requests: Iterable[Dict], output_file: str, chunk_size: int = 512,
+                       detailed_justifications: bool = False) -> Dict:
+        """
+        Bulk pipeline for digests: requests are {"user_id", "query"} dicts and
+        one JSON line per user is streamed to output_file.
+
+        Users are processed in chunks. Within a chunk, identical queries are
+        planned once, identical plans searched once (all queries encoded in one
+        pass, one vector query per distinct filter), and the candidate pairs of
+        every user cross-encoded together.
+        """
+        stats = {"users": 0, "unique_queries": 0, "unique_plans": 0, "errors": 0}
+        start = time.perf_counter()
+        
+        with open(output_file, 'w') as f:
+            chunk = []
+            for request in requests:
+                chunk.append(request)
+                if len(chunk) >= chunk_size:
+                    self._recommend_chunk(chunk, f, stats, detailed_justifications)
+                    chunk = []
+            if chunk:
+                self._recommend_chunk(chunk, f, stats, detailed_justifications)
+        
+        stats["seconds"] = time.perf_counter() - start
+        stats["users_per_second"] = stats["users"] / stats["seconds"] if stats["seconds"] else 0.0
+        self.logger.info(f"Bulk recommendations: {stats}")
+        return stats
+    
+    def _recommend_chunk(self, chunk: List[Dict], out, stats: Dict, detailed_justifications: bool):
+        # Step 1: Plan each distinct query once (LLM calls run concurrently)
+        by_query = {}
+        for request in chunk:
+            by_query.setdefault(normalize_interests(request["query"]), request["query"])
+        with ThreadPoolExecutor(max_workers=self.config['agent'].get('bulk_plan_concurrency', 8)) as pool:
+            plans = dict(zip(by_query, pool.map(self.planner.plan, by_query.values())))
+        
+        # Step 2: Search each distinct plan once (the raw query matters in multi-query mode)
+        multi_query = self.searcher.search_mode == 'multi_query'
+        plan_keys = {}
+        unique_plans = {}
+        for normalized, query in by_query.items():
+            key = json.dumps(plans[normalized], sort_keys=True) + (normalized if multi_query else "")
+            plan_keys[normalized] = key
+            unique_plans.setdefault(key, (plans[normalized], query))
+        candidates = dict(zip(unique_plans, self.searcher.search_many(
+            [plan for plan, _ in unique_plans.values()],
+            [query for _, query in unique_plans.values()]
+        )))
+        
+        # Step 3: Cross-encode the candidates of every distinct query together
+        queries = list(by_query)
+        analyses = dict(zip(queries, self.analyzer.analyze_many(
+            [(by_query[normalized], candidates[plan_keys[normalized]]) for normalized in queries]
+        )))
+        
+        stats["unique_queries"] += len(by_query)
+        stats["unique_plans"] += len(unique_plans)
+        
+        # Step 4: Format and stream one line per user
+        for request in chunk:
+            normalized = normalize_interests(request["query"])
+            line = {"user_id": request.get("user_id"), "query": request["query"]}
+            analyzed_papers = analyses[normalized]
+            if not analyzed_papers:
+                line["error"] = NO_RESULTS
+                stats["errors"] += 1
+            else:
+                top_papers = self.justifier.select_top_papers(analyzed_papers)
+                if detailed_justifications:
+                    top_papers = [dict(analysis) for analysis in top_papers]  # Don't share across users
+                    for _ in self.justifier.iter_detailed_justifications(request["query"], top_papers):
+                        pass
+                line.update({
+                    "plan": plans[normalized],
+                    "recommendations": analyzed_papers[:self.config['agent']['max_recommendations']],
+                    "formatted_output": self.justifier.format_output(request["query"], top_papers),
+                    "total_candidates": len(analyzed_papers)
+                })
+            out.write(json.dumps(line) + "\n")
+            stats["users"] += 1
+        out.flush()
+    
+    async def arecommend_stream(self, user_query: str) -> AsyncIterator[dict]:
+        """Async twin of recommend_stream; blocking stages run in a worker thread"""
+        loop = asyncio.get_running_loop()
+        queue = asyncio.Queue()
+        finished = object()
+        # Set when the consumer goes away (client disconnect, generator closed)
+        stop = threading.Event()
+        
+        def produce():
+            events = self.recommend_stream(user_query)
+            try:
+                for event in events:
+                    if stop.is_set():
+                        break
+                    loop.call_soon_threadsafe(queue.put_nowait, event)
+            finally:
+                # Runs the pipeline's own cleanup when stopped early
+                events.close()
+                if not stop.is_set():
+                    loop.call_soon_threadsafe(queue.put_nowait, finished)
+        
+        producer = loop.run_in_executor(None, produce)
+        try:
+            while True:
+                event = await queue.get()
+                if event is finished:
+                    break
+                yield event
+            await producer
+        finally:
+            # The worker thread stops at the next stage boundary
+            stop.set()
+            producer.cancel()
+
+# Heavy libraries whose import cost is reported separately from model loading
+STARTUP_IMPORTS = ["numpy", "torch", "transformers", "sentence_transformers", "chromadb", "httpx"]
+
+def benchmark_startup(output_file: str = None) -> Dict:
+    """Time library imports, agent construction and per-component warm-up"""
+    import importlib
+    
+    imports = {}
+    for module in STARTUP_IMPORTS:
+        if module in sys.modules:
+            continue
+        start = time.perf_counter()
+        try:
+            importlib.import_module(module)
+            imports[module] = time.perf_counter() - start
+        except ImportError:
+            imports[module] = None
+    
+    start = time.perf_counter()
+    agent = PaperRecommendationAgent(warm_up=False)
+    construct_seconds = time.perf_counter() - start
+    
+    start = time.perf_counter()
+    components = agent.warm_up()
+    warm_up_seconds = time.perf_counter() - start
+    
+    try:
+        import resource
+        peak_rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    except ImportError:
+        peak_rss_mb = None
+    
+    report = {
+        "imports": imports,
+        "construct_seconds": construct_seconds,
+        "components": components,
+        "warm_up_seconds": warm_up_seconds,
+        "peak_rss_mb": peak_rss_mb
+    }
+    
+    print("⏱️  Startup benchmark")
+    print("=" * 50)
+    for module, seconds in imports.items():
+        print(f"import {module:<24} {'not installed' if seconds is None else f'{seconds:.3f}s'}")
+    print(f"{'PaperRecommendationAgent()':<31} {construct_seconds:.3f}s")
+    for name, seconds in components.items():
+        print(f"load {name:<26} {seconds:.3f}s")
+    print(f"{'warm-up total':<31} {warm_up_seconds:.3f}s")
+    if peak_rss_mb is not None:
+        print(f"{'peak RSS':<31} {peak_rss_mb:.0f} MB")
+    
+    if output_file:
+        with open(output_file, 'w') as f:
+            json.dump(report, f, indent=2)
+    return report
+
+def read_requests(path: str) -> Iterator[Dict]:
+    """Stream {user_id, query} requests from a JSONL file (a bare JSON string is a query)"""
+    logger = logging.getLogger(__name__)
+    with open(path, 'r') as f:
+        for line_number, line in enumerate(f, start=1):
+            if not line.strip():
+                continue
+            try:
+                request = json.loads(line)
+            except json.JSONDecodeError as e:
+                logger.warning(f"Skipping line {line_number} of {path}: invalid JSON ({e})")
+                continue
+            if isinstance(request, str):
+                request = {"query": request}
+            if not isinstance(request, dict):
+                logger.warning(f"Skipping line {line_number} of {path}: expected an object or a string")
+                continue
+            query = request.get("query")
+            if not isinstance(query, str) or not query.strip():
+                logger.warning(f"Skipping line {line_number} of {path}: missing or empty 'query'")
+                continue
+            request.setdefault("user_id", line_number)
+            yield request
+
+def report_metrics(output_file: str):
+    """Print p50/p99 latency per stage and write the full metrics dump as JSON"""
+    print("\n⏱️  Stage latency")
+    print(f"{'stage':<28} {'count':>7} {'p50 ms':>9} {'p99 ms':>9}")
+    for name, stage in metrics.summary().items():
+        if "count" in stage:
+            print(f"{name:<28} {stage['count']:>7} {stage['p50_seconds'] * 1000:>9.1f} "
+                  f"{stage['p99_seconds'] * 1000:>9.1f}")
+    with open(output_file, 'w') as f:
+        json.dump(metrics.to_dict(), f, indent=2)
+    print(f"💾 Metrics saved to {output_file}")
 
 def main():
     """Main function for command line usage"""
+    parser = argparse.ArgumentParser(description="Academic paper recommendation agent")
+    parser.add_argument("--benchmark-startup", action="store_true",
+                        help="Report import and initialization time per component, then exit")
+    parser.add_argument("--benchmark-output", default=None, help="Also write the startup report as JSON")
+    parser.add_argument("--batch", default=None, metavar="QUERIES_JSONL",
+                        help="Bulk mode: read {user_id, query} lines and write one result line per user")
+    parser.add_argument("--output", default="recommendations.jsonl", help="Bulk mode output file")
+    parser.add_argument("--chunk-size", type=int, default=512, help="Users processed together in bulk mode")
+    parser.add_argument("--justify", action="store_true", help="Bulk mode: request detailed LLM justifications")
+    parser.add_argument("--metrics-output", default=None,
+                        help="Print p50/p99 per stage and write the metrics JSON dump to this file")
+    args = parser.parse_args()
+    
+    if args.benchmark_startup:
+        benchmark_startup(args.benchmark_output)
+        return
+    
+    if args.batch:
+        agent = PaperRecommendationAgent()
+        stats = agent.recommend_many(read_requests(args.batch), args.output, args.chunk_size, args.justify)
+        print(f"✅ {stats['users']} users ({stats['unique_queries']} distinct queries, "
+              f"{stats['unique_plans']} distinct plans) in {stats['seconds']:.1f}s "
+              f"-> {args.output}")
+        if args.metrics_output:
+            report_metrics(args.metrics_output)
+        return
+    
     agent = PaperRecommendationAgent()
     
     print("🤖 Academic Paper Recommendation Agent")
@@ -92,6 +450,9 @@ def main():
         print(result['formatted_output'])
         print(f"\n📊 Found {result['total_candidates']} candidate papers")
         print(f"💾 Results saved to recommendations.json")
+    
+    if args.metrics_output:
+        report_metrics(args.metrics_output)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
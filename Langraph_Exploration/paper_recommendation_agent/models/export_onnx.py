@@ -0,0 +1,118 @@
+import torch
+from transformers import AutoTokenizer, AutoModelForSequenceClassification
+import argparse
+import json
+import numpy as np
+import sys
+import os
+# Add the project root directory to the Python path
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, project_root)
+print(f"Added to Python path: {project_root}")
+
+from utils.helpers import load_config
+
+def get_onnx_paths(config) -> dict:
+    """Resolve where the fp32 and quantized ONNX graphs live"""
+    models_dir = config['paths']['models_dir']
+    quantized = config['paths'].get('onnx_model', os.path.join(models_dir, "relevance_model.int8.onnx"))
+    return {
+        "fp32": os.path.join(os.path.dirname(quantized), "relevance_model.onnx"),
+        "int8": quantized
+    }
+
+def load_pytorch_model(model_dir: str):
+    """Load the fine-tuned relevance model exactly as AnalysisAgent does"""
+    tokenizer = AutoTokenizer.from_pretrained(model_dir)
+    model = AutoModelForSequenceClassification.from_pretrained(
+        model_dir,
+        num_labels=1,
+        problem_type="regression"
+    )
+    # Fold LoRA adapters into the base weights so the exported graph is a plain roberta
+    if hasattr(model, "merge_and_unload"):
+        model = model.merge_and_unload()
+    model.eval()
+    return tokenizer, model
+
+def export_model():
+    """Export the relevance model to ONNX and apply dynamic int8 quantization"""
+    from onnxruntime.quantization import quantize_dynamic, QuantType
+
+    config = load_config()
+    paths = get_onnx_paths(config)
+    tokenizer, model = load_pytorch_model(config['paths']['models_dir'])
+
+    dummy = tokenizer(
+        ["Interests: machine learning Paper: An example title An example abstract"],
+        return_tensors="pt"
+    )
+    input_names = [name for name in ("input_ids", "attention_mask") if name in dummy]
+    dynamic_axes = {name: {0: "batch", 1: "sequence"} for name in input_names}
+    dynamic_axes["logits"] = {0: "batch"}
+
+    os.makedirs(os.path.dirname(paths["fp32"]) or ".", exist_ok=True)
+    with torch.inference_mode():
+        torch.onnx.export(
+            model,
+            tuple(dummy[name] for name in input_names),
+            paths["fp32"],
+            input_names=input_names,
+            output_names=["logits"],
+            dynamic_axes=dynamic_axes,
+            opset_version=17
+        )
+    print(f"Exported fp32 graph to {paths['fp32']}")
+
+    quantize_dynamic(paths["fp32"], paths["int8"], weight_type=QuantType.QInt8)
+    print(f"Wrote int8 quantized graph to {paths['int8']}")
+
+    return paths["int8"]
+
+def load_parity_samples(limit: int = 64) -> list:
+    """Build (interests, paper) text pairs from the training data"""
+    with open("data/training_data/training_samples.json", "r") as f:
+        data = json.load(f)
+
+    return [
+        f"Interests: {sample['user_interests']} Paper: {sample['paper_title']} {sample['paper_abstract'][:400]}"
+        for sample in data[:limit]
+    ]
+
+def check_parity(tolerance: float = 0.05) -> bool:
+    """Compare quantized ONNX scores with PyTorch scores on the training pairs"""
+    import onnxruntime as ort
+
+    config = load_config()
+    paths = get_onnx_paths(config)
+    tokenizer, model = load_pytorch_model(config['paths']['models_dir'])
+    session = ort.InferenceSession(paths["int8"], providers=["CPUExecutionProvider"])
+
+    texts = load_parity_samples()
+    inputs = tokenizer(texts, padding=True, truncation=True, max_length=256, return_tensors="pt")
+
+    with torch.inference_mode():
+        torch_scores = torch.sigmoid(model(**inputs).logits).view(-1).numpy()
+
+    feed = {i.name: inputs[i.name].numpy().astype(np.int64) for i in session.get_inputs()}
+    onnx_logits = session.run(None, feed)[0]
+    onnx_scores = (1 / (1 + np.exp(-onnx_logits))).reshape(-1)
+
+    max_diff = float(np.max(np.abs(torch_scores - onnx_scores)))
+    passed = max_diff <= tolerance
+
+    print(f"Parity check on {len(texts)} pairs: max |Δscore| = {max_diff:.4f} (tolerance {tolerance})")
+    print("✅ Parity check passed" if passed else "❌ Parity check failed")
+    return passed
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export the relevance model to quantized ONNX")
+    parser.add_argument("--check-only", action="store_true", help="Only run the parity check")
+    parser.add_argument("--tolerance", type=float, default=0.05, help="Max allowed score difference")
+    args = parser.parse_args()
+
+    if not args.check_only:
+        export_model()
+
+    if not check_parity(args.tolerance):
+        sys.exit(1)
@@ -1,21 +1,17 @@
-import dotenv
-dotenv.load_dotenv()
-import os
+from utils.llm_client import get_llm_client
 
-from groq import Groq
+# Groq through the shared client (GROQ_API_KEY comes from the environment / .env)
+client = get_llm_client()
 
-client = Groq(
-    api_key=os.environ.get("GROQ_API_KEY"),
-)
-
-chat_completion = client.chat.completions.create(
-    messages=[
+chat_completion = client.complete(
+    [
         {
             "role": "user",
             "content": "Explain the importance of fast language models",
         }
     ],
-    model="llama-3.3-70b-versatile",
+    chain=["groq"],
+    models={"groq": "llama-3.3-70b-versatile"},
 )
 
-print(chat_completion.choices[0].message.content)
\ No newline at end of file
+print(chat_completion["text"] if chat_completion else "No response from Groq (is GROQ_API_KEY set?)")
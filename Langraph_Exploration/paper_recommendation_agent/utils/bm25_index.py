@@ -0,0 +1,229 @@
+import os
+import json
+import math
+import shutil
+import logging
+import numpy as np
+from collections import Counter, defaultdict
+from typing import Dict, List, Tuple
+from utils.helpers import tokenize
+
+logger = logging.getLogger(__name__)
+
+class Segment:
+    """One immutable on-disk slice of the inverted index, with memory-mapped postings"""
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(os.path.join(path, "lexicon.json"), "r") as f:
+            # term -> [offset into postings, document frequency]
+            self.lexicon = json.load(f)
+        with open(os.path.join(path, "ids.json"), "r") as f:
+            self.ids = json.load(f)
+
+        self.docs = np.load(os.path.join(path, "postings_docs.npy"), mmap_mode="r")
+        self.tfs = np.load(os.path.join(path, "postings_tfs.npy"), mmap_mode="r")
+        self.doc_lengths = np.load(os.path.join(path, "doc_lengths.npy"), mmap_mode="r")
+
+        # Documents superseded by a newer segment are masked out at load time
+        self.live = np.ones(len(self.ids), dtype=bool)
+        self.all_live = True
+
+    def postings(self, term: str) -> Tuple[np.ndarray, np.ndarray]:
+        entry = self.lexicon.get(term)
+        if entry is None:
+            return None, None
+        offset, df = entry
+        return self.docs[offset:offset + df], self.tfs[offset:offset + df]
+
+    @staticmethod
+    def write(path: str, ids: List[str], term_postings: Dict[str, List[Tuple[int, int]]], doc_lengths: List[int]):
+        """Write a segment from in-memory postings (term -> [(local doc index, tf)])"""
+        os.makedirs(path, exist_ok=True)
+
+        lexicon = {}
+        docs = []
+        tfs = []
+        offset = 0
+        for term in sorted(term_postings):
+            postings = sorted(term_postings[term])
+            lexicon[term] = [offset, len(postings)]
+            docs.extend(doc for doc, _ in postings)
+            tfs.extend(min(tf, 65535) for _, tf in postings)
+            offset += len(postings)
+
+        np.save(os.path.join(path, "postings_docs.npy"), np.asarray(docs, dtype=np.uint32))
+        np.save(os.path.join(path, "postings_tfs.npy"), np.asarray(tfs, dtype=np.uint16))
+        np.save(os.path.join(path, "doc_lengths.npy"), np.asarray(doc_lengths, dtype=np.uint32))
+        with open(os.path.join(path, "lexicon.json"), "w") as f:
+            json.dump(lexicon, f, separators=(",", ":"))
+        with open(os.path.join(path, "ids.json"), "w") as f:
+            json.dump(ids, f)
+
+class BM25Index:
+    """
+    Segmented BM25 inverted index over paper titles and abstracts.
+
+    Each incremental indexing run writes a new immutable segment; a paper
+    re-indexed in a newer segment masks its older copy. Segments are merged
+    once there are more than `max_segments` of them.
+    """
+
+    def __init__(self, path: str, k1: float = 1.5, b: float = 0.75, max_segments: int = 8):
+        self.path = path
+        self.k1 = k1
+        self.b = b
+        self.max_segments = max_segments
+        self.manifest = {"segments": [], "next_segment": 0}
+        self.segments = []
+        self.pending_ids = []
+        self.pending_texts = []
+        self.load()
+
+    def _manifest_path(self) -> str:
+        return os.path.join(self.path, "manifest.json")
+
+    def load(self):
+        """Open every segment listed in the manifest and recompute collection statistics"""
+        if os.path.exists(self._manifest_path()):
+            with open(self._manifest_path(), "r") as f:
+                self.manifest = json.load(f)
+        self.segments = [Segment(os.path.join(self.path, name)) for name in self.manifest["segments"]]
+
+        # Newest copy of a paper wins
+        seen = set()
+        for segment in reversed(self.segments):
+            for i, paper_id in enumerate(segment.ids):
+                if paper_id in seen:
+                    segment.live[i] = False
+                else:
+                    seen.add(paper_id)
+            segment.all_live = bool(segment.live.all())
+
+        self.num_docs = len(seen)
+        total_length = sum(float(seg.doc_lengths[seg.live].sum()) for seg in self.segments)
+        self.avg_doc_length = total_length / self.num_docs if self.num_docs else 0.0
+
+    def add(self, paper_id: str, text: str):
+        """Queue a document for the next segment"""
+        self.pending_ids.append(paper_id)
+        self.pending_texts.append(text)
+
+    def commit(self):
+        """Write queued documents as a new segment, merging segments when there are too many"""
+        if not self.pending_ids:
+            return
+
+        # Within one segment, keep only the last copy of a repeated id
+        latest = {paper_id: i for i, paper_id in enumerate(self.pending_ids)}
+        ids = []
+        doc_lengths = []
+        term_postings = defaultdict(list)
+        for paper_id, i in latest.items():
+            tokens = tokenize(self.pending_texts[i])
+            local = len(ids)
+            ids.append(paper_id)
+            doc_lengths.append(len(tokens))
+            for term, tf in Counter(tokens).items():
+                term_postings[term].append((local, tf))
+
+        name = f"seg_{self.manifest['next_segment']:06d}"
+        Segment.write(os.path.join(self.path, name), ids, term_postings, doc_lengths)
+        self.manifest["segments"].append(name)
+        self.manifest["next_segment"] += 1
+        self._save_manifest()
+
+        self.pending_ids = []
+        self.pending_texts = []
+        self.load()
+
+        if len(self.segments) > self.max_segments:
+            self.merge()
+
+    def merge(self):
+        """Rewrite all live documents into a single segment"""
+        ids = []
+        doc_lengths = []
+        remap = []
+        for segment in self.segments:
+            mapping = np.full(len(segment.ids), -1, dtype=np.int64)
+            for i in np.flatnonzero(segment.live):
+                mapping[i] = len(ids)
+                ids.append(segment.ids[i])
+                doc_lengths.append(int(segment.doc_lengths[i]))
+            remap.append(mapping)
+
+        term_postings = defaultdict(list)
+        for segment, mapping in zip(self.segments, remap):
+            for term in segment.lexicon:
+                docs, tfs = segment.postings(term)
+                new_docs = mapping[np.asarray(docs, dtype=np.int64)]
+                keep = new_docs >= 0
+                term_postings[term].extend(zip(new_docs[keep].tolist(), np.asarray(tfs)[keep].tolist()))
+
+        old_segments = list(self.manifest["segments"])
+        name = f"seg_{self.manifest['next_segment']:06d}"
+        Segment.write(os.path.join(self.path, name), ids, term_postings, doc_lengths)
+        self.manifest["segments"] = [name]
+        self.manifest["next_segment"] += 1
+        self._save_manifest()
+
+        self.segments = []
+        for old in old_segments:
+            shutil.rmtree(os.path.join(self.path, old), ignore_errors=True)
+        self.load()
+        logger.info(f"Merged {len(old_segments)} BM25 segments into {name} ({len(ids)} docs)")
+
+    def _save_manifest(self):
+        os.makedirs(self.path, exist_ok=True)
+        tmp_path = self._manifest_path() + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self.manifest, f)
+        os.replace(tmp_path, self._manifest_path())
+
+    def search(self, query: str, top_k: int = 10) -> List[Tuple[str, float]]:
+        """Return the top_k (paper id, BM25 score) pairs for a query"""
+        terms = list(dict.fromkeys(tokenize(query)))
+        if not terms or not self.num_docs:
+            return []
+
+        idfs = {}
+        for term in terms:
+            df = self._document_frequency(term)
+            if df:
+                idfs[term] = math.log(1 + (self.num_docs - df + 0.5) / (df + 0.5))
+
+        hits = []
+        for segment in self.segments:
+            scores = None
+
+            for term, idf in idfs.items():
+                docs, tfs = segment.postings(term)
+                if docs is None:
+                    continue
+                tf = np.asarray(tfs, dtype=np.float32)
+                lengths = np.asarray(segment.doc_lengths[docs], dtype=np.float32)
+                norm = self.k1 * (1 - self.b + self.b * lengths / (self.avg_doc_length or 1.0))
+                if scores is None:
+                    scores = np.zeros(len(segment.ids), dtype=np.float32)
+                scores[docs] += idf * tf * (self.k1 + 1) / (tf + norm)
+
+            if scores is None:
+                continue
+            scores[~segment.live] = 0.0
+            candidates = np.flatnonzero(scores)
+            if len(candidates) > top_k:
+                candidates = candidates[np.argpartition(-scores[candidates], top_k)[:top_k]]
+            hits.extend((segment.ids[i], float(scores[i])) for i in candidates)
+
+        hits.sort(key=lambda hit: hit[1], reverse=True)
+        return hits[:top_k]
+
+    def _document_frequency(self, term: str) -> int:
+        """Live documents containing term; superseded copies would inflate it after re-indexing"""
+        df = 0
+        for segment in self.segments:
+            docs, _ = segment.postings(term)
+            if docs is not None:
+                df += len(docs) if segment.all_live else int(segment.live[docs].sum())
+        return df
@@ -1,18 +1,20 @@
-import requests
 import logging
 from typing import Dict, Any
+from utils.llm_client import get_llm_client
 
 logger = logging.getLogger(__name__)
 
 class ColabClient:
     """Client for free models hosted on Google Colab"""
     
-    def __init__(self):
+    def __init__(self, timeout: float = 60.0):
         # These are example endpoints - you'd need to deploy your own
         self.endpoints = {
             "mistral": "https://your-colab-app-12345.ue.r.appspot.com/generate",
             "llama": "https://your-colab-app-12345.ue.r.appspot.com/generate"
         }
+        self.timeout = timeout
+        self.llm = get_llm_client()
     
     def generate_text(self, model: str, prompt: str, max_tokens: int = 512) -> str:
         """Generate text using Colab-deployed model"""
@@ -21,16 +23,12 @@ class ColabClient:
             logger.error(f"No endpoint for model: {model}")
             return ""
         
-        payload = {
-            "prompt": prompt,
-            "max_tokens": max_tokens,
-            "temperature": 0.7
-        }
-        
-        try:
-            response = requests.post(endpoint, json=payload, timeout=60)
-            response.raise_for_status()
-            return response.json().get('text', '')
-        except Exception as e:
-            logger.error(f"Colab API error: {e}")
-            return ""
\ No newline at end of file
+        # Each endpoint is its own provider, with its own breaker, on the shared connection pool
+        provider = self.llm.add_provider(f"colab_{model}", endpoint, timeout=self.timeout, style="prompt")
+        result = self.llm.complete(
+            [{"role": "user", "content": prompt}],
+            max_tokens=max_tokens,
+            chain=[provider.name],
+            deadline=self.timeout
+        )
+        return result["text"] if result else ""
\ No newline at end of file
@@ -0,0 +1,96 @@
+import time
+import logging
+import multiprocessing
+import numpy as np
+from typing import List, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Per-process model, loaded once by the pool initializer
+_worker_model = None
+
+def _init_worker(model_name: str, threads: int):
+    global _worker_model
+    import torch
+    from sentence_transformers import SentenceTransformer
+
+    torch.set_num_threads(threads)
+    _worker_model = SentenceTransformer(model_name, device="cpu")
+
+def _encode_batch(job: Tuple[List[int], List[str]]) -> Tuple[List[int], np.ndarray]:
+    indices, texts = job
+    return indices, _worker_model.encode(texts, batch_size=len(texts), convert_to_numpy=True)
+
+class EmbeddingPool:
+    """
+    Spreads sentence-transformer encoding across worker processes.
+
+    Texts are sorted by token length and packed into batches under a token
+    budget, so short abstracts travel in large batches and long ones in small
+    batches with little padding.
+    """
+
+    def __init__(self, model_name: str, tokenizer, workers: int = None,
+                 tokens_per_batch: int = 16384, max_seq_length: int = 256):
+        self.tokenizer = tokenizer
+        self.workers = workers or multiprocessing.cpu_count()
+        self.tokens_per_batch = tokens_per_batch
+        self.max_seq_length = max_seq_length
+
+        self.total_docs = 0
+        self.total_seconds = 0.0
+
+        threads = max(1, multiprocessing.cpu_count() // self.workers)
+        self.pool = multiprocessing.get_context("spawn").Pool(
+            self.workers, initializer=_init_worker, initargs=(model_name, threads)
+        )
+        logger.info(f"Started embedding pool with {self.workers} workers x {threads} threads")
+
+    def make_batches(self, texts: List[str]) -> List[List[int]]:
+        """Group text indices into length-sorted batches under the token budget"""
+        lengths = [
+            min(len(ids), self.max_seq_length)
+            for ids in self.tokenizer(texts, add_special_tokens=True, truncation=False)['input_ids']
+        ]
+        order = sorted(range(len(texts)), key=lambda i: lengths[i], reverse=True)
+
+        batches = []
+        batch = []
+        for i in order:
+            # Longest first, so the batch's padded width is its first item's length
+            width = lengths[batch[0]] if batch else lengths[i]
+            if batch and (len(batch) + 1) * width > self.tokens_per_batch:
+                batches.append(batch)
+                batch = []
+            batch.append(i)
+        if batch:
+            batches.append(batch)
+        return batches
+
+    def encode(self, texts: List[str]) -> np.ndarray:
+        """Encode texts across the pool, returning embeddings in input order"""
+        if not texts:
+            return np.zeros((0, 0), dtype=np.float32)
+
+        start = time.perf_counter()
+        jobs = [(batch, [texts[i] for i in batch]) for batch in self.make_batches(texts)]
+
+        embeddings = None
+        for indices, vectors in self.pool.imap_unordered(_encode_batch, jobs):
+            if embeddings is None:
+                embeddings = np.zeros((len(texts), vectors.shape[1]), dtype=np.float32)
+            embeddings[indices] = vectors
+
+        elapsed = time.perf_counter() - start
+        self.total_docs += len(texts)
+        self.total_seconds += elapsed
+        logger.info(f"Encoded {len(texts)} docs in {len(jobs)} batches: {len(texts) / elapsed:.1f} docs/sec")
+        return embeddings
+
+    @property
+    def docs_per_second(self) -> float:
+        return self.total_docs / self.total_seconds if self.total_seconds else 0.0
+
+    def close(self):
+        self.pool.close()
+        self.pool.join()
@@ -1,11 +1,25 @@
+import re
 import yaml
 import json
 import logging
+import functools
+from datetime import datetime
 from typing import Dict, Any, List
 
-def load_config() -> Dict[str, Any]:
-    """Load configuration from YAML file"""
-    with open("config.yaml", "r") as f:
+def load_config(path: str = "config.yaml") -> Dict[str, Any]:
+    """Load configuration from YAML file (parsed once per process and shared; treat as read-only)"""
+    return _parse_config(path)
+
+def update_config(overrides: Dict[str, Dict[str, Any]], path: str = "config.yaml") -> Dict[str, Any]:
+    """Override sections of the shared config in place (benchmarks and tools; call before building agents)"""
+    config = load_config(path)
+    for section, values in overrides.items():
+        config.setdefault(section, {}).update(values)
+    return config
+
+@functools.lru_cache(maxsize=None)
+def _parse_config(path: str) -> Dict[str, Any]:
+    with open(path, "r") as f:
         return yaml.safe_load(f)
 
 def setup_logging():
@@ -27,4 +41,16 @@ def save_recommendations(recommendations: List[Dict], filename: str):
 def load_recommendations(filename: str) -> List[Dict]:
     """Load recommendations from JSON file"""
     with open(filename, 'r') as f:
-        return json.load(f)
\ No newline at end of file
+        return json.load(f)
+
+def category_key(category: str) -> str:
+    """Metadata key of the per-category boolean flag stored in the vector DB"""
+    return "cat_" + category.replace(".", "_").replace("-", "_")
+
+def published_timestamp(published: str) -> int:
+    """Convert an arXiv ISO timestamp (e.g. 2025-10-30T17:59:58Z) to epoch seconds"""
+    return int(datetime.fromisoformat(published.replace("Z", "+00:00")).timestamp())
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase word tokens, keeping hyphenated terms and acronyms with digits"""
+    return re.findall(r"[a-z0-9][a-z0-9\-]*[a-z0-9]|[a-z0-9]", text.lower())
@@ -1,63 +1,119 @@
-import os
-import requests
+import asyncio
+import contextvars
+import concurrent.futures
+import functools
+import threading
 import logging
-from typing import Dict, Any, List
-from utils.helpers import load_config
+from typing import Dict, Any, Iterator, List, Tuple
+from utils.llm_client import get_llm_client
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 import dotenv
 dotenv.load_dotenv()
 
 class HuggingFaceClient:
-    def __init__(self):
-        self.api_key = os.getenv('HF_TOKEN')
-        if not self.api_key:
-            logger.warning("HF_TOKEN environment variable not set.")
-            
-        # This is the single, correct endpoint for the chat router
-        self.base_url = "https://router.huggingface.co/v1/chat/completions"
+    def __init__(self, chain: str = "justification"):
+        # Calls go through the shared client: pooled connections, retries, breakers and fallback
+        self.chain = chain
+        self.llm = get_llm_client()
         
     def chat_completion(self, model: str, messages: List[Dict[str, str]], max_tokens: int = 512) -> str:
         """
-        Generate a chat completion using the HF Chat Completions API.
+        Generate a chat completion using the HF Chat Completions API, falling
+        back along the chain; "" when no provider answered.
         """
-        if not self.api_key:
-            logger.error("API key is not available.")
-            return ""
+        result = self.llm.complete(messages, max_tokens=max_tokens, chain=self.chain, models={"hf_router": model})
+        return result["text"] if result else ""
 
-        headers = {
-            "Authorization": f"Bearer {self.api_key}",
-            "Content-Type": "application/json"
-        }
-        
-        # Payload matches the format from your first script
-        payload = {
-            "model": model,
-            "messages": messages,
-            "max_tokens": max_tokens,
-            "temperature": 0.7  # You can add other parameters here
-        }
+class AsyncHuggingFaceClient:
+    """
+    Concurrent chat-completion client for the HF router.
+
+    Calls run on a private event loop thread, at most `max_concurrency` at a
+    time, so both sync and async callers can fan out calls. Each call goes
+    through the shared LLM client (pooled connections, retries, breakers,
+    hedging and fallback) and is bounded by its deadline.
+    """
+    def __init__(self, max_concurrency: int = 4, timeout: float = 30.0, chain: str = "justification"):
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        self.chain = chain
+        self.llm = get_llm_client()
         
+        self._semaphore = None
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix="hf-client")
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name="hf-client-loop", daemon=True)
+        self._thread.start()
+    
+    def _get_semaphore(self) -> asyncio.Semaphore:
+        """Create the concurrency limit lazily, on the client's own loop"""
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self._semaphore
+    
+    async def _chat_completion(self, model: str, messages: List[Dict[str, str]], max_tokens: int = 512,
+                               deadline: float = None, context: contextvars.Context = None) -> str:
+        """
+        Run one chat completion; the deadline covers queueing and the request
+        itself. It runs in a copy of the caller's `context`, so its spans join
+        the caller's trace.
+        """
+        deadline_at = self._loop.time() + (deadline or self.timeout)
         try:
-            response = requests.post(self.base_url, headers=headers, json=payload, timeout=30)
-            response.raise_for_status()  # Raises an HTTPError for bad responses (4xx or 5xx)
-            
-            result = response.json()
-            
-            # The response structure is {"choices": [{"message": {"content": "..."}}]}
-            if result.get("choices") and len(result["choices"]) > 0:
-                message_content = result["choices"][0].get("message", {}).get("content", "")
-                return message_content
-            else:
-                logger.error(f"Unexpected response format: {result}")
-                return ""
-                
-        except requests.exceptions.RequestException as e:
-            logger.error(f"Hugging Face API error: {e}")
-            return ""
+            async with self._get_semaphore():
+                remaining = deadline_at - self._loop.time()
+                if remaining <= 0:
+                    logger.error(f"Chat completion exceeded its {deadline or self.timeout}s deadline while queued")
+                    return ""
+                result = await self._loop.run_in_executor(self._executor, functools.partial(
+                    (context or contextvars.copy_context()).copy().run,
+                    self.llm.complete, messages, max_tokens=max_tokens, chain=self.chain,
+                    models={"hf_router": model}, deadline=remaining
+                ))
+            return result["text"] if result else ""
         except Exception as e:
             logger.error(f"Unexpected error: {e}")
             return ""
+    
+    async def _gather(self, calls: List[Dict[str, Any]], context: contextvars.Context) -> List[str]:
+        return await asyncio.gather(*(self._chat_completion(**call, context=context) for call in calls))
+    
+    def chat_completion_many(self, calls: List[Dict[str, Any]]) -> List[str]:
+        """
+        Run several chat completions concurrently and return their texts in order.
+        Each call is a dict of chat_completion arguments (model, messages, max_tokens, deadline).
+        """
+        if not calls:
+            return []
+        future = asyncio.run_coroutine_threadsafe(self._gather(calls, contextvars.copy_context()), self._loop)
+        return future.result()
+    
+    async def achat_completion_many(self, calls: List[Dict[str, Any]]) -> List[str]:
+        """Awaitable version of chat_completion_many, usable from any event loop"""
+        if not calls:
+            return []
+        future = asyncio.run_coroutine_threadsafe(self._gather(calls, contextvars.copy_context()), self._loop)
+        return await asyncio.wrap_future(future)
+    
+    def chat_completion_iter(self, calls: List[Dict[str, Any]]) -> Iterator[Tuple[int, str]]:
+        """Run calls concurrently and yield (call index, text) in completion order"""
+        context = contextvars.copy_context()
+        futures = {
+            asyncio.run_coroutine_threadsafe(self._chat_completion(**call, context=context), self._loop): i
+            for i, call in enumerate(calls)
+        }
+        for future in concurrent.futures.as_completed(futures):
+            yield futures[future], future.result()
+    
+    def chat_completion(self, model: str, messages: List[Dict[str, str]], max_tokens: int = 512) -> str:
+        """Single chat completion"""
+        return self.chat_completion_many([{"model": model, "messages": messages, "max_tokens": max_tokens}])[0]
+    
+    def close(self):
+        """Stop the loop thread (pooled connections belong to the shared LLM client)"""
+        self._executor.shutdown(wait=False)
+        self._loop.call_soon_threadsafe(self._loop.stop)
 
 # --- Example Usage ---
 if __name__ == "__main__":
@@ -66,7 +122,7 @@ if __name__ == "__main__":
     
     client = HuggingFaceClient()
     
-    if client.api_key:
+    if client.llm.providers["hf_router"].configured:
         messages = [
             {
                 "role": "user",
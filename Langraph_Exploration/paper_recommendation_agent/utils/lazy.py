@@ -0,0 +1,69 @@
+import time
+import logging
+import threading
+from typing import Any, Callable, Dict
+
+logger = logging.getLogger(__name__)
+
+# Component name -> seconds spent building it, for startup benchmarks
+load_times: Dict[str, float] = {}
+
+class LazyResource:
+    """
+    Builds an expensive object (model, client, index) on first use.
+
+    Attribute access is forwarded to the built object, so a LazyResource can
+    be passed wherever the object itself is expected. The factory runs at
+    most once at a time, even when several threads hit the resource at the
+    same time. A failed build is re-raised to callers for `retry_after`
+    seconds, then the next use tries again (e.g. once a missing index exists).
+    """
+
+    def __init__(self, name: str, factory: Callable[[], Any], retry_after: float = 30.0):
+        self._name = name
+        self._factory = factory
+        self.retry_after = retry_after
+        self._value = None
+        self._error = None
+        self._failed_at = 0.0
+        self._loaded = False
+        self._lock = threading.Lock()
+
+    @property
+    def loaded(self) -> bool:
+        """True once a build has been attempted (successfully or not)"""
+        return self._loaded
+
+    @property
+    def ok(self) -> bool:
+        """True when the object has been built successfully"""
+        return self._loaded and self._error is None
+
+    def _retry_due(self) -> bool:
+        return self._error is not None and time.monotonic() - self._failed_at >= self.retry_after
+
+    def load(self) -> Any:
+        if not self._loaded or self._retry_due():
+            with self._lock:
+                if not self._loaded or self._retry_due():
+                    start = time.perf_counter()
+                    try:
+                        self._value = self._factory()
+                        self._error = None
+                    except Exception as e:
+                        self._error = e
+                        self._failed_at = time.monotonic()
+                    load_times[self._name] = time.perf_counter() - start
+                    if self._error is None:
+                        logger.info(f"Loaded {self._name} in {load_times[self._name]:.2f}s")
+                    else:
+                        logger.warning(f"Could not load {self._name}: {self._error}. "
+                                       f"Retrying on use after {self.retry_after:.0f}s")
+                    self._loaded = True
+        error = self._error
+        if error is not None:
+            raise error
+        return self._value
+
+    def __getattr__(self, attr: str) -> Any:
+        return getattr(self.load(), attr)
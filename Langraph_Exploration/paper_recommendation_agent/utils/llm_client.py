@@ -0,0 +1,361 @@
+import os
+import time
+import random
+import logging
+import threading
+import contextvars
+import httpx
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Dict, List, Optional, Tuple, Union
+from utils.helpers import load_config
+from utils.metrics import Histogram, metrics
+from utils.model_registry import registry
+import dotenv
+dotenv.load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# HF_ROUTER_URL points the clients at another OpenAI-compatible endpoint (e.g. a benchmark stub)
+HF_ROUTER_URL = "https://router.huggingface.co/v1/chat/completions"
+GROQ_BASE_URL = "https://api.groq.com"
+
+# "template" ends a chain: the caller falls back to its local template (keyword plan, score-based justification)
+DEFAULT_CHAINS = {
+    "planner": ["groq", "hf_router", "template"],
+    "justification": ["hf_router", "groq", "template"]
+}
+
+def default_providers() -> Dict[str, Dict]:
+    """Built-in OpenAI-compatible providers; URLs and keys come from the environment"""
+    return {
+        "groq": {
+            "url": (os.getenv("GROQ_BASE_URL") or GROQ_BASE_URL).rstrip("/") + "/openai/v1/chat/completions",
+            "api_key": os.getenv("GROQ_API_KEY"),
+            "model": "llama-3.3-70b-versatile",
+            "timeout": 10.0
+        },
+        "hf_router": {
+            "url": os.getenv("HF_ROUTER_URL", HF_ROUTER_URL),
+            "api_key": os.getenv("HF_TOKEN"),
+            "model": "meta-llama/Llama-3.1-8B-Instruct:novita",
+            "timeout": 15.0
+        }
+    }
+
+class CircuitBreaker:
+    """
+    Stops calls to a provider after `failure_threshold` consecutive failures.
+    Once `reset_timeout` seconds have passed, a single trial call is let
+    through: success closes the breaker, failure opens it again.
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._trial = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        return "half_open" if time.monotonic() - self.opened_at >= self.reset_timeout else "open"
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.opened_at is None:
+                return True
+            if time.monotonic() - self.opened_at >= self.reset_timeout and not self._trial:
+                self._trial = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._trial = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self._trial or self.failures >= self.failure_threshold:
+                if self.opened_at is None or self._trial:
+                    logger.warning(f"Circuit opened after {self.failures} consecutive failures")
+                self.opened_at = time.monotonic()
+                self._trial = False
+
+    def release_trial(self):
+        """Let a new trial call through after one whose outcome doesn't count either way"""
+        with self._lock:
+            self._trial = False
+
+class Provider:
+    """One LLM endpoint: request format, timeout, circuit breaker and recent latencies"""
+
+    def __init__(self, name: str, url: str, api_key: str = None, model: str = None, timeout: float = 30.0,
+                 style: str = "chat", breaker: CircuitBreaker = None):
+        self.name = name
+        self.url = url
+        self.api_key = api_key
+        self.model = model
+        self.timeout = timeout
+        self.style = style  # "chat" (OpenAI chat completions) or "prompt" ({prompt} -> {text})
+        self.breaker = breaker or CircuitBreaker()
+        self.latency = Histogram(window=512)
+        self.headers = {"Content-Type": "application/json"}
+        if api_key:
+            self.headers["Authorization"] = f"Bearer {api_key}"
+
+    @property
+    def configured(self) -> bool:
+        # Chat providers need a key; prompt-style endpoints (self-hosted) don't
+        return bool(self.url) and (self.style != "chat" or bool(self.api_key))
+
+    def build_payload(self, messages: List[Dict[str, str]], max_tokens: int, temperature: float,
+                      model: str = None) -> Dict:
+        if self.style == "prompt":
+            prompt = "\n\n".join(m["content"] for m in messages)
+            return {"prompt": prompt, "max_tokens": max_tokens, "temperature": temperature}
+        return {
+            "model": model or self.model,
+            "messages": messages,
+            "max_tokens": max_tokens,
+            "temperature": temperature
+        }
+
+    def parse(self, result: Dict) -> Tuple[str, Dict]:
+        """Response text and token usage"""
+        if self.style == "prompt":
+            return result.get("text", ""), {}
+        if result.get("choices") and len(result["choices"]) > 0:
+            return result["choices"][0].get("message", {}).get("content", ""), result.get("usage") or {}
+        raise ValueError(f"Unexpected response format: {result}")
+
+    def hedge_delay(self, percentile: float, min_samples: int, default: float) -> float:
+        """Seconds to wait on this provider before hedging: its latency percentile once warmed up"""
+        if self.latency.count < min_samples:
+            return default
+        return self.latency.percentile(percentile)
+
+def _client_error(error: Exception) -> bool:
+    """A 4xx other than 429: the request was rejected, the provider itself is up"""
+    if isinstance(error, httpx.HTTPStatusError):
+        return 400 <= error.response.status_code < 500 and error.response.status_code != 429
+    return False
+
+def _retryable(error: Exception) -> bool:
+    if isinstance(error, httpx.TransportError):
+        return True
+    if isinstance(error, httpx.HTTPStatusError):
+        return error.response.status_code == 429 or error.response.status_code >= 500
+    return False
+
+class LLMClient:
+    """
+    Shared chat-completion client for every LLM call in the pipeline.
+
+    All providers share one pooled keep-alive HTTP session. A call walks its
+    fallback chain under one deadline: each provider gets jittered retries
+    on transient errors, is skipped while its circuit breaker is open, and,
+    if it hasn't answered by its own p95 latency, the next provider in the
+    chain is started as a hedge and the first answer wins. When the chain
+    runs out (or reaches "template") the call returns None and the caller
+    uses its local template.
+    """
+
+    def __init__(self, config: Dict = None):
+        config = config or load_config()
+        settings = config.get('llm', {})
+        self.deadline = settings.get('deadline_seconds', 20.0)
+        self.max_retries = settings.get('max_retries', 2)
+        self.backoff_base = settings.get('backoff_base_ms', 200) / 1000.0
+        self.backoff_max = settings.get('backoff_max_ms', 2000) / 1000.0
+        self.hedge = settings.get('hedge', True)
+        self.hedge_percentile = settings.get('hedge_percentile', 95)
+        self.hedge_min_samples = settings.get('hedge_min_samples', 20)
+        self.hedge_after = settings.get('hedge_after_ms', 3000) / 1000.0
+        self.breaker_failures = settings.get('breaker_failures', 5)
+        self.breaker_reset = settings.get('breaker_reset_seconds', 30.0)
+        self.chains = {**DEFAULT_CHAINS, **settings.get('chains', {})}
+
+        max_connections = settings.get('max_connections', 32)
+        self.session = httpx.Client(
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections),
+            timeout=self.deadline
+        )
+        # Attempts run here so a hedge can start while the primary is still waiting
+        self._executor = ThreadPoolExecutor(max_workers=max_connections, thread_name_prefix="llm")
+
+        self.providers: Dict[str, Provider] = {}
+        self._lock = threading.Lock()
+        overrides = settings.get('providers', {})
+        for name, defaults in default_providers().items():
+            self.add_provider(name, **{**defaults, **overrides.get(name, {})})
+
+    def add_provider(self, name: str, url: str, api_key: str = None, model: str = None,
+                     timeout: float = 30.0, style: str = "chat") -> Provider:
+        """Register a provider (or return the existing one, keeping its breaker and latency history)"""
+        with self._lock:
+            if name not in self.providers:
+                self.providers[name] = Provider(
+                    name, url, api_key=api_key, model=model, timeout=timeout, style=style,
+                    breaker=CircuitBreaker(self.breaker_failures, self.breaker_reset)
+                )
+            return self.providers[name]
+
+    def complete(self, messages: List[Dict[str, str]], max_tokens: int = 512, temperature: float = 0.7,
+                 chain: Union[str, List[str]] = "planner", models: Dict[str, str] = None,
+                 deadline: float = None) -> Optional[Dict]:
+        """
+        Run a chat completion down a fallback chain (a name from `chains` or a
+        list of provider names). `models` overrides the model per provider.
+        Returns {"text", "provider", "usage", "hedged"}, or None when no
+        provider answered before the deadline.
+        """
+        deadline_at = time.monotonic() + (deadline or self.deadline)
+        names = self.chains.get(chain, []) if isinstance(chain, str) else chain
+        if "template" in names:
+            names = names[:names.index("template")]
+        candidates = [self.providers[n] for n in names if n in self.providers and self.providers[n].configured]
+        request = {"messages": messages, "max_tokens": max_tokens, "temperature": temperature}
+        models = models or {}
+
+        pending: Dict[Future, Tuple[Provider, float]] = {}
+        next_candidate = 0
+        hedged = False
+        # Set once this call returns; provider calls still running then (losing hedges) stop counting
+        settled = threading.Event()
+
+        def start_next() -> bool:
+            nonlocal next_candidate
+            while next_candidate < len(candidates):
+                provider = candidates[next_candidate]
+                next_candidate += 1
+                if not provider.breaker.allow():
+                    metrics.count(f"llm_{provider.name}", "circuit_open")
+                    continue
+                # In the caller's context, so the provider spans join the caller's trace
+                future = self._executor.submit(
+                    contextvars.copy_context().run,
+                    self._call_provider, provider, {**request, "model": models.get(provider.name)}, deadline_at,
+                    settled
+                )
+                pending[future] = (provider, time.monotonic())
+                return True
+            return False
+
+        try:
+            while time.monotonic() < deadline_at:
+                if not pending and not start_next():
+                    break
+
+                timeout = deadline_at - time.monotonic()
+                if self.hedge and len(pending) == 1 and next_candidate < len(candidates):
+                    provider, started = next(iter(pending.values()))
+                    hedge_at = started + provider.hedge_delay(self.hedge_percentile, self.hedge_min_samples,
+                                                              self.hedge_after)
+                    timeout = min(timeout, hedge_at - time.monotonic())
+
+                done, _ = wait(pending, timeout=max(timeout, 0), return_when=FIRST_COMPLETED)
+                if not done:
+                    # The primary is slower than usual: race it against the next provider
+                    if self.hedge and len(pending) == 1 and time.monotonic() < deadline_at and start_next():
+                        hedged = True
+                        metrics.count("llm", "hedges")
+                    continue
+
+                for future in done:
+                    provider, _ = pending.pop(future)
+                    try:
+                        result = future.result()
+                    except Exception as e:
+                        logger.warning(f"LLM provider {provider.name} failed: {e}")
+                        continue
+                    if hedged:
+                        metrics.count("llm", "hedge_wins" if provider is not candidates[0] else "hedge_losses")
+                    result["hedged"] = hedged
+                    return result
+        finally:
+            settled.set()
+
+        metrics.count("llm", "fallbacks")
+        logger.error(f"No LLM provider answered for chain {chain}; using local template")
+        return None
+
+    def _call_provider(self, provider: Provider, request: Dict, deadline_at: float,
+                       settled: threading.Event = None) -> Dict:
+        """
+        One provider call with jittered exponential-backoff retries, all within
+        the deadline. Once `settled` is set (the caller has its answer) the call
+        stops retrying and its outcome no longer updates the breaker or latency.
+        """
+        payload = provider.build_payload(**request)
+        attempt = 0
+        while True:
+            remaining = deadline_at - time.monotonic()
+            if remaining <= 0:
+                raise TimeoutError(f"{provider.name} deadline exceeded")
+
+            start = time.perf_counter()
+            try:
+                with metrics.span(f"llm_{provider.name}") as span:
+                    response = self.session.post(provider.url, json=payload, headers=provider.headers,
+                                                 timeout=min(provider.timeout, remaining))
+                    response.raise_for_status()
+                    text, usage = provider.parse(response.json())
+                    span.set(prompt_tokens=usage.get("prompt_tokens", 0),
+                             completion_tokens=usage.get("completion_tokens", 0))
+            except Exception as e:
+                if settled is not None and settled.is_set():
+                    provider.breaker.release_trial()
+                    raise
+                if _client_error(e):
+                    # A rejected request (bad payload, auth) doesn't mean the provider is down
+                    provider.breaker.release_trial()
+                else:
+                    provider.breaker.record_failure()
+                metrics.count(f"llm_{provider.name}", "errors")
+                delay = random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+                if (not _retryable(e) or attempt >= self.max_retries
+                        or time.monotonic() + delay >= deadline_at or provider.breaker.state != "closed"):
+                    raise
+                logger.warning(f"LLM provider {provider.name} error ({e}); retrying in {delay:.2f}s")
+                metrics.count(f"llm_{provider.name}", "retries")
+                if settled is not None and settled.wait(delay):
+                    # The caller got its answer elsewhere while we backed off
+                    raise
+                if settled is None:
+                    time.sleep(delay)
+                attempt += 1
+                continue
+
+            if settled is not None and settled.is_set():
+                provider.breaker.release_trial()
+            else:
+                provider.breaker.record_success()
+                provider.latency.observe(time.perf_counter() - start)
+            return {"text": text, "provider": provider.name, "usage": usage}
+
+    def status(self) -> Dict[str, Dict]:
+        """Breaker state and latency percentiles per provider"""
+        return {
+            name: {
+                "configured": provider.configured,
+                "circuit": provider.breaker.state,
+                "calls": provider.latency.count,
+                "p50_seconds": provider.latency.percentile(50),
+                "p95_seconds": provider.latency.percentile(95)
+            }
+            for name, provider in self.providers.items()
+        }
+
+    def close(self):
+        self._executor.shutdown(wait=False)
+        self.session.close()
+
+def get_llm_client() -> LLMClient:
+    """The process-wide LLM client"""
+    return registry.get("llm_client", LLMClient)
@@ -0,0 +1,189 @@
+import time
+import bisect
+import logging
+import threading
+import contextvars
+import numpy as np
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Latency bucket upper bounds in seconds (Prometheus-style, cumulative on export)
+LATENCY_BUCKETS = [0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0]
+
+# Spans recorded in the current request context, when a trace is active
+_current_trace: contextvars.ContextVar = contextvars.ContextVar("metrics_trace", default=None)
+
+class Histogram:
+    """Bucketed latency histogram plus a window of recent samples for percentiles"""
+
+    def __init__(self, buckets: List[float] = None, window: int = 4096):
+        self.buckets = buckets or LATENCY_BUCKETS
+        self.counts = [0] * (len(self.buckets) + 1)  # Last slot is +Inf
+        self.count = 0
+        self.sum = 0.0
+        self.recent = deque(maxlen=window)
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.recent.append(value)
+
+    def percentile(self, q: float) -> float:
+        return float(np.percentile(self.recent, q)) if self.recent else 0.0
+
+class Span:
+    """One timed stage or external call, with counts attached as it runs"""
+
+    def __init__(self, name: str, attributes: Dict):
+        self.name = name
+        self.attributes = dict(attributes)
+        self.start = time.perf_counter()
+        self.seconds = 0.0
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def add(self, **counts):
+        for key, value in counts.items():
+            self.attributes[key] = self.attributes.get(key, 0) + value
+
+    def to_dict(self) -> Dict:
+        return {"name": self.name, "seconds": self.seconds, **self.attributes}
+
+class Trace(list):
+    """Span dicts of one request; closed once the request's trace() block exits"""
+    closed = False
+
+class Metrics:
+    """
+    Process-wide span and counter aggregation.
+
+    Every span feeds a per-stage latency histogram; numeric span attributes
+    (batch sizes, cache hits/misses, candidate and token counts) are summed
+    into per-stage counters. Spans recorded inside trace() are also returned
+    to the caller so they can be attached to a single request's result.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.histograms: Dict[str, Histogram] = defaultdict(Histogram)
+        self.counters: Dict[str, Dict[str, float]] = defaultdict(lambda: defaultdict(float))
+        self.enabled = True
+
+    @contextmanager
+    def span(self, name: str, **attributes) -> Iterator[Span]:
+        span = Span(name, attributes)
+        try:
+            yield span
+        finally:
+            span.seconds = time.perf_counter() - span.start
+            if self.enabled:
+                self.record(span)
+
+    def observe(self, name: str, seconds: float, **attributes):
+        """Record a span timed by the caller (e.g. work interleaved with generator yields)"""
+        span = Span(name, attributes)
+        span.seconds = seconds
+        if self.enabled:
+            self.record(span)
+
+    def record(self, span: Span):
+        with self.lock:
+            self.histograms[span.name].observe(span.seconds)
+            for key, value in span.attributes.items():
+                if isinstance(value, (int, float)) and not isinstance(value, bool):
+                    self.counters[span.name][key] += value
+        self.attach(span, [_current_trace.get()])
+
+    def attach(self, span: Span, traces: List[Trace]):
+        """Add an already recorded span to request traces (e.g. one batch shared by several requests)"""
+        if not self.enabled:
+            return
+        for trace in {id(trace): trace for trace in traces if trace is not None}.values():
+            # Work that outlives its request (a losing hedge) doesn't change a returned trace
+            if not trace.closed:
+                trace.append(span.to_dict())
+
+    def current_trace(self) -> Optional[Trace]:
+        """The trace active in this context, to hand to work that runs on other threads"""
+        return _current_trace.get()
+
+    def count(self, name: str, key: str, value: float = 1):
+        """Bump a counter outside any span"""
+        with self.lock:
+            self.counters[name][key] += value
+
+    @contextmanager
+    def trace(self) -> Iterator[Trace]:
+        """
+        Collect the spans recorded in this context (same thread or asyncio
+        task). Work handed to other threads joins it by running in a copy of
+        the context (contextvars.copy_context().run) or via attach().
+        """
+        spans = Trace()
+        token = _current_trace.set(spans)
+        try:
+            yield spans
+        finally:
+            spans.closed = True
+            _current_trace.reset(token)
+
+    def summary(self) -> Dict[str, Dict]:
+        """p50/p99/mean latency and totals per stage"""
+        with self.lock:
+            summary = {}
+            for name in sorted(set(self.histograms) | set(self.counters)):
+                entry = {}
+                histogram = self.histograms.get(name)
+                if histogram is not None:
+                    entry = {
+                        "count": histogram.count,
+                        "mean_seconds": histogram.sum / histogram.count if histogram.count else 0.0,
+                        "p50_seconds": histogram.percentile(50),
+                        "p99_seconds": histogram.percentile(99)
+                    }
+                entry.update(self.counters.get(name, {}))
+                summary[name] = entry
+            return summary
+
+    def to_dict(self) -> Dict:
+        """JSON-friendly dump: summaries plus raw bucket counts"""
+        with self.lock:
+            buckets = {
+                name: {"le": histogram.buckets + ["+Inf"], "counts": list(histogram.counts)}
+                for name, histogram in self.histograms.items()
+            }
+        return {"stages": self.summary(), "buckets": buckets}
+
+    def prometheus_text(self, prefix: str = "paper_agent") -> str:
+        """Snapshot in the Prometheus text exposition format"""
+        lines = [
+            f"# HELP {prefix}_stage_seconds Latency of pipeline stages and external calls",
+            f"# TYPE {prefix}_stage_seconds histogram"
+        ]
+        with self.lock:
+            for name, histogram in sorted(self.histograms.items()):
+                cumulative = 0
+                for bound, count in zip(histogram.buckets + ["+Inf"], histogram.counts):
+                    cumulative += count
+                    lines.append(f'{prefix}_stage_seconds_bucket{{stage="{name}",le="{bound}"}} {cumulative}')
+                lines.append(f'{prefix}_stage_seconds_sum{{stage="{name}"}} {histogram.sum}')
+                lines.append(f'{prefix}_stage_seconds_count{{stage="{name}"}} {histogram.count}')
+
+            lines.append(f"# HELP {prefix}_stage_total Counts attached to stage spans (batch sizes, cache hits, tokens)")
+            lines.append(f"# TYPE {prefix}_stage_total counter")
+            for name, counters in sorted(self.counters.items()):
+                for key, value in sorted(counters.items()):
+                    lines.append(f'{prefix}_stage_total{{stage="{name}",field="{key}"}} {value}')
+        return "\n".join(lines) + "\n"
+
+    def reset(self):
+        with self.lock:
+            self.histograms.clear()
+            self.counters.clear()
+
+metrics = Metrics()
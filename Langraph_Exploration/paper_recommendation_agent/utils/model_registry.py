@@ -0,0 +1,208 @@
+import time
+import queue
+import logging
+import threading
+import contextvars
+import numpy as np
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, List, Sequence, Tuple
+from utils.lazy import LazyResource
+from utils.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+def load_embedder(model_name: str):
+    """Import sentence-transformers and load the embedding model ("hash:<dim>" loads the offline hashing embedder)"""
+    if model_name.startswith("hash:"):
+        from utils.stub_backends import HashingEmbedder
+        return HashingEmbedder(int(model_name.split(":", 1)[1]))
+    from sentence_transformers import SentenceTransformer
+    return SentenceTransformer(model_name)
+
+class MicroBatcher:
+    """
+    Coalesces calls from many threads into batches run on one inference thread.
+
+    Each submit() queues a list of inputs. The inference thread takes the
+    first waiting request, keeps collecting requests for up to `max_wait_ms`
+    or until `max_batch_size` inputs are queued, runs `batch_fn` once over
+    all of them and hands every caller back its own slice of the outputs.
+    run() executes a one-off call on the same thread, so the model is only
+    ever touched by the inference thread.
+    """
+
+    def __init__(self, name: str, batch_fn: Callable[[List[Any]], Sequence[Any]],
+                 max_batch_size: int = 64, max_wait_ms: float = 5.0):
+        self.name = name
+        self.batch_fn = batch_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+
+        self.batches = 0
+        self.items = 0
+
+        self._queue = queue.Queue()
+        self._deferred = []
+        self._stopped = False
+        self._thread = threading.Thread(target=self._run, name=f"inference-{name}", daemon=True)
+        self._thread.start()
+
+    def submit(self, inputs: List[Any]) -> Future:
+        """Queue inputs for the next batch; the future resolves to their outputs, in order"""
+        future = Future()
+        if not inputs:
+            future.set_result([])
+        else:
+            # The caller's trace gets the span of the batch its inputs end up in
+            self._put((list(inputs), None, future, metrics.current_trace()))
+        return future
+
+    def __call__(self, inputs: List[Any]) -> Sequence[Any]:
+        return self.submit(inputs).result()
+
+    def run(self, fn: Callable[[], Any]) -> Any:
+        """Run fn() alone on the inference thread, between batches (for calls that can't be batched)"""
+        future = Future()
+        # In the caller's context, so spans recorded by fn land in the caller's trace
+        self._put((None, contextvars.copy_context().run, future, fn))
+        return future.result()
+
+    def _put(self, request: Tuple):
+        if self._stopped:
+            raise RuntimeError(f"{self.name} inference thread has stopped")
+        self._queue.put(request)
+
+    def _collect(self) -> List:
+        # A standalone call pulled from the queue while filling the previous batch goes next
+        first = self._deferred.pop() if self._deferred else self._queue.get()
+        if first[0] is None:
+            return [first]
+
+        requests = [first]
+        size = len(first[0])
+        deadline = time.monotonic() + self.max_wait
+        while size < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                request = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if request[0] is None:
+                self._deferred.append(request)
+                break
+            requests.append(request)
+            size += len(request[0])
+        return requests
+
+    def _run(self):
+        try:
+            while True:
+                requests = self._collect()
+                try:
+                    self._process(requests)
+                finally:
+                    # Whatever happened (even a BaseException), nobody is left waiting on this batch
+                    for _, _, future, _ in requests:
+                        if not future.done():
+                            future.set_exception(RuntimeError(f"{self.name} batch was not completed"))
+        finally:
+            self._stopped = True
+            logger.error(f"{self.name} inference thread stopped")
+            pending = self._deferred
+            while True:
+                try:
+                    pending.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            for _, _, future, _ in pending:
+                if not future.done():
+                    future.set_exception(RuntimeError(f"{self.name} inference thread has stopped"))
+
+    def _process(self, requests: List):
+        if requests[0][0] is None:
+            _, run_in_context, future, fn = requests[0]
+            try:
+                future.set_result(run_in_context(fn))
+            except Exception as e:
+                future.set_exception(e)
+            return
+
+        inputs = [item for request_inputs, _, _, _ in requests for item in request_inputs]
+        error = None
+        try:
+            with metrics.span(f"micro_batch_{self.name}", batch_size=len(inputs), requests=len(requests)) as span:
+                outputs = self.batch_fn(inputs)
+        except Exception as e:
+            error = e
+        metrics.attach(span, [trace for _, _, _, trace in requests])
+        if error is not None:
+            logger.error(f"Error in {self.name} batch of {len(inputs)}: {error}")
+            for _, _, future, _ in requests:
+                future.set_exception(error)
+            return
+
+        self.batches += 1
+        self.items += len(inputs)
+        start = 0
+        for request_inputs, _, future, _ in requests:
+            future.set_result(outputs[start:start + len(request_inputs)])
+            start += len(request_inputs)
+
+    @property
+    def mean_batch_size(self) -> float:
+        return self.items / self.batches if self.batches else 0.0
+
+class SharedEmbedder:
+    """
+    Sentence-transformer front end whose encode() calls are micro-batched
+    across threads. Other attributes (tokenizer, max_seq_length, ...) are
+    read from the underlying model.
+    """
+
+    def __init__(self, model: LazyResource, max_batch_size: int = 128, max_wait_ms: float = 5.0):
+        self.model = model
+        self.batcher = MicroBatcher("embedder", self._encode_batch, max_batch_size, max_wait_ms)
+
+    def _encode_batch(self, texts: List[str]) -> np.ndarray:
+        return self.model.encode(texts, batch_size=len(texts), convert_to_numpy=True)
+
+    def encode(self, sentences, **kwargs):
+        """Encode one string (returns a vector) or a list of strings (returns a matrix)"""
+        if kwargs:
+            # Non-default options can't share a batch, but still run on the inference thread
+            return self.batcher.run(lambda: self.model.encode(sentences, **kwargs))
+        if isinstance(sentences, str):
+            return self.batcher([sentences])[0]
+        return np.asarray(self.batcher(list(sentences)))
+
+    def load(self):
+        return self.model.load()
+
+    def __getattr__(self, attr: str) -> Any:
+        return getattr(self.model, attr)
+
+class ModelRegistry:
+    """
+    Process-wide home of loaded models, so every agent instance (and every
+    Streamlit session) shares one copy of each model and one inference
+    thread per model.
+    """
+
+    def __init__(self):
+        self._entries: Dict[str, Any] = {}
+        self._lock = threading.Lock()
+
+    def get(self, key: str, factory: Callable[[], Any]) -> Any:
+        """Return the entry for key, creating it with factory() the first time (keep factories cheap)"""
+        with self._lock:
+            if key not in self._entries:
+                self._entries[key] = factory()
+            return self._entries[key]
+
+    def keys(self) -> List[str]:
+        with self._lock:
+            return list(self._entries)
+
+registry = ModelRegistry()
@@ -0,0 +1,202 @@
+import os
+import json
+import time
+import sqlite3
+import logging
+import threading
+import numpy as np
+from typing import Dict, Optional
+from utils.score_cache import normalize_interests
+
+logger = logging.getLogger(__name__)
+
+class PlanCache:
+    """
+    Persistent cache of planner output.
+
+    Lookups try an exact match on the normalized query first, then fall back to
+    the cached query whose embedding is closest in cosine distance. Stored
+    embeddings are dropped (plans are kept for exact hits) when they were
+    written by a different `embedder` or have a different dimension.
+    """
+
+    def __init__(self, db_path: str, ttl: float = 86400, max_size: int = 5000, max_distance: float = 0.08,
+                 embedder: str = None):
+        self.embedder = embedder
+        self.dimension = None
+        self.ttl = ttl
+        self.max_size = max_size
+        self.max_distance = max_distance
+        self.lock = threading.Lock()
+
+        os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS plans ("
+            "query TEXT PRIMARY KEY, plan TEXT NOT NULL, embedding BLOB, "
+            "created_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+        )
+        self.conn.execute("CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value TEXT)")
+        self._check_embedder()
+
+        # Unit-normalized embeddings of every live entry, for the semantic tier. Rows live in a
+        # buffer with spare capacity so puts and evictions update it in place instead of reloading
+        self.queries = []
+        self.rows = {}
+        self._buffer = np.zeros((0, 0), dtype=np.float32)
+        self.matrix = self._buffer
+        self._expire()
+        self._load_embeddings()
+
+    def _check_embedder(self):
+        """Drop embeddings written by another embedding model; vectors from different models don't compare"""
+        meta = dict(self.conn.execute("SELECT name, value FROM meta").fetchall())
+        if self.embedder is not None and meta.get("embedder") != self.embedder:
+            if meta.get("embedder") is not None:
+                logger.info("Embedding model changed, dropping plan cache embeddings")
+            self.conn.execute("UPDATE plans SET embedding = NULL")
+            self.conn.execute("DELETE FROM meta WHERE name = 'dimension'")
+            self.conn.execute("INSERT OR REPLACE INTO meta (name, value) VALUES ('embedder', ?)", (self.embedder,))
+        else:
+            self.dimension = int(meta["dimension"]) if "dimension" in meta else None
+        self.conn.commit()
+
+    def _set_dimension(self, dimension: int):
+        """Record the embedding size, dropping stored embeddings of another size"""
+        if self.dimension == dimension:
+            return
+        if self.dimension is not None:
+            logger.info(f"Embedding dimension changed ({self.dimension} -> {dimension}), "
+                        f"dropping plan cache embeddings")
+            self.conn.execute("UPDATE plans SET embedding = NULL")
+            self.queries = []
+            self.rows = {}
+            self._buffer = np.zeros((0, 0), dtype=np.float32)
+            self.matrix = self._buffer
+        self.dimension = dimension
+        self.conn.execute("INSERT OR REPLACE INTO meta (name, value) VALUES ('dimension', ?)", (str(dimension),))
+
+    def _load_embeddings(self):
+        rows = self.conn.execute("SELECT query, embedding FROM plans WHERE embedding IS NOT NULL").fetchall()
+        for query, blob in rows:
+            vector = np.frombuffer(blob, dtype=np.float32)
+            if self.dimension is None:
+                self._set_dimension(len(vector))
+            if len(vector) == self.dimension:
+                self._set_embedding(query, vector)
+            else:
+                self.conn.execute("UPDATE plans SET embedding = NULL WHERE query = ?", (query,))
+        self.conn.commit()
+
+    def _set_embedding(self, query: str, vector: np.ndarray):
+        row = self.rows.get(query)
+        if row is None:
+            size = len(self.queries)
+            if size == len(self._buffer):
+                buffer = np.zeros((max(64, 2 * size), len(vector)), dtype=np.float32)
+                if size:
+                    buffer[:size] = self._buffer[:size]
+                self._buffer = buffer
+            row = size
+            self.queries.append(query)
+            self.rows[query] = row
+        self._buffer[row] = vector
+        self.matrix = self._buffer[:len(self.queries)]
+
+    def _remove_embedding(self, query: str):
+        row = self.rows.pop(query, None)
+        if row is None:
+            return
+        # Move the last row into the gap
+        last = len(self.queries) - 1
+        if row != last:
+            moved = self.queries[last]
+            self._buffer[row] = self._buffer[last]
+            self.queries[row] = moved
+            self.rows[moved] = row
+        self.queries.pop()
+        self.matrix = self._buffer[:len(self.queries)]
+
+    def _delete(self, queries):
+        self.conn.executemany("DELETE FROM plans WHERE query = ?", [(query,) for query in queries])
+        for query in queries:
+            self._remove_embedding(query)
+
+    def _expire(self):
+        expired = self.conn.execute(
+            "SELECT query FROM plans WHERE created_at < ?", (time.time() - self.ttl,)
+        ).fetchall()
+        self._delete([query for query, in expired])
+        self.conn.commit()
+
+    def get(self, query: str, embedding: Optional[np.ndarray] = None) -> Optional[Dict]:
+        """Return a cached plan for the query, or None on a miss"""
+        normalized = normalize_interests(query)
+        cutoff = time.time() - self.ttl
+
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT plan FROM plans WHERE query = ? AND created_at >= ?", (normalized, cutoff)
+            ).fetchone()
+            if row:
+                self._touch(normalized)
+                logger.info("Plan cache hit (exact)")
+                return json.loads(row[0])
+
+            if embedding is None or len(self.queries) == 0:
+                return None
+            vector = self._unit(embedding)
+            if len(vector) != self.dimension:
+                return None
+
+            similarities = self.matrix @ vector
+            candidates = np.flatnonzero(similarities >= 1.0 - self.max_distance)
+            # Closest first; one that expired since the last put gives way to the next
+            for best in candidates[np.argsort(-similarities[candidates])]:
+                row = self.conn.execute(
+                    "SELECT plan FROM plans WHERE query = ? AND created_at >= ?", (self.queries[best], cutoff)
+                ).fetchone()
+                if row:
+                    distance = 1.0 - float(similarities[best])
+                    self._touch(self.queries[best])
+                    logger.info(f"Plan cache hit (semantic, distance {distance:.3f}): '{self.queries[best]}'")
+                    return json.loads(row[0])
+            return None
+
+    def put(self, query: str, plan: Dict, embedding: Optional[np.ndarray] = None):
+        """Store a plan and evict expired and least recently used entries"""
+        normalized = normalize_interests(query)
+        vector = self._unit(embedding) if embedding is not None else None
+        blob = vector.tobytes() if vector is not None else None
+        now = time.time()
+
+        with self.lock:
+            if vector is not None:
+                self._set_dimension(len(vector))
+            self.conn.execute(
+                "INSERT OR REPLACE INTO plans (query, plan, embedding, created_at, accessed_at) "
+                "VALUES (?, ?, ?, ?, ?)", (normalized, json.dumps(plan), blob, now, now)
+            )
+            if vector is not None:
+                self._set_embedding(normalized, vector)
+            else:
+                self._remove_embedding(normalized)
+            self._expire()
+            count = self.conn.execute("SELECT COUNT(*) FROM plans").fetchone()[0]
+            if count > self.max_size:
+                evicted = self.conn.execute(
+                    "SELECT query FROM plans ORDER BY accessed_at ASC LIMIT ?", (count - self.max_size,)
+                ).fetchall()
+                self._delete([query for query, in evicted])
+            self.conn.commit()
+
+    def _touch(self, normalized: str):
+        self.conn.execute("UPDATE plans SET accessed_at = ? WHERE query = ?", (time.time(), normalized))
+        self.conn.commit()
+
+    @staticmethod
+    def _unit(embedding: np.ndarray) -> np.ndarray:
+        vector = np.asarray(embedding, dtype=np.float32).reshape(-1)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm > 0 else vector
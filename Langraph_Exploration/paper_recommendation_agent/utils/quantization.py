@@ -0,0 +1,175 @@
+import os
+import logging
+import numpy as np
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+class ScalarQuantizer:
+    """
+    Per-dimension int8 quantization of embeddings (4x smaller than float32).
+
+    Each dimension is mapped linearly from its [min, max] range onto the 256
+    int8 levels. Dot products are computed straight from the codes, so a scan
+    never decodes vectors back to float.
+    """
+
+    name = "int8"
+
+    def __init__(self, minimum: np.ndarray = None, scale: np.ndarray = None, codes: np.ndarray = None):
+        self.minimum = minimum
+        self.scale = scale
+        self.codes = codes
+
+    def train(self, vectors: np.ndarray):
+        self.minimum = vectors.min(axis=0).astype(np.float32)
+        self.scale = np.maximum((vectors.max(axis=0) - self.minimum) / 255.0, 1e-12).astype(np.float32)
+
+    def encode(self, vectors: np.ndarray) -> np.ndarray:
+        levels = np.rint((vectors - self.minimum) / self.scale)
+        return (np.clip(levels, 0, 255) - 128).astype(np.int8)
+
+    def decode(self, codes: np.ndarray) -> np.ndarray:
+        return (codes.astype(np.float32) + 128) * self.scale + self.minimum
+
+    def dots(self, query: np.ndarray, rows: np.ndarray) -> np.ndarray:
+        """Approximate dot products between the query and the encoded rows"""
+        # x ~ (code + 128) * scale + minimum, so x.q = code.(scale*q) + (128*scale + minimum).q
+        weights = self.scale * query
+        offset = float((128 * self.scale + self.minimum) @ query)
+        return np.asarray(self.codes[rows], dtype=np.float32) @ weights + offset
+
+    def distances(self, query: np.ndarray, rows: np.ndarray, sq_norms: np.ndarray) -> np.ndarray:
+        """Approximate squared L2 distances, using the exact stored norms"""
+        return sq_norms + float(query @ query) - 2 * self.dots(query, rows)
+
+    @property
+    def nbytes(self) -> int:
+        return self.codes.nbytes + self.minimum.nbytes + self.scale.nbytes
+
+    def save(self, path: str):
+        np.save(os.path.join(path, "int8_codes.npy"), self.codes)
+        np.save(os.path.join(path, "int8_params.npy"), np.vstack([self.minimum, self.scale]))
+
+    @classmethod
+    def load(cls, path: str) -> "ScalarQuantizer":
+        minimum, scale = np.load(os.path.join(path, "int8_params.npy"))
+        codes = np.load(os.path.join(path, "int8_codes.npy"), mmap_mode="r")
+        return cls(minimum, scale, codes)
+
+class ProductQuantizer:
+    """
+    Product quantization: each vector is split into `subspaces` slices and
+    every slice is replaced by the id of its nearest of 256 centroids, so a
+    384-d embedding shrinks from 1536 bytes to `subspaces` bytes.
+
+    Distances use asymmetric distance computation: the query stays in float
+    and is compared to the centroids once, then each code is a table lookup.
+    """
+
+    name = "pq"
+
+    def __init__(self, codebooks: np.ndarray = None, codes: np.ndarray = None):
+        # codebooks: (subspaces, 256, sub_dim), codes: (n, subspaces) uint8
+        self.codebooks = codebooks
+        self.codes = codes
+
+    def train(self, vectors: np.ndarray, subspaces: int, iterations: int = 15, seed: int = 42):
+        dim = vectors.shape[1]
+        if dim % subspaces:
+            raise ValueError(f"Embedding dimension {dim} is not divisible by {subspaces} PQ subspaces")
+        sub_dim = dim // subspaces
+        centroids = min(256, len(vectors))
+        self.codebooks = np.zeros((subspaces, 256, sub_dim), dtype=np.float32)
+        for m in range(subspaces):
+            part = vectors[:, m * sub_dim:(m + 1) * sub_dim]
+            self.codebooks[m, :centroids] = l2_kmeans(part, centroids, iterations, seed + m)
+            # Unused slots (tiny corpora) are never the nearest centroid
+            self.codebooks[m, centroids:] = np.inf
+
+    def encode(self, vectors: np.ndarray, chunk_size: int = 65536) -> np.ndarray:
+        subspaces, _, sub_dim = self.codebooks.shape
+        codes = np.zeros((len(vectors), subspaces), dtype=np.uint8)
+        for start in range(0, len(vectors), chunk_size):
+            chunk = vectors[start:start + chunk_size]
+            for m in range(subspaces):
+                part = chunk[:, m * sub_dim:(m + 1) * sub_dim]
+                codes[start:start + len(chunk), m] = _nearest(part, self.codebooks[m])
+        return codes
+
+    def decode(self, codes: np.ndarray) -> np.ndarray:
+        subspaces = self.codebooks.shape[0]
+        return np.hstack([self.codebooks[m][codes[:, m]] for m in range(subspaces)])
+
+    def distances(self, query: np.ndarray, rows: np.ndarray, sq_norms: np.ndarray = None) -> np.ndarray:
+        """Approximate squared L2 distances by summing per-subspace lookup tables"""
+        subspaces, _, sub_dim = self.codebooks.shape
+        table = ((self.codebooks - query.reshape(subspaces, 1, sub_dim)) ** 2).sum(axis=2)
+        codes = np.asarray(self.codes[rows])
+        return table[np.arange(subspaces), codes].sum(axis=1)
+
+    @property
+    def nbytes(self) -> int:
+        return self.codes.nbytes + self.codebooks.nbytes
+
+    def save(self, path: str):
+        np.save(os.path.join(path, "pq_codes.npy"), self.codes)
+        np.save(os.path.join(path, "pq_codebooks.npy"), self.codebooks)
+
+    @classmethod
+    def load(cls, path: str) -> "ProductQuantizer":
+        codebooks = np.load(os.path.join(path, "pq_codebooks.npy"))
+        codes = np.load(os.path.join(path, "pq_codes.npy"), mmap_mode="r")
+        return cls(codebooks, codes)
+
+# Files written by each quantizer, so a rebuild can clear stale ones
+QUANTIZER_FILES = ["int8_codes.npy", "int8_params.npy", "pq_codes.npy", "pq_codebooks.npy"]
+
+def _nearest(vectors: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+    finite = np.isfinite(centroids).all(axis=1)
+    distances = (centroids[finite] ** 2).sum(axis=1) - 2 * vectors @ centroids[finite].T
+    return np.flatnonzero(finite)[np.argmin(distances, axis=1)]
+
+def l2_kmeans(vectors: np.ndarray, k: int, iterations: int = 15, seed: int = 42) -> np.ndarray:
+    """Lloyd's k-means under squared L2 (PQ sub-vectors are not unit length)"""
+    rng = np.random.default_rng(seed)
+    centroids = vectors[rng.choice(len(vectors), size=k, replace=False)].astype(np.float32)
+    for _ in range(iterations):
+        assignment = _nearest(vectors, centroids)
+        counts = np.bincount(assignment, minlength=k)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignment, vectors)
+        empty = counts == 0
+        centroids[~empty] = sums[~empty] / counts[~empty, None]
+        if empty.any():
+            centroids[empty] = vectors[rng.integers(len(vectors), size=int(empty.sum()))]
+    return centroids
+
+def train_quantizer(vectors: np.ndarray, method: str, pq_subspaces: int = None,
+                    sample_size: int = 100000, seed: int = 42):
+    """Train a quantizer on a sample of the vectors and encode all of them"""
+    rng = np.random.default_rng(seed)
+    sample = vectors[rng.choice(len(vectors), size=min(len(vectors), sample_size), replace=False)]
+
+    if method == "int8":
+        quantizer = ScalarQuantizer()
+        quantizer.train(sample)
+    elif method == "pq":
+        # 8 dimensions per byte by default: 384-d -> 48 bytes per paper
+        quantizer = ProductQuantizer()
+        quantizer.train(sample, pq_subspaces or max(1, vectors.shape[1] // 8))
+    else:
+        raise ValueError(f"Unknown quantization method: {method}")
+
+    quantizer.codes = quantizer.encode(vectors)
+    logger.info(f"Trained {method} quantizer: {quantizer.nbytes / 1e6:.1f} MB of codes "
+                f"vs {vectors.shape[0] * vectors.shape[1] * 4 / 1e6:.1f} MB float32")
+    return quantizer
+
+def load_quantizer(path: str) -> Optional[object]:
+    """Open whichever quantizer was built into a NumPy store, if any"""
+    if os.path.exists(os.path.join(path, "pq_codes.npy")):
+        return ProductQuantizer.load(path)
+    if os.path.exists(os.path.join(path, "int8_codes.npy")):
+        return ScalarQuantizer.load(path)
+    return None
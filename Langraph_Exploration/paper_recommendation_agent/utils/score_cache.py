@@ -0,0 +1,146 @@
+import os
+import re
+import time
+import sqlite3
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+def normalize_interests(text: str) -> str:
+    """Normalize an interests string so trivially different queries share a key"""
+    text = re.sub(r"[^\w\s.+-]", " ", text.lower())
+    return " ".join(text.split())
+
+def model_fingerprint(*paths: str) -> str:
+    """Fingerprint model artifacts from file names, sizes and modification times"""
+    digest = hashlib.sha256()
+    for path in paths:
+        if not path or not os.path.exists(path):
+            continue
+        files = [path] if os.path.isfile(path) else [
+            os.path.join(path, name) for name in sorted(os.listdir(path))
+            if os.path.isfile(os.path.join(path, name))
+        ]
+        for file_path in files:
+            stat = os.stat(file_path)
+            digest.update(f"{os.path.basename(file_path)}:{stat.st_size}:{stat.st_mtime_ns}".encode())
+    return digest.hexdigest()[:16]
+
+class ScoreCache:
+    """Two-tier relevance score cache: an in-process LRU in front of SQLite"""
+
+    def __init__(self, db_path: str, fingerprint: str, memory_size: int = 10000, disk_size: int = 200000):
+        self.fingerprint = fingerprint
+        self.memory_size = memory_size
+        self.disk_size = disk_size
+        self.memory = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+        os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS scores ("
+            "key TEXT PRIMARY KEY, score REAL NOT NULL, accessed_at REAL NOT NULL)"
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_scores_accessed ON scores(accessed_at)")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value TEXT)")
+        self._check_fingerprint()
+
+    def _check_fingerprint(self):
+        """Drop every stored score when the model has changed since the last run"""
+        row = self.conn.execute("SELECT value FROM meta WHERE name = 'fingerprint'").fetchone()
+        if row and row[0] != self.fingerprint:
+            logger.info("Relevance model changed, invalidating score cache")
+            self.conn.execute("DELETE FROM scores")
+        self.conn.execute(
+            "INSERT OR REPLACE INTO meta (name, value) VALUES ('fingerprint', ?)", (self.fingerprint,)
+        )
+        self.conn.commit()
+
+    def make_key(self, user_interests: str, paper_id: str) -> str:
+        """Build a cache key from the normalized interests, paper id and model fingerprint"""
+        raw = f"{normalize_interests(user_interests)}\x1f{paper_id}\x1f{self.fingerprint}"
+        return hashlib.sha256(raw.encode()).hexdigest()
+
+    def get_many(self, keys: List[str]) -> Dict[str, float]:
+        """Look up scores, checking memory first and then SQLite"""
+        found = {}
+        with self.lock:
+            missing = []
+            for key in keys:
+                if key in self.memory:
+                    self.memory.move_to_end(key)
+                    found[key] = self.memory[key]
+                else:
+                    missing.append(key)
+
+            rows = []
+            # Stay below SQLite's host-parameter limit on large lookups
+            for start in range(0, len(missing), 500):
+                chunk = missing[start:start + 500]
+                placeholders = ",".join("?" * len(chunk))
+                rows.extend(self.conn.execute(
+                    f"SELECT key, score FROM scores WHERE key IN ({placeholders})", chunk
+                ).fetchall())
+
+            if rows:
+                now = time.time()
+                self.conn.executemany(
+                    "UPDATE scores SET accessed_at = ? WHERE key = ?", [(now, key) for key, _ in rows]
+                )
+                self.conn.commit()
+                for key, score in rows:
+                    found[key] = score
+                    self._remember(key, score)
+
+            self.hits += len(found)
+            self.misses += len(keys) - len(found)
+        return found
+
+    def put_many(self, scores: Dict[str, float]):
+        """Store scores in both tiers and evict the least recently used overflow"""
+        if not scores:
+            return
+        with self.lock:
+            now = time.time()
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO scores (key, score, accessed_at) VALUES (?, ?, ?)",
+                [(key, score, now) for key, score in scores.items()]
+            )
+            for key, score in scores.items():
+                self._remember(key, score)
+            self._evict_disk()
+            self.conn.commit()
+
+    def get(self, key: str) -> Optional[float]:
+        """Look up a single score"""
+        return self.get_many([key]).get(key)
+
+    def _remember(self, key: str, score: float):
+        self.memory[key] = score
+        self.memory.move_to_end(key)
+        while len(self.memory) > self.memory_size:
+            self.memory.popitem(last=False)
+
+    def _evict_disk(self):
+        count = self.conn.execute("SELECT COUNT(*) FROM scores").fetchone()[0]
+        overflow = count - self.disk_size
+        if overflow > 0:
+            self.conn.execute(
+                "DELETE FROM scores WHERE key IN "
+                "(SELECT key FROM scores ORDER BY accessed_at ASC LIMIT ?)", (overflow,)
+            )
+
+    def clear(self):
+        """Remove every cached score"""
+        with self.lock:
+            self.memory.clear()
+            self.conn.execute("DELETE FROM scores")
+            self.conn.commit()
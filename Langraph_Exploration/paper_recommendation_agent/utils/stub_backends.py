@@ -0,0 +1,133 @@
+import re
+import json
+import time
+import zlib
+import random
+import logging
+import threading
+import numpy as np
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List
+from utils.helpers import tokenize
+
+logger = logging.getLogger(__name__)
+
+class HashingEmbedder:
+    """
+    Offline stand-in for a sentence-transformer: signed feature hashing of
+    word tokens into a unit vector. No weights and no network, stable across
+    processes, and similar texts still land near each other.
+    """
+
+    def __init__(self, dim: int = 384):
+        self.dim = dim
+        self.max_seq_length = 256
+        self.tokenizer = None
+
+    def encode(self, sentences, batch_size: int = None, convert_to_numpy: bool = True, **kwargs):
+        single = isinstance(sentences, str)
+        texts = [sentences] if single else list(sentences)
+        vectors = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for token in tokenize(text):
+                h = zlib.crc32(token.encode())
+                vectors[row, h % self.dim] += 1.0 if h & 0x80000000 else -1.0
+        vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+        return vectors[0] if single else vectors
+
+class StubLLMServer:
+    """
+    Local OpenAI-compatible chat-completions server with configurable latency,
+    used in place of Groq and the HF router for offline benchmarks.
+
+    Planner prompts (they ask for a "search plan") get a JSON plan built from
+    the quoted query, batched justification prompts get a JSON object keyed
+    by the [paper id]s they list, and anything else gets a short justification.
+    """
+
+    def __init__(self, latency_ms: float = 200.0, jitter_ms: float = 50.0, domains: List[str] = None,
+                 host: str = "127.0.0.1", port: int = 0, seed: int = 0):
+        self.latency = latency_ms / 1000.0
+        self.jitter = jitter_ms / 1000.0
+        self.domains = domains or ["cs.AI", "cs.LG"]
+        self.requests = 0
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", 0))
+                try:
+                    payload = json.loads(self.rfile.read(length) or b"{}")
+                except json.JSONDecodeError:
+                    payload = {}
+                body = json.dumps(server.respond(payload)).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer((host, port), Handler)
+        self.httpd.daemon_threads = True
+        self.thread = threading.Thread(target=self.httpd.serve_forever, name="stub-llm", daemon=True)
+
+    @property
+    def url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "StubLLMServer":
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def respond(self, payload: Dict) -> Dict:
+        with self._lock:
+            self.requests += 1
+            delay = max(0.0, self._rng.gauss(self.latency, self.jitter))
+            domains = self._rng.sample(self.domains, k=min(2, len(self.domains)))
+        time.sleep(delay)
+
+        prompt = " ".join(str(m.get("content", "")) for m in payload.get("messages", []))
+        if "search plan" in prompt:
+            quoted = re.search(r'"([^"]+)"', prompt)
+            concepts = [t for t in tokenize(quoted.group(1) if quoted else prompt) if len(t) > 3][:5]
+            content = json.dumps({
+                "domains": domains,
+                "key_concepts": concepts,
+                "recency_preference": "all time",
+                "depth": "comprehensive",
+                "specific_requirements": []
+            })
+        elif "keyed by paper id" in prompt:
+            paper_ids = re.findall(r"^\s*\[([^\]]+)\]", prompt, flags=re.MULTILINE)
+            content = json.dumps({
+                paper_id: "This paper addresses the stated interests directly and its methods are relevant."
+                for paper_id in paper_ids
+            })
+        else:
+            content = "This paper addresses the stated interests directly and its methods are relevant."
+
+        prompt_tokens = len(prompt.split())
+        completion_tokens = len(content.split())
+        return {
+            "id": f"stub-{self.requests}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": payload.get("model", "stub"),
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens
+            }
+        }
@@ -0,0 +1,369 @@
+import os
+import json
+import logging
+import numpy as np
+from abc import ABC, abstractmethod
+from typing import Dict, List, Optional
+from utils.quantization import QUANTIZER_FILES, load_quantizer, train_quantizer
+
+logger = logging.getLogger(__name__)
+
+# String metadata fields kept as columns in the NumPy store
+STRING_COLUMNS = ["title", "categories", "published", "pdf_url", "content_hash"]
+
+class VectorStore(ABC):
+    """
+    Read interface the agents use for nearest-neighbour search.
+
+    Mirrors the subset of Chroma's collection API we rely on, so results keep
+    Chroma's shape: query() returns one list per query embedding.
+    """
+
+    @abstractmethod
+    def query(self, query_embeddings: List[List[float]], n_results: int = 10,
+              where: Optional[Dict] = None, include: List[str] = None) -> Dict:
+        """Nearest neighbours of each query embedding, optionally restricted by a where clause"""
+
+    @abstractmethod
+    def get(self, ids: List[str] = None, where: Optional[Dict] = None, include: List[str] = None,
+            limit: int = None, offset: int = 0) -> Dict:
+        """Records by id, or a page of the records matching a where clause"""
+
+    @abstractmethod
+    def count(self) -> int:
+        """Number of stored papers"""
+
+class ChromaVectorStore(VectorStore):
+    """VectorStore backed by a persistent Chroma collection"""
+
+    def __init__(self, path: str, collection_name: str = "arxiv_papers"):
+        import chromadb
+
+        self.client = chromadb.PersistentClient(path=path)
+        self.collection = self.client.get_collection(collection_name)
+
+    def query(self, query_embeddings, n_results=10, where=None, include=None):
+        return self.collection.query(
+            query_embeddings=query_embeddings,
+            n_results=n_results,
+            where=where,
+            include=include or ["metadatas", "documents", "distances"]
+        )
+
+    def get(self, ids=None, where=None, include=None, limit=None, offset=0):
+        return self.collection.get(
+            ids=ids, where=where, include=include or ["metadatas", "documents"], limit=limit, offset=offset
+        )
+
+    def count(self):
+        return self.collection.count()
+
+class StringColumn:
+    """UTF-8 strings stored as one memory-mapped blob plus an offsets array"""
+
+    def __init__(self, path: str, name: str):
+        self.blob = np.load(os.path.join(path, f"{name}.blob.npy"), mmap_mode="r")
+        self.offsets = np.load(os.path.join(path, f"{name}.offsets.npy"), mmap_mode="r")
+
+    def __getitem__(self, i: int) -> str:
+        return bytes(self.blob[self.offsets[i]:self.offsets[i + 1]]).decode("utf-8")
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    @staticmethod
+    def write(path: str, name: str, values: List[str]):
+        encoded = [(value or "").encode("utf-8") for value in values]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum([len(e) for e in encoded])
+        np.save(os.path.join(path, f"{name}.blob.npy"), np.frombuffer(b"".join(encoded), dtype=np.uint8))
+        np.save(os.path.join(path, f"{name}.offsets.npy"), offsets)
+
+class NumpyVectorStore(VectorStore):
+    """
+    In-process store over a memory-mapped float16 embedding matrix.
+
+    Metadata lives in a columnar sidecar (string blobs, an int64 publish
+    timestamp column and a boolean category matrix) so `where` filters are
+    vectorized masks. An optional IVF coarse quantizer limits each query to
+    the `nprobe` nearest inverted lists. All arrays are mmap'd read-only, so
+    worker processes share the page cache.
+
+    When the store was built with int8 or PQ codes, the scan runs on the
+    compact codes and only the best `n_results * rescore_factor` rows are
+    re-scored against the float16 vectors on disk.
+    """
+
+    def __init__(self, path: str, nprobe: int = 16, chunk_size: int = 65536, rescore_factor: int = 8):
+        self.path = path
+        self.nprobe = nprobe
+        self.chunk_size = chunk_size
+        self.rescore_factor = rescore_factor
+
+        self.embeddings = np.load(os.path.join(path, "embeddings.f16.npy"), mmap_mode="r")
+        self.sq_norms = np.load(os.path.join(path, "sq_norms.npy"), mmap_mode="r")
+        self.published_ts = np.load(os.path.join(path, "published_ts.npy"), mmap_mode="r")
+        self.category_flags = np.load(os.path.join(path, "category_flags.npy"), mmap_mode="r")
+        with open(os.path.join(path, "category_keys.json"), "r") as f:
+            self.category_columns = {key: i for i, key in enumerate(json.load(f))}
+
+        self.ids = StringColumn(path, "ids")
+        self.documents = StringColumn(path, "documents")
+        self.columns = {name: StringColumn(path, name) for name in STRING_COLUMNS}
+        self._id_index = None
+
+        self.centroids = None
+        if os.path.exists(os.path.join(path, "ivf_centroids.npy")):
+            self.centroids = np.load(os.path.join(path, "ivf_centroids.npy"))
+            self.list_offsets = np.load(os.path.join(path, "ivf_offsets.npy"))
+            self.list_members = np.load(os.path.join(path, "ivf_members.npy"), mmap_mode="r")
+
+        self.quantizer = load_quantizer(path)
+
+        logger.info(f"Opened NumPy vector store with {len(self.ids)} papers"
+                    f"{f' and {len(self.centroids)} IVF lists' if self.centroids is not None else ''}"
+                    f"{f', {self.quantizer.name} codes' if self.quantizer is not None else ''}")
+
+    def count(self):
+        return len(self.ids)
+
+    def _row_index(self) -> Dict[str, int]:
+        if self._id_index is None:
+            self._id_index = {self.ids[i]: i for i in range(len(self.ids))}
+        return self._id_index
+
+    def _mask(self, where: Optional[Dict]) -> Optional[np.ndarray]:
+        """Evaluate the where-clause subset SearchAgent produces into a boolean row mask"""
+        if not where:
+            return None
+        if "$and" in where:
+            masks = [self._mask(clause) for clause in where["$and"]]
+            return np.logical_and.reduce(masks)
+        if "$or" in where:
+            masks = [self._mask(clause) for clause in where["$or"]]
+            return np.logical_or.reduce(masks)
+
+        (key, condition), = where.items()
+        if key == "published_ts":
+            column = np.asarray(self.published_ts)
+            operators = {"$gte": np.greater_equal, "$gt": np.greater, "$lte": np.less_equal, "$lt": np.less}
+            if isinstance(condition, dict):
+                (op, value), = condition.items()
+                return operators[op](column, value)
+            return column == condition
+        if key in self.category_columns:
+            flags = np.asarray(self.category_flags[:, self.category_columns[key]])
+            return flags if condition is True or condition == {"$eq": True} else ~flags
+        if key.startswith("cat_"):
+            # Category never seen at build time
+            return np.zeros(len(self.ids), dtype=bool)
+        raise ValueError(f"Unsupported where clause: {where}")
+
+    def _candidates(self, query: np.ndarray, mask: Optional[np.ndarray]) -> Optional[np.ndarray]:
+        """Row indices to scan: the nprobe nearest IVF lists, or None for a full scan"""
+        if self.centroids is None or self.nprobe >= len(self.centroids):
+            return np.flatnonzero(mask) if mask is not None else None
+
+        probes = np.argsort(-(self.centroids @ query))[:self.nprobe]
+        rows = np.concatenate([self.list_members[self.list_offsets[p]:self.list_offsets[p + 1]] for p in probes])
+        if mask is not None:
+            rows = rows[mask[rows]]
+        return np.sort(rows)  # Sequential page access
+
+    def _distances(self, query: np.ndarray, rows: Optional[np.ndarray]) -> np.ndarray:
+        """Squared L2 distances (Chroma's default space) from the query to the given rows"""
+        if rows is None:
+            dots = np.empty(len(self.ids), dtype=np.float32)
+            for start in range(0, len(self.ids), self.chunk_size):
+                chunk = np.asarray(self.embeddings[start:start + self.chunk_size], dtype=np.float32)
+                dots[start:start + len(chunk)] = chunk @ query
+            sq_norms = np.asarray(self.sq_norms)
+        else:
+            dots = np.asarray(self.embeddings[rows], dtype=np.float32) @ query
+            sq_norms = np.asarray(self.sq_norms[rows])
+        return sq_norms + float(query @ query) - 2 * dots
+
+    def _approximate_distances(self, query: np.ndarray, rows: np.ndarray) -> np.ndarray:
+        """Distances computed from the quantized codes, in chunks to bound temporaries"""
+        distances = np.empty(len(rows), dtype=np.float32)
+        for start in range(0, len(rows), self.chunk_size):
+            chunk = rows[start:start + self.chunk_size]
+            distances[start:start + len(chunk)] = self.quantizer.distances(query, chunk, self.sq_norms[chunk])
+        return distances
+
+    def memory_usage(self) -> Dict[str, int]:
+        """Bytes that must stay resident to scan the store, against a float32 matrix"""
+        rows, dim = self.embeddings.shape
+        scanned = self.quantizer.nbytes if self.quantizer is not None else self.embeddings.nbytes
+        return {"float32_bytes": rows * dim * 4, "scan_bytes": int(scanned)}
+
+    def query(self, query_embeddings, n_results=10, where=None, include=None):
+        include = include or ["metadatas", "documents", "distances"]
+        mask = self._mask(where)
+        result = {"ids": [], "metadatas": [], "documents": [], "distances": [], "embeddings": []}
+
+        for embedding in query_embeddings:
+            query = np.asarray(embedding, dtype=np.float32)
+            rows = self._candidates(query, mask)
+            if self.quantizer is not None:
+                if rows is None:
+                    rows = np.arange(len(self.ids))
+                # Shortlist on the codes, then re-score the shortlist at full precision
+                shortlist = n_results * self.rescore_factor
+                if len(rows) > shortlist:
+                    approximate = self._approximate_distances(query, rows)
+                    rows = np.sort(rows[np.argpartition(approximate, shortlist - 1)[:shortlist]])
+            distances = self._distances(query, rows)
+            if rows is None:
+                rows = np.arange(len(self.ids))
+
+            k = min(n_results, len(rows))
+            if k == 0:
+                top = np.array([], dtype=np.int64)
+            else:
+                top = np.argpartition(distances, k - 1)[:k]
+                top = top[np.argsort(distances[top])]
+
+            self._append(result, rows[top], include, distances[top])
+
+        return {key: value for key, value in result.items() if key == "ids" or key in include}
+
+    def get(self, ids=None, where=None, include=None, limit=None, offset=0):
+        include = include or ["metadatas", "documents"]
+        if ids is not None:
+            index = self._row_index()
+            rows = np.array([index[i] for i in ids if i in index], dtype=np.int64)
+        else:
+            rows = np.arange(len(self.ids))
+
+        mask = self._mask(where)
+        if mask is not None:
+            rows = rows[mask[rows]]
+        end = None if limit is None else offset + limit
+        rows = rows[offset:end]
+
+        result = {"ids": [], "metadatas": [], "documents": [], "distances": [], "embeddings": []}
+        self._append(result, rows, include)
+        return {key: value[0] for key, value in result.items() if key == "ids" or key in include}
+
+    def _append(self, result: Dict, rows: np.ndarray, include: List[str], distances: np.ndarray = None):
+        result["ids"].append([self.ids[i] for i in rows])
+        if "metadatas" in include:
+            result["metadatas"].append([self._metadata(i) for i in rows])
+        if "documents" in include:
+            result["documents"].append([self.documents[i] for i in rows])
+        if "distances" in include and distances is not None:
+            result["distances"].append(distances.tolist())
+        if "embeddings" in include:
+            result["embeddings"].append(np.asarray(self.embeddings[rows], dtype=np.float32).tolist())
+
+    def _metadata(self, i: int) -> Dict:
+        metadata = {name: column[i] for name, column in self.columns.items()}
+        metadata["published_ts"] = int(self.published_ts[i])
+        return metadata
+
+def kmeans(vectors: np.ndarray, k: int, iterations: int = 10, seed: int = 42) -> np.ndarray:
+    """Plain Lloyd's k-means, enough to train an IVF coarse quantizer"""
+    rng = np.random.default_rng(seed)
+    centroids = vectors[rng.choice(len(vectors), size=k, replace=False)].copy()
+    for _ in range(iterations):
+        assignment = np.argmax(vectors @ centroids.T, axis=1)
+        for c in range(k):
+            members = vectors[assignment == c]
+            centroids[c] = members.mean(axis=0) if len(members) else vectors[rng.integers(len(vectors))]
+        centroids /= np.maximum(np.linalg.norm(centroids, axis=1, keepdims=True), 1e-12)
+    return centroids
+
+def build_numpy_store(source: VectorStore, path: str, nlist: int = None, page_size: int = 5000,
+                      quantization: str = None, pq_subspaces: int = None):
+    """Export a store (normally Chroma) into the NumPy store layout, training IVF lists for large corpora"""
+    os.makedirs(path, exist_ok=True)
+
+    ids, documents, embeddings = [], [], []
+    columns = {name: [] for name in STRING_COLUMNS}
+    published_ts = []
+    category_rows = []
+
+    offset = 0
+    while True:
+        page = source.get(include=["embeddings", "metadatas", "documents"], limit=page_size, offset=offset)
+        if not page["ids"]:
+            break
+        for paper_id, metadata, document, embedding in zip(
+            page["ids"], page["metadatas"], page["documents"], page["embeddings"]
+        ):
+            ids.append(paper_id)
+            documents.append(document)
+            embeddings.append(np.asarray(embedding, dtype=np.float32))
+            for name in STRING_COLUMNS:
+                columns[name].append(str(metadata.get(name, "")))
+            published_ts.append(int(metadata.get("published_ts", 0)))
+            category_rows.append([key for key, value in metadata.items() if key.startswith("cat_") and value is True])
+        offset += len(page["ids"])
+
+    matrix = np.vstack(embeddings) if embeddings else np.zeros((0, 0), dtype=np.float32)
+    np.save(os.path.join(path, "embeddings.f16.npy"), matrix.astype(np.float16))
+    # Norms of the stored float16 values, so distances match what queries see
+    np.save(os.path.join(path, "sq_norms.npy"), (matrix.astype(np.float16).astype(np.float32) ** 2).sum(axis=1))
+    np.save(os.path.join(path, "published_ts.npy"), np.asarray(published_ts, dtype=np.int64))
+
+    category_keys = sorted({key for row in category_rows for key in row})
+    key_index = {key: i for i, key in enumerate(category_keys)}
+    flags = np.zeros((len(ids), len(category_keys)), dtype=bool)
+    for i, row in enumerate(category_rows):
+        flags[i, [key_index[key] for key in row]] = True
+    np.save(os.path.join(path, "category_flags.npy"), flags)
+    with open(os.path.join(path, "category_keys.json"), "w") as f:
+        json.dump(category_keys, f)
+
+    StringColumn.write(path, "ids", ids)
+    StringColumn.write(path, "documents", documents)
+    for name, values in columns.items():
+        StringColumn.write(path, name, values)
+
+    # IVF pays off only once a full scan gets expensive
+    if nlist is None:
+        nlist = int(np.sqrt(len(ids))) if len(ids) >= 20000 else 0
+    for stale in ("ivf_centroids.npy", "ivf_offsets.npy", "ivf_members.npy"):
+        if os.path.exists(os.path.join(path, stale)):
+            os.remove(os.path.join(path, stale))
+    if nlist:
+        units = matrix / np.maximum(np.linalg.norm(matrix, axis=1, keepdims=True), 1e-12)
+        rng = np.random.default_rng(42)
+        sample = units[rng.choice(len(units), size=min(len(units), nlist * 256), replace=False)]
+        centroids = kmeans(sample, nlist)
+        assignment = np.concatenate([
+            np.argmax(units[start:start + 65536] @ centroids.T, axis=1)
+            for start in range(0, len(units), 65536)
+        ])
+        members = np.argsort(assignment, kind="stable")
+        offsets = np.zeros(nlist + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum(np.bincount(assignment, minlength=nlist))
+        np.save(os.path.join(path, "ivf_centroids.npy"), centroids.astype(np.float32))
+        np.save(os.path.join(path, "ivf_offsets.npy"), offsets)
+        np.save(os.path.join(path, "ivf_members.npy"), members.astype(np.int64))
+
+    # Optional compact codes (int8 or PQ) for the scan
+    for stale in QUANTIZER_FILES:
+        if os.path.exists(os.path.join(path, stale)):
+            os.remove(os.path.join(path, stale))
+    if quantization and len(ids):
+        train_quantizer(matrix, quantization, pq_subspaces).save(path)
+
+    logger.info(f"Built NumPy vector store at {path}: {len(ids)} papers, {nlist} IVF lists, "
+                f"{quantization or 'no'} quantization")
+    return len(ids)
+
+def open_vector_store(config: Dict) -> VectorStore:
+    """Open the configured vector store backend (agent.vector_store: chroma | numpy)"""
+    backend = config['agent'].get('vector_store', 'chroma')
+    if backend == 'numpy':
+        path = config['paths'].get('numpy_store', "data/vector_db/numpy_store")
+        if os.path.exists(os.path.join(path, "embeddings.f16.npy")):
+            return NumpyVectorStore(
+                path,
+                nprobe=config['agent'].get('ivf_nprobe', 16),
+                rescore_factor=config['agent'].get('rescore_factor', 8)
+            )
+        logger.warning(f"NumPy vector store not found at {path}. Falling back to Chroma.")
+    return ChromaVectorStore(config['paths']['vector_db'])
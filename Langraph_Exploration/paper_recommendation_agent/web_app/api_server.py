@@ -0,0 +1,188 @@
+import argparse
+import asyncio
+import json
+import logging
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Awaitable, Callable, Dict
+
+from aiohttp import web
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from main import NO_RESULTS, PaperRecommendationAgent
+from utils.helpers import load_config
+from utils.metrics import metrics
+from utils.score_cache import normalize_interests
+
+logger = logging.getLogger(__name__)
+
+class SingleFlight:
+    """Runs one call per key at a time; concurrent callers with the same key share its result"""
+
+    def __init__(self):
+        self.in_flight: Dict[str, asyncio.Future] = {}
+        self.coalesced = 0
+
+    async def do(self, key: str, call: Callable[[], Awaitable[Any]]) -> Any:
+        future = self.in_flight.get(key)
+        if future is not None:
+            self.coalesced += 1
+            return await asyncio.shield(future)
+
+        future = asyncio.ensure_future(call())
+        self.in_flight[key] = future
+        try:
+            return await asyncio.shield(future)
+        finally:
+            # The next identical request after this one completes runs fresh
+            if self.in_flight.get(key) is future:
+                del self.in_flight[key]
+
+class RecommendationService:
+    """
+    asyncio HTTP front end for PaperRecommendationAgent.
+
+    Pipeline stages are blocking (model inference, vector search, LLM calls),
+    so they run on a bounded thread pool; requests beyond `max_pending` are
+    rejected with 503 instead of queueing without limit. Identical concurrent
+    requests are coalesced into one pipeline run.
+    """
+
+    def __init__(self, agent: PaperRecommendationAgent, workers: int = None, max_pending: int = None):
+        self.agent = agent
+        self.workers = workers or os.cpu_count() or 4
+        self.executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="pipeline")
+        self.max_pending = max_pending or self.workers * 8
+        self.pending = 0
+        self.single_flight = SingleFlight()
+        self.started = time.time()
+        self.requests = 0
+        self.rejected = 0
+
+    def create_app(self) -> web.Application:
+        app = web.Application()
+        app.add_routes([
+            web.post("/recommend", self.handle_recommend),
+            web.post("/search", self.handle_search),
+            web.post("/score", self.handle_score),
+            web.get("/healthz", self.handle_health),
+            web.get("/readyz", self.handle_ready),
+            web.get("/metrics", self.handle_metrics),
+            web.get("/metrics.json", self.handle_metrics_json),
+        ])
+        app.on_shutdown.append(self._shutdown)
+        return app
+
+    async def _shutdown(self, app: web.Application):
+        self.executor.shutdown(wait=False)
+
+    async def _run(self, key: str, func: Callable, *args) -> Any:
+        """Run a blocking call on the pool, coalesced with identical in-flight calls"""
+        async def call():
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self.executor, func, *args)
+
+        if key not in self.single_flight.in_flight and self.pending >= self.max_pending:
+            self.rejected += 1
+            raise web.HTTPServiceUnavailable(text=json.dumps({"error": "Server overloaded"}),
+                                             content_type="application/json")
+        self.pending += 1
+        try:
+            return await self.single_flight.do(key, call)
+        finally:
+            self.pending -= 1
+
+    async def _read_query(self, request: web.Request) -> Dict:
+        self.requests += 1
+        try:
+            body = await request.json()
+        except Exception:
+            raise web.HTTPBadRequest(text=json.dumps({"error": "Body must be JSON"}), content_type="application/json")
+        query = body.get("query", "") if isinstance(body, dict) else ""
+        if not isinstance(query, str) or not query.strip():
+            raise web.HTTPBadRequest(text=json.dumps({"error": "Missing 'query'"}), content_type="application/json")
+        return body
+
+    async def handle_recommend(self, request: web.Request) -> web.Response:
+        body = await self._read_query(request)
+        key = "recommend:" + normalize_interests(body["query"])
+        include_metrics = body.get("include_metrics")
+        if include_metrics:
+            # Per-request spans can't be shared between coalesced callers
+            key += ":metrics:" + str(id(request))
+        result = await self._run(key, self.agent.recommend, body["query"], False, include_metrics)
+        status = 500 if result.get("error", NO_RESULTS) != NO_RESULTS else 200
+        return _json_response(result, status)
+
+    async def handle_search(self, request: web.Request) -> web.Response:
+        body = await self._read_query(request)
+        plan = body.get("plan")
+        key = "search:" + normalize_interests(body["query"]) + ":" + json.dumps(plan, sort_keys=True)
+        result = await self._run(key, self._search, body["query"], plan)
+        return _json_response(result)
+
+    async def handle_score(self, request: web.Request) -> web.Response:
+        body = await self._read_query(request)
+        papers = body.get("papers")
+        if not isinstance(papers, list) or not all(
+            isinstance(p, dict) and {"id", "title", "abstract"} <= p.keys() for p in papers
+        ):
+            raise web.HTTPBadRequest(text=json.dumps({"error": "'papers' must be a list of {id, title, abstract}"}),
+                                     content_type="application/json")
+        key = "score:" + normalize_interests(body["query"]) + ":" + json.dumps(papers, sort_keys=True)
+        analyses = await self._run(key, self.agent.analyzer.analyze_batch, body["query"], papers)
+        return _json_response({"query": body["query"], "analyses": analyses})
+
+    def _search(self, query: str, plan: Dict = None) -> Dict:
+        """Plan (unless a plan is given) and retrieve candidates, without scoring"""
+        plan = plan or self.agent.planner.plan(query)
+        papers = self.agent.searcher.search(plan, query)
+        return {"query": query, "plan": plan, "papers": papers}
+
+    async def handle_health(self, request: web.Request) -> web.Response:
+        return _json_response({
+            "status": "ok",
+            "uptime_seconds": time.time() - self.started,
+            "requests": self.requests,
+            "coalesced": self.single_flight.coalesced,
+            "rejected": self.rejected,
+            "pending": self.pending,
+            "workers": self.workers,
+            # Circuit state and latency per LLM provider, once the client exists
+            "llm": self.agent.planner.client.status() if self.agent.planner.client.ok else {}
+        })
+
+    async def handle_metrics(self, request: web.Request) -> web.Response:
+        return web.Response(text=metrics.prometheus_text(), content_type="text/plain")
+
+    async def handle_metrics_json(self, request: web.Request) -> web.Response:
+        return _json_response(metrics.to_dict())
+
+    async def handle_ready(self, request: web.Request) -> web.Response:
+        # Checked live, so a component that loads on a later retry makes the server ready
+        components = self.agent.readiness()
+        ready = all(components.values())
+        return _json_response({"ready": ready, "components": components}, 200 if ready else 503)
+
+def _json_response(data: Any, status: int = 200) -> web.Response:
+    # default=str covers any stray non-JSON value (e.g. numpy scalars) in paper metadata
+    return web.Response(text=json.dumps(data, default=str), status=status, content_type="application/json")
+
+if __name__ == "__main__":
+    config = load_config()
+    parser = argparse.ArgumentParser(description="Serve paper recommendations over HTTP")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--workers", type=int, default=config['agent'].get('service_workers'),
+                        help="Threads for blocking pipeline stages (default: CPU count)")
+    parser.add_argument("--max-pending", type=int, default=config['agent'].get('service_max_pending'),
+                        help="In-flight requests before returning 503 (default: 8 per worker)")
+    args = parser.parse_args()
+
+    # Warm up in the background; /readyz reports 503 until models are loaded
+    agent = PaperRecommendationAgent(warm_up=True)
+    service = RecommendationService(agent, workers=args.workers, max_pending=args.max_pending)
+    web.run_app(service.create_app(), host=args.host, port=args.port)
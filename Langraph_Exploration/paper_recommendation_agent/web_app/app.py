@@ -56,44 +56,76 @@ def main():
                 st.rerun()
     
     if st.button("Find Relevant Papers", type="primary"):
-        with st.spinner("Searching for relevant papers..."):
-            result = agent.recommend(user_query, save_output=False)
+        status = st.status("Planning search...", expanded=False)
+        plan_area = st.empty()
+        summary_area = st.empty()
+        progress_area = st.empty()
+        st.header("Recommended Papers")
+        results_area = st.empty()
         
-        if "error" in result:
-            st.error(f"Error: {result['error']}")
-        else:
-            # Display results
-            st.success(f"Found {result['total_candidates']} candidate papers")
+        analyses = []
+        for event in agent.recommend_stream(user_query):
+            if event["type"] == "plan":
+                status.update(label="Searching for papers...")
+                with plan_area.expander("Search Plan", expanded=False):
+                    st.json(event["plan"])
             
-            # Show plan
-            with st.expander("Search Plan", expanded=False):
-                st.json(result['plan'])
+            elif event["type"] == "candidates":
+                status.update(label="Scoring paper relevance...")
+                summary_area.info(f"Retrieved {len(event['papers'])} candidate papers")
+                # Show search hits right away, scored ones replace them as they arrive
+                analyses = [
+                    {"paper": paper, "relevance_score": paper.get("search_score", 0.0), "justification": "Scoring..."}
+                    for paper in event["papers"]
+                ]
+                render_recommendations(results_area, analyses)
             
-            # Display recommendations
-            st.header("Recommended Papers")
+            elif event["type"] == "scores":
+                progress_area.progress(event["scored"] / event["total"], text=f"Scored {event['scored']}/{event['total']}")
+                scored = {analysis["paper"]["id"]: analysis for analysis in event["analyses"]}
+                analyses = [scored.get(a["paper"]["id"], a) for a in analyses]
+                render_recommendations(results_area, analyses)
             
-            for i, rec in enumerate(result['recommendations']):
-                paper = rec['paper']
+            elif event["type"] == "justification":
+                status.update(label="Writing justifications...")
+                render_recommendations(results_area, analyses)
+            
+            elif event["type"] == "complete":
+                result = event["result"]
+                status.update(label="Done", state="complete")
+                progress_area.empty()
+                summary_area.success(f"Found {result['total_candidates']} candidate papers")
+                render_recommendations(results_area, result['recommendations'])
+            
+            elif event["type"] == "error":
+                status.update(label="Failed", state="error")
+                st.error(f"Error: {event['error']}")
+
+def render_recommendations(area, analyses):
+    """Render recommendation cards into a placeholder, replacing its previous contents"""
+    with area.container():
+        for i, rec in enumerate(sorted(analyses, key=lambda a: a['relevance_score'], reverse=True)):
+            paper = rec['paper']
+            
+            with st.container():
+                col1, col2 = st.columns([4, 1])
                 
-                with st.container():
-                    col1, col2 = st.columns([4, 1])
+                with col1:
+                    st.subheader(f"{i+1}. {paper['title']}")
+                    st.markdown(f"**Relevance Score:** `{rec['relevance_score']:.3f}`")
+                    st.markdown(f"**Categories:** {', '.join(paper['categories'])}")
+                    st.markdown(f"**Published:** {paper['published']}")
                     
-                    with col1:
-                        st.subheader(f"{i+1}. {paper['title']}")
-                        st.markdown(f"**Relevance Score:** `{rec['relevance_score']:.3f}`")
-                        st.markdown(f"**Categories:** {', '.join(paper['categories'])}")
-                        st.markdown(f"**Published:** {paper['published']}")
-                        
-                        st.markdown(f"**Why relevant:** {rec['justification']}")
-                        
-                        with st.expander("Abstract"):
-                            st.write(paper['abstract'])
+                    st.markdown(f"**Why relevant:** {rec.get('detailed_justification', rec['justification'])}")
                     
-                    with col2:
-                        if paper.get('pdf_url'):
-                            st.markdown(f"[📄 PDF]({paper['pdf_url']})")
-                    
-                    st.divider()
+                    with st.expander("Abstract"):
+                        st.write(paper['abstract'])
+                
+                with col2:
+                    if paper.get('pdf_url'):
+                        st.markdown(f"[📄 PDF]({paper['pdf_url']})")
+                
+                st.divider()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file